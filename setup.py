@@ -38,5 +38,8 @@ setup(
     # $ pip install -e .[postgres,test]
     extras_require={
         "postgres": ["psycopg2>=2.6.2"],
+        "aio-postgres": ["psycopg>=3.1"],
+        # concurrent.futures backport for dbquery.shard
+        ":python_version < '3.2'": ["futures>=3.0.5"],
     },
 )
@@ -1,5 +1,12 @@
 # -*- coding: utf-8 -*-
 from .db import DBContextManagerError
+from .pool import PoolTimeoutError
 from .query import ManipulationCheckError
-from .query import to_dict_formatter
+from .replica import ReplicatedDB
+from .retry import CircuitOpenError
+from .row_formatter import DictFormatter
+from .row_formatter import NamedTupleFormatter
+from .row_formatter import RecordFormatter
+from .row_formatter import to_dict_formatter
+from .sqlite import PooledSQLiteDB
 from .sqlite import SQLiteDB
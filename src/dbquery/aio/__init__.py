@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+""" asyncio counterparts of the DB and Query classes.
+
+Needs Python 3.7 or newer. AsyncPostgresDB (in dbquery.aio.postgres) requires
+psycopg version 3.
+"""
+from .db import AsyncDB
+from .sqlite import AsyncSQLiteDB
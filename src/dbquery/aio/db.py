@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+from asyncio import Event
+from asyncio import current_task
+from functools import wraps
+from logging import getLogger
+
+from ..db import DBContextManagerError
+from ..db import _DBRollbackException
+from ..log_msg import LogMsg
+from .query import AsyncManipulation
+from .query import AsyncQuery
+from .query import AsyncSelect
+from .query import AsyncSelectIterator
+from .query import AsyncSelectOne
+
+
+_LOG = getLogger(__name__)
+
+
+class AsyncDB(object):
+    """ asyncio counterpart of dbquery.db.DB.
+
+    Used by all the async Query classes to execute SQL. All functions talking
+    to the database are coroutines, transactions use "async with db:".
+
+    A transaction belongs to the task which started it. While it is in
+    progress the queries and transactions of other tasks wait until it ended,
+    so they do not become part of it.
+
+    Inherit and implement to provide access to your database.
+    """
+
+    OperationalError = Exception
+
+    def __init__(self, retry=0):
+        """
+        :param retry: How many attempts to connect to make before giving up.
+        """
+        self._retry = retry
+        self._orig_retry = None  # saves retry value during a transaction
+        self._transaction_level = 0  # counts nested contexts
+        self._transaction_task = None  # task owning the transaction
+        self._transaction_ended = None  # Event, set when it ended
+
+    def Query(self, sql):
+        return AsyncQuery(self, sql)
+
+    def Select(self, sql, row_formatter=None):
+        return AsyncSelect(self, sql, row_formatter)
+
+    def SelectOne(self, sql, row_formatter=None):
+        return AsyncSelectOne(self, sql, row_formatter)
+
+    def SelectIterator(  # pylint: disable=too-many-arguments
+            self, sql, callback, cb_args=None, arraysize=None,
+            row_formatter=None):
+        return AsyncSelectIterator(
+            self, sql, callback, cb_args, arraysize, row_formatter)
+
+    def Manipulation(self, sql, rowcount=None):
+        return AsyncManipulation(self, sql, rowcount)
+
+    @property
+    def retry(self):
+        return self._retry
+
+    async def execute(self, sql, params, produce_return):
+        """ Open or reuse a connection automatically, create a cursor and
+        execute the query then await produce_return to get a value to return.
+
+        The cursor given to produce_return has coroutine fetch functions.
+
+        :type sql: str
+        :type params: [] or {}
+        :type produce_return: None or coroutine function(cursor) -> response
+        :return: Result of the produce_return coroutine.
+        """
+        raise NotImplementedError()
+
+    async def close(self):
+        """ Close the connection so that another call to execute will
+        trigger opening or reusing a new connection.
+        """
+        raise NotImplementedError()
+
+    async def show(self, sql, params):
+        """ If possible use the drivers mogrify function or equivalent to get
+        the SQL as the server would have build it using all the parameters.
+
+        :rtype: str
+        """
+        raise NotImplementedError()
+
+    async def wait_for_transaction(self):
+        """ Wait until no other task has a transaction in progress.
+        """
+        task = current_task()
+        while self._transaction_task not in (None, task):
+            await self._transaction_ended.wait()
+
+    async def _begin(self):
+        raise NotImplementedError()
+
+    async def _commit(self):
+        raise NotImplementedError()
+
+    async def _rollback(self):
+        raise NotImplementedError()
+
+    async def __aenter__(self):
+        # On first context level start the DB transaction.
+        await self.wait_for_transaction()
+        if self._transaction_level == 0:
+            self._transaction_task = current_task()
+            self._transaction_ended = Event()
+            try:
+                await self._begin()
+            except Exception:
+                self._end_transaction()
+                raise
+            # A transaction can not be continued on a new connection, so do
+            # not retry while it is in progress (see DB.__enter__).
+            self._orig_retry = self._retry
+            self._retry = 0
+            _LOG.debug(LogMsg("BEGIN on {}.", self))
+
+        # Count the new context.
+        self._transaction_level += 1
+
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        # Decrease the context level.
+        self._transaction_level -= 1
+
+        # Check for a wrong __aexit__ call.
+        if self._transaction_level < 0:
+            level = self._transaction_level  # needed for exception
+            self._transaction_level = 0
+            raise DBContextManagerError(
+                "Illegal transaction level reached: {}.".format(level))
+
+        # Leaving the context entirely, commit the DB transaction.
+        if self._transaction_level == 0:
+            try:
+                # Got an error? Roll back the transaction!
+                if exc_value:
+                    await self._rollback()
+                    if not isinstance(exc_value, _DBRollbackException):
+                        _LOG.debug(LogMsg("ROLLBACK on {}.", self))
+                else:
+                    await self._commit()
+                    _LOG.debug(LogMsg("COMMIT on {}.", self))
+            finally:
+                # Restore retry value.
+                self._retry = self._orig_retry
+                self._orig_retry = None
+                self._end_transaction()
+
+        # Same as in DB.__exit__: swallow only the abort marker, and only when
+        # the outermost context was left.
+        return (not exc_value or
+                (self._transaction_level == 0 and
+                 isinstance(exc_value, _DBRollbackException)))
+
+    def _end_transaction(self):
+        """ Let the other tasks continue.
+        """
+        self._transaction_task = None
+        self._transaction_ended.set()
+
+    def abort_transaction(self):
+        # No transaction in progress (for this task)!
+        if (self._transaction_level <= 0 or
+                self._transaction_task is not current_task()):
+            raise DBContextManagerError("No Transaction in progress.")
+        # If there is a transaction in progress raise the abort marker to cause
+        # a roll back.
+        raise _DBRollbackException("Aborting transaction...")
+
+    @staticmethod
+    def connected(f):
+
+        @wraps(f)
+        async def new_f(self, *args, **kwds):
+            # pylint: disable=protected-access
+            if self._connection is None:
+                await self._connect()
+            return await f(self, *args, **kwds)
+
+        return new_f
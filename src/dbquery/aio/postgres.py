@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from psycopg import AsyncClientCursor
+from psycopg import AsyncConnection
+from psycopg import OperationalError as PGOperationalError
+
+from .db import AsyncDB
+
+
+class AsyncPostgresDB(AsyncDB):
+    """ asyncio PostgreSQL DB class using a single psycopg (version 3)
+    connection.
+
+    Use either a 'dsn' connection string or keyword parameters to define the
+    connection, see dbquery.postgres.PostgresDB. Queries use the same
+    parameter style as with psycopg2.
+    """
+
+    OperationalError = PGOperationalError
+
+    def __init__(self, dsn=None, retry=0, **kwds):
+        super(AsyncPostgresDB, self).__init__(retry=retry)
+        self._dsn = dsn or ""
+        self._kwds = kwds
+        self._connection = None
+
+    async def _connect(self):
+        if self._connection is not None:
+            raise RuntimeError("Connection still exists.")
+        self._connection = await AsyncConnection.connect(
+            self._dsn, autocommit=True, **self._kwds)
+
+    async def close(self):
+        if self._connection is not None:
+            try:
+                await self._connection.close()
+            except Exception:
+                pass  # ignore
+            self._connection = None
+
+    @AsyncDB.connected
+    async def execute(self, sql, params, produce_return=None):
+        # A client side cursor merges the parameters into the SQL like
+        # psycopg2 does, instead of sending them separately (which only works
+        # where PostgreSQL accepts placeholders).
+        async with AsyncClientCursor(self._connection) as cursor:
+            await cursor.execute(sql, params)
+            if produce_return:
+                return await produce_return(cursor)
+
+    @AsyncDB.connected
+    async def show(self, sql, params):
+        return AsyncClientCursor(self._connection).mogrify(sql, params)
+
+    @AsyncDB.connected
+    async def _begin(self):
+        await self._connection.set_autocommit(False)
+
+    async def _commit(self):
+        if self._connection is None:
+            raise RuntimeError("Connection lost, can not commit!")
+        await self._connection.commit()
+        await self._connection.set_autocommit(True)
+
+    async def _rollback(self):
+        if self._connection is None:
+            raise RuntimeError("Connection lost, can not roll back!")
+        await self._connection.rollback()
+        await self._connection.set_autocommit(True)
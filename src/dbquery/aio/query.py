@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+""" asyncio Query classes.
+
+Same as the classes in dbquery.query, but calling a query returns a coroutine.
+"""
+from inspect import isawaitable
+from logging import getLogger
+
+from ..log_msg import LogMsg
+from ..query import ManipulationCheckError
+from ..row_formatter import prepare_row_formatter
+
+
+_LOG = getLogger(__name__)
+
+
+class AsyncQuery(object):
+    """ Base class for other async SQL query classes.
+    """
+
+    def __init__(self, db, sql):
+        """
+        :param db: The DB class to communicate with the database.
+        :type db: dbquery.aio.db.AsyncDB
+        :param sql: The SQL to execute.
+        :type sql: str
+        """
+        self._db = db
+        self._sql = sql  # save the SQL for later execution
+        self.OperationalError = db.OperationalError
+
+    async def _produce_return(  # pylint: disable=no-self-use,unused-argument
+            self, cursor):
+        """ Gets awaited with the cursor on which the query was executed.
+
+        Its return value will be the return value for the __call__ coroutine.
+
+        :type cursor: cursor with coroutine fetch functions
+        :return: Return value for __call__
+        """
+        return None
+
+    async def __call__(self, *args, **kwds):
+        """ Execute the SQL with given parameters, retrying like
+        dbquery.query.Query does.
+
+        Can only use either positional arguments or keyword arguments but not
+        both at the same time. Positional arguments win.
+
+        :rtype: Result of the _produce_return call.
+        """
+        params = args
+        if not params:
+            params = kwds  # pylint: disable=redefined-variable-type
+
+        await self._db.wait_for_transaction()
+        retry_count = 1
+        while 1:  # either return or raise
+            try:
+                return await self._db.execute(
+                    self._sql, params, self._produce_return)
+            except self._db.OperationalError:
+                if retry_count < self._db.retry:
+                    _LOG.warning(
+                        LogMsg(
+                            "DB connection {} failed (retry {}).",
+                            self._db, retry_count),
+                        exc_info=1)
+                    retry_count += 1
+                    await self._db.close()
+                else:
+                    raise
+
+    async def show(self, *args, **kwds):
+        """ Show how the SQL looks like when executed by the DB.
+
+        :rtype: str
+        """
+        arg = args
+        if not arg:
+            arg = kwds  # pylint: disable=redefined-variable-type
+        return await self._db.show(self._sql, arg)
+
+
+class AsyncSelect(AsyncQuery):
+    """ Performs a fetchall and returns its row list.
+
+    If a row formatter is provided each row will be passed through it first.
+    """
+
+    def __init__(self, db, sql, row_formatter):
+        """
+        :param row_formatter: function that 'formats' a row or an object with
+            a prepare function, see dbquery.row_formatter.
+        :type row_formatter: function(tuple, cursor) -> tuple
+        """
+        super(AsyncSelect, self).__init__(db, sql)
+        self._row_formatter = row_formatter
+
+    async def _produce_return(self, cursor):
+        results = await cursor.fetchall()
+
+        if self._row_formatter is not None:
+            format_row = prepare_row_formatter(self._row_formatter, cursor)
+            return [format_row(r) for r in results]
+
+        return results
+
+
+class AsyncSelectOne(AsyncSelect):
+    """ Returns the single row or the single column if the row contains only
+    one column.
+
+    If the query returns something other than one row the call returns None.
+    """
+
+    async def _produce_return(self, cursor):
+        results = await cursor.fetchmany(2)
+        if len(results) != 1:
+            return None
+
+        row = results[0]
+        if self._row_formatter is not None:
+            row = prepare_row_formatter(self._row_formatter, cursor)(row)
+        elif len(row) == 1:
+            row = row[0]
+
+        return row
+
+
+class AsyncSelectIterator(AsyncSelect):
+    """ Calls the callback once with an async generator, which yields the
+    rows, fetched in blocks of arraysize rows:
+
+        async def callback(row_generator):
+            async for row in row_generator:
+                ...
+
+    The callback can be a normal function or a coroutine function.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self, db, sql, callback, cb_args=None, arraysize=None,
+            row_formatter=None):
+        """
+        :param callback: function that handles the row generator.
+        :type callback: function(row_generator, cb_args),
+        :param cb_args: Extra parameters for the callback.
+        :type cb_args: [arg1, arg2, ...]
+        :param arraysize: Max number of rows per rowset fetched internally from
+            db.
+        :type arraysize: integer
+        """
+        super(AsyncSelectIterator, self).__init__(db, sql, row_formatter)
+
+        if arraysize is not None and arraysize > 0:
+            self._arraysize = arraysize
+        else:
+            self._arraysize = 1
+
+        self.callback = callback
+        self.cb_args = cb_args or []
+
+    async def _row_generator(self, cursor):
+        rowset = await cursor.fetchmany(self._arraysize)
+        format_row = None
+        if rowset and self._row_formatter is not None:
+            format_row = prepare_row_formatter(self._row_formatter, cursor)
+        while rowset:
+            if format_row is not None:
+                rowset = map(format_row, rowset)
+            for row in rowset:
+                yield row
+            rowset = await cursor.fetchmany(self._arraysize)
+
+    async def _produce_return(self, cursor):
+        result = self.callback(self._row_generator(cursor), *self.cb_args)
+        if isawaitable(result):
+            await result
+        return None
+
+
+class AsyncManipulation(AsyncQuery):
+    """ Executes all kinds of queries, other than select, returns the row
+    count.
+
+    Raises ManipulationCheckError if an expected rowcount was given and does
+    not match.
+    """
+
+    def __init__(self, db, sql, rowcount):
+        """
+        :param rowcount: the expected row count for the query or None, if no
+            check should be performed
+        :type rowcount: int
+        """
+        super(AsyncManipulation, self).__init__(db, sql)
+        self._rowcount = rowcount
+
+    async def _produce_return(self, cursor):
+        rowcount = cursor.rowcount
+
+        if self._rowcount is not None and self._rowcount != rowcount:
+            raise ManipulationCheckError(
+                "Count was {}, expected {}.".format(rowcount, self._rowcount))
+
+        return rowcount
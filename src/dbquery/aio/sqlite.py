@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+from asyncio import get_running_loop
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from sqlite3 import OperationalError as SQL3OperationalError
+from sqlite3 import connect
+
+from ..sqlite import _ISOLATION_LEVELS
+from ..sqlite import _pragma_statements
+from .db import AsyncDB
+
+
+class _AsyncCursor(object):
+    """ Wraps a sqlite3 cursor, running the fetch functions in the DB thread.
+    """
+
+    def __init__(self, cursor, run):
+        self._cursor = cursor
+        self._run = run
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    async def fetchone(self):
+        return await self._run(self._cursor.fetchone)
+
+    async def fetchmany(self, size):
+        return await self._run(self._cursor.fetchmany, size)
+
+    async def fetchall(self):
+        return await self._run(self._cursor.fetchall)
+
+    async def close(self):
+        await self._run(self._cursor.close)
+
+
+class AsyncSQLiteDB(AsyncDB):
+    """ asyncio SQLite DB class.
+
+    sqlite3 has no asynchronous interface, so all calls are run in a single
+    worker thread, one after the other, keeping the event loop free.
+
+    Takes the same parameters as dbquery.sqlite.SQLiteDB.
+    """
+
+    OperationalError = SQL3OperationalError
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self, database, retry=0, isolation_level="DEFERRED", pragmas=None,
+            **kwds):
+        super(AsyncSQLiteDB, self).__init__(retry=retry)
+        if isolation_level not in _ISOLATION_LEVELS:
+            raise ValueError(
+                "Unknown isolation level: {}.".format(isolation_level))
+        self._database = database
+        self._isolation_level = isolation_level
+        self._pragmas = _pragma_statements(pragmas or ())
+        self._kwds = kwds
+        self._connection = None
+        # One thread, since a sqlite3 connection must stay in the thread that
+        # created it.
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def _run(self, function, *args):
+        """ Run function(*args) in the DB thread.
+
+        :rtype: asyncio.Future
+        """
+        return get_running_loop().run_in_executor(
+            self._executor, partial(function, *args))
+
+    def _new_connection(self):
+        connection = connect(self._database, **self._kwds)
+        try:
+            connection.isolation_level = None  # auto commit
+            for pragma in self._pragmas:
+                connection.execute(pragma).fetchall()  # some return a row
+        except Exception:
+            connection.close()
+            raise
+        return connection
+
+    async def _connect(self):
+        if self._connection is not None:
+            raise RuntimeError('Close connection first.')
+        self._connection = await self._run(self._new_connection)
+
+    async def close(self):
+        if self._connection is not None:
+            try:
+                await self._run(self._connection.close)
+            except Exception:
+                pass  # ignore
+            self._connection = None
+
+    @AsyncDB.connected
+    async def execute(self, sql, params, produce_return):
+        c = await self._run(self._connection.execute, sql, params)
+        return await produce_return(_AsyncCursor(c, self._run))
+
+    async def show(self, sql, params):
+        """ Like SQLiteDB.show, returns the SQL and the parameters as a string.
+        """
+        return '{} {}'.format(sql, params)
+
+    @AsyncDB.connected
+    async def _begin(self):
+        await self._run(
+            self._connection.execute,
+            "BEGIN {}".format(self._isolation_level))
+
+    async def _commit(self):
+        if self._connection is None:
+            raise RuntimeError("Connection lost, can not commit!")
+        await self._run(self._connection.execute, "COMMIT")
+
+    async def _rollback(self):
+        if self._connection is None:
+            raise RuntimeError("Connection lost, can not roll back!")
+        await self._run(self._connection.execute, "ROLLBACK")
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+""" Query result cache.
+"""
+from collections import OrderedDict
+from sys import getsizeof
+from threading import Event
+from threading import Lock
+
+from .instrument import monotonic
+
+# Python 2: str and unicode.
+try:
+    _STRING_TYPES = basestring  # pylint: disable=undefined-variable
+except NameError:
+    _STRING_TYPES = str
+
+
+def _size(value):
+    """ Estimate the memory used by a query result: a row, a list of rows or
+    a single value.
+    """
+    if isinstance(value, list):
+        return getsizeof(value) + sum(_size(row) for row in value)
+    if isinstance(value, dict):
+        return getsizeof(value) + sum(getsizeof(v) for v in value.values())
+    if isinstance(value, tuple):
+        return getsizeof(value) + sum(getsizeof(v) for v in value)
+    return getsizeof(value)
+
+
+def table_tags(tables):
+    """ Normalize the table names a query reads or writes.
+
+    :type tables: str or iterable of str or None
+    :rtype: frozenset
+    """
+    if not tables:
+        return frozenset()
+    if isinstance(tables, _STRING_TYPES):
+        tables = (tables, )
+    return frozenset(table.lower() for table in tables)
+
+
+class ResultCache(object):
+    """ Thread-safe cache for query results with a time to live per entry.
+
+    Keeps at most max_entries entries and, if max_bytes is set, results of up
+    to about max_bytes in total (estimated with sys.getsizeof). The least
+    recently used entries are evicted first.
+
+    Entries can be tagged with the tables their query reads, invalidate
+    removes all entries of the given tables.
+    """
+
+    def __init__(self, max_entries=1000, max_bytes=None, default_ttl=60):
+        """
+        :param max_entries: maximum number of cached results
+        :type max_entries: int
+        :param max_bytes: maximum (estimated) size of all cached results,
+            None for no limit
+        :type max_bytes: int
+        :param default_ttl: seconds a result is kept, if put does not set it
+        :type default_ttl: float
+        """
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._default_ttl = default_ttl
+        self._lock = Lock()
+        # key -> (expires, value, size, tags), in LRU order
+        self._entries = OrderedDict()
+        self._tags = {}  # table -> keys of the entries tagged with it
+        self._generations = {}  # table -> number of invalidations
+        self._clears = 0  # invalidates all tables
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def bytes(self):
+        """ The estimated size of all cached results.
+        """
+        return self._bytes
+
+    def get(self, key):
+        """
+        :return: if the key was found and the cached value
+        :rtype: (bool, value)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= monotonic():
+                if entry is not None:  # expired
+                    self._remove(key)
+                self.misses += 1
+                return False, None
+            self._entries[key] = self._entries.pop(key)  # most recently used
+            self.hits += 1
+            return True, entry[1]
+
+    def _remove(self, key):
+        """ Remove the entry of key, call with the lock held.
+        """
+        _, _, size, tags = self._entries.pop(key)
+        self._bytes -= size
+        for table in tags:
+            keys = self._tags[table]
+            keys.discard(key)
+            if not keys:
+                del self._tags[table]
+
+    def generation(self, tags):
+        """ Get the invalidation state of the tables, before reading the
+        value to put.
+        """
+        with self._lock:
+            return self._generation(tags)
+
+    def _generation(self, tags):
+        """ See generation, call with the lock held.
+        """
+        return (self._clears, ) + tuple(
+            self._generations.get(t, 0) for t in sorted(tags))
+
+    def put(  # pylint: disable=too-many-arguments
+            self, key, value, ttl=None, tags=frozenset(), generation=None):
+        """ Cache the value for ttl seconds (default_ttl if None).
+
+        :param tags: the (normalized) tables the value was read from, see
+            table_tags
+        :type tags: frozenset
+        :param generation: result of generation(tags) before the value was
+            read, if one of the tables got invalidated since then the value
+            might be outdated already and is not cached
+        """
+        if ttl is None:
+            ttl = self._default_ttl
+        size = 0
+        if self._max_bytes is not None:
+            size = _size(value)
+            if size > self._max_bytes:
+                return  # would evict everything else
+        with self._lock:
+            if (generation is not None and
+                    generation != self._generation(tags)):
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (monotonic() + ttl, value, size, tags)
+            self._bytes += size
+            for table in tags:
+                self._tags.setdefault(table, set()).add(key)
+            while (len(self._entries) > self._max_entries or
+                   (self._max_bytes is not None and
+                    self._bytes > self._max_bytes)):
+                self._remove(next(iter(self._entries)))  # least recently used
+
+    def invalidate(self, tables):
+        """ Remove all entries tagged with one of the tables.
+
+        :type tables: str or iterable of str
+        """
+        with self._lock:
+            for table in table_tags(tables):
+                self._generations[table] = self._generations.get(table, 0) + 1
+                for key in list(self._tags.get(table, ())):
+                    self._remove(key)
+
+    def clear(self):
+        """ Remove all entries and reset the counters. Like invalidating all
+        tables, values read before are not cached anymore.
+        """
+        with self._lock:
+            self._clears += 1
+            self._entries.clear()
+            self._tags.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        :return: {"entries", "bytes", "hits", "misses"}
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses}
+
+
+class _Call(object):
+    """ A call in flight, its result or error.
+    """
+
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """ Lets concurrent calls with the same key share one execution: while a
+    call for a key is in flight further calls wait for it and get its result
+    (or its exception) instead of executing again.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._calls = {}  # key -> _Call in flight
+
+    def __len__(self):
+        return len(self._calls)
+
+    def do(self, key, function):
+        """ Call function, unless a call for key is in flight already.
+
+        :type function: function() -> result
+        :return: the result of function
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            execute = call is None
+            if execute:
+                call = self._calls[key] = _Call()
+        if not execute:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = function()
+        except Exception as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+""" Collect query results column by column.
+
+Numeric columns are stored in array.array instances, which need a fraction of
+the memory of the same values in row tuples. Optionally those are returned as
+NumPy arrays (without copying), if NumPy is installed.
+"""
+from array import array
+from collections import OrderedDict
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Type codes for array.array and the matching NumPy dtype. Python 2.7 and
+# 3.2 do not have "q" (long long), "l" is 64 bits on most of their platforms.
+try:
+    _INTEGER = array("q").typecode
+except ValueError:
+    _INTEGER = "l"
+_FLOAT = "d"
+_DTYPES = {
+    _INTEGER: "int{}".format(8 * array(_INTEGER).itemsize),
+    _FLOAT: "float64",
+}
+
+# bool is an int subclass, but is kept in lists.
+_INTEGER_TYPES = frozenset([int, type(2 ** 64)])  # Python 2: int and long
+_NUMBER_TYPES = _INTEGER_TYPES | frozenset([float])
+
+
+def _typecode(types):
+    """ Choose the array type code for values of the types: integer, float
+    or None (use a list).
+    """
+    if types and types <= _INTEGER_TYPES:
+        return _INTEGER
+    if types == set([float]):
+        return _FLOAT
+    return None
+
+
+class ColumnBuilder(object):
+    """ Collects batches of rows into one sequence per column.
+
+    A column starts as an array of the type matching its first values. Values
+    that do not fit turn an integer array into a float array, if possible,
+    or the column into a list.
+    """
+
+    def __init__(self, names, use_numpy=False):
+        """
+        :param names: column names, in the order of the row values
+        :type names: (str, ...)
+        :param use_numpy: return numeric columns as NumPy arrays
+        :type use_numpy: bool
+        """
+        if use_numpy and numpy is None:
+            raise RuntimeError("NumPy is not installed.")
+        self._names = names
+        self._use_numpy = use_numpy
+        self._columns = [None] * len(names)
+
+    def add(self, rows):
+        """ Add a batch of rows.
+
+        :type rows: [(value, ...), ...]
+        """
+        if not rows:
+            return
+        for index, values in enumerate(zip(*rows)):
+            self._extend(index, values)
+
+    def _extend(self, index, values):
+        column = self._columns[index]
+        types = set(type(v) for v in values)
+        if column is None:
+            typecode = _typecode(types)
+            if typecode is None:
+                self._columns[index] = list(values)
+                return
+            column = self._columns[index] = array(typecode)
+        if isinstance(column, list):
+            column.extend(values)
+            return
+        # An array would take bools as numbers.
+        if bool not in types:
+            length = len(column)
+            try:
+                column.extend(values)
+                return
+            except (TypeError, OverflowError):
+                # Remove the values added before the failing one.
+                del column[length:]
+        if (column.typecode == _INTEGER and float in types and
+                types <= _NUMBER_TYPES):
+            column = array(_FLOAT, column)
+        else:
+            column = column.tolist()
+        column.extend(values)
+        self._columns[index] = column
+
+    def _finish_column(self, column):
+        if column is None:
+            return []
+        if self._use_numpy and isinstance(column, array):
+            return numpy.frombuffer(column, dtype=_DTYPES[column.typecode])
+        return column
+
+    def columns(self):
+        """
+        :return: column name -> array, NumPy array or list
+        :rtype: OrderedDict
+        """
+        return OrderedDict(
+            (name, self._finish_column(column))
+            for name, column in zip(self._names, self._columns))
@@ -1,18 +1,32 @@
 # -*- coding: utf-8 -*-
+from contextlib import contextmanager
+from functools import partial
 from functools import wraps
+from itertools import count
 from logging import getLogger
 
+from .cache import ResultCache
+from .cache import SingleFlight
+from .instrument import monotonic
 from .log_msg import LogMsg
 from .query import Manipulation
 from .query import Query
 from .query import QueryCursor
 from .query import Select
+from .query import SelectColumns
 from .query import SelectIterator
 from .query import SelectOne
+from .query import SelectStream
 
 
 _LOG = getLogger(__name__)
 
+_SAVEPOINT_NAMES = count()  # makes savepoint names unique
+
+
+def _no_return(_):
+    return None
+
 
 class _DBRollbackException(Exception):
     """Used by Connection transaction context manager.
@@ -38,39 +52,82 @@ class DB(object):
 
     OperationalError = Exception
 
+    # Gets called for every query and transaction, see
+    # dbquery.instrument.Instrumentation, None: no instrumentation.
+    instrumentation = None
+
+    # Fails queries fast while the database is down, see
+    # dbquery.retry.CircuitBreaker, None: no circuit breaker.
+    circuit_breaker = None
+
     def __init__(self, retry=0):
         """
-        :param retry: How many attempts to connect to make before giving up.
+        :param retry: How many attempts to connect to make before giving up,
+            or a RetryPolicy which also waits between the attempts.
+        :type retry: int or dbquery.retry.RetryPolicy
         """
         self._retry = retry
         self._orig_retry = None  # saves retry value during a transaction
         self._transaction_level = 0  # counts nested contexts
+        self._after_commit = None  # callbacks for the end of the transaction
+        # Used by the Select classes with a cache_ttl or single_flight.
+        self.result_cache = ResultCache()
+        self.single_flight = SingleFlight()
 
     def Query(self, sql):
         return Query(self, sql)
 
-    def QueryCursor(self, sql):
-        return QueryCursor(self, sql)
+    def QueryCursor(self, sql, itersize=None):
+        return QueryCursor(self, sql, itersize)
 
-    def Select(self, sql, row_formatter=None):
-        return Select(self, sql, row_formatter)
+    def Select(  # pylint: disable=too-many-arguments
+            self, sql, row_formatter=None, cache_ttl=None, tables=None,
+            single_flight=False):
+        return Select(
+            self, sql, row_formatter, cache_ttl, tables, single_flight)
 
-    def SelectOne(self, sql, row_formatter=None):
-        return SelectOne(self, sql, row_formatter)
+    def SelectOne(  # pylint: disable=too-many-arguments
+            self, sql, row_formatter=None, cache_ttl=None, tables=None,
+            single_flight=False):
+        return SelectOne(
+            self, sql, row_formatter, cache_ttl, tables, single_flight)
+
+    def SelectColumns(self, sql, arraysize=None, use_numpy=False):
+        return SelectColumns(self, sql, arraysize, use_numpy)
 
     def SelectIterator(  # pylint: disable=too-many-arguments
             self, sql, callback, cb_args=None, arraysize=None,
-            row_formatter=None):
+            row_formatter=None, itersize=None, columnar=False,
+            use_numpy=False, prefetch=None):
         return SelectIterator(
-            self, sql, callback, cb_args, arraysize, row_formatter)
+            self, sql, callback, cb_args, arraysize, row_formatter, itersize,
+            columnar, use_numpy, prefetch)
+
+    def SelectStream(
+            self, sql, row_formatter=None, arraysize=None, itersize=None):
+        return SelectStream(self, sql, row_formatter, arraysize, itersize)
 
-    def Manipulation(self, sql, rowcount=None):
-        return Manipulation(self, sql, rowcount)
+    def Manipulation(self, sql, rowcount=None, tables=None):
+        return Manipulation(self, sql, rowcount, tables)
 
     @property
     def retry(self):
         return self._retry
 
+    @property
+    def in_transaction(self):
+        """ True within a transaction (with db:).
+        """
+        return self._transaction_level > 0
+
+    @property
+    def failing_over(self):
+        """ True if the last query of the thread failed on a node which the
+        retry avoids, like a replica. Such failures are not counted by the
+        circuit breaker, the DB itself is not down.
+        """
+        return False
+
     def execute(self, sql, params, produce_return):
         """ Open or reuse a connection automatically, create a cursor and
         execute the query then call produce_return to get a value to return.
@@ -82,6 +139,13 @@ class DB(object):
         """
         raise NotImplementedError()
 
+    def read_execute(self, sql, params, produce_return):
+        """ Execute a query which only reads data, used by the Select
+        classes. Same as execute, unless the DB class has separate
+        connections for reading.
+        """
+        return self.execute(sql, params, produce_return)
+
     def nonclosing_execute(self, sql, params, return_function=None):
         """ Open or reuse a connection automatically, create a cursor and
         execute the query, then return the cursor directly.nDoes not close
@@ -95,6 +159,45 @@ class DB(object):
         """
         raise NotImplementedError()
 
+    def executemany(  # pylint: disable=too-many-arguments
+            self, sql, seq_of_params, produce_return, page_size=None,
+            count_rows=False):
+        """ Execute the SQL once for every parameter set in seq_of_params,
+        within one transaction. Then call produce_return with a cursor whose
+        rowcount is the total of all executions, or -1 if the DB does not
+        know it.
+
+        :type seq_of_params: iterable of [] or {}
+        :param page_size: parameter sets per round trip, if supported
+        :type page_size: int
+        :param count_rows: the row count is needed, even if that takes more
+            round trips
+        :type count_rows: bool
+        :return: Result of the produce_return function.
+        """
+        raise NotImplementedError()
+
+    def server_side_execute(
+            self, sql, params, produce_return, itersize=None):
+        """ Like execute, but use a server-side cursor, which keeps the result
+        on the server and transfers only the fetched rows.
+
+        :param itersize: Rows transferred per round trip when iterating over
+            the cursor.
+        :type itersize: int
+        :return: Result of the produce_return function.
+        """
+        raise NotImplementedError()
+
+    def nonclosing_server_side_execute(
+            self, sql, params, return_function=None, itersize=None):
+        """ Like nonclosing_execute, but use a server-side cursor, see
+        server_side_execute. Close the returned cursor when done!
+
+        :return: The open cursor.
+        """
+        raise NotImplementedError()
+
     def close(self):
         """ Close the connection so that another call to execute will
         trigger opening or reusing a new connection.
@@ -109,6 +212,14 @@ class DB(object):
         """
         raise NotImplementedError()
 
+    def explain(self, sql, params):
+        """ Get the query plan the database would use for the SQL, without
+        executing it.
+
+        :rtype: str
+        """
+        raise NotImplementedError()
+
     def _begin(self):
         raise NotImplementedError()
 
@@ -150,19 +261,37 @@ class DB(object):
 
         # Leaving the context entirely, commit the DB transaction.
         if self._transaction_level == 0:
+            instrumentation = self.instrumentation
+            if instrumentation is not None:
+                start = monotonic()
+            after_commit, self._after_commit = self._after_commit, None
             # Got an error? Roll back the transaction!
             if exc_value:
                 self._rollback()
+                if instrumentation is not None:
+                    instrumentation.rollback(self, monotonic() - start)
                 # Log the roll back, if it was an not the abort marker
                 # (_ConnectionRollbackException).
                 if not isinstance(exc_value, _DBRollbackException):
                     _LOG.debug(LogMsg("ROLLBACK on {}.", self))
             else:
                 self._commit()
+                if instrumentation is not None:
+                    instrumentation.commit(self, monotonic() - start)
                 _LOG.debug(LogMsg("COMMIT on {}.", self))
             # Restore retry value.
             self._retry = self._orig_retry
             self._orig_retry = None
+            if not exc_value:
+                for callback in after_commit or ():
+                    # The transaction is committed already, a failing
+                    # callback must not fail it nor stop the other ones.
+                    try:
+                        callback()
+                    except Exception:  # pylint: disable=broad-except
+                        _LOG.exception(
+                            LogMsg("After commit callback failed on {}.",
+                                   self))
 
         # Do not propagate any exception if:
         # - there was no exception
@@ -173,6 +302,29 @@ class DB(object):
                 (self._transaction_level == 0 and
                  isinstance(exc_value, _DBRollbackException)))
 
+    def after_commit(self, callback):
+        """ Call the function once the current transaction is committed, or
+        right away if no transaction is in progress. The function is not
+        called if the transaction is rolled back. Exceptions of functions
+        called after the commit are logged, not raised.
+
+        :type callback: function()
+        """
+        if self._transaction_level <= 0:
+            callback()
+            return
+        if self._after_commit is None:
+            self._after_commit = []
+        self._after_commit.append(callback)
+
+    def invalidate(self, tables):
+        """ Remove the cached results of the tables from the result_cache,
+        within a transaction after the commit.
+
+        :type tables: str or iterable of str
+        """
+        self.after_commit(partial(self.result_cache.invalidate, tables))
+
     def abort_transaction(self):
         if self._transaction_level <= 0:  # no transaction in progress!
             raise DBContextManagerError("No Transaction in progress.")
@@ -180,6 +332,35 @@ class DB(object):
         # a roll back.
         raise _DBRollbackException("Aborting transaction...")
 
+    @contextmanager
+    def savepoint(self):
+        """ Context manager for a savepoint within a transaction.
+
+        An exception leaving the context rolls back the queries made within it
+        (and is raised again), while the transaction continues:
+
+            with db:
+                insert(1)
+                try:
+                    with db.savepoint():
+                        insert(2)
+                        raise ValueError()
+                except ValueError:
+                    pass  # only 1 gets committed
+        """
+        if self._transaction_level <= 0:  # no transaction in progress!
+            raise DBContextManagerError("No Transaction in progress.")
+        name = "dbquery_sp_{}".format(next(_SAVEPOINT_NAMES))
+        self.execute("SAVEPOINT {}".format(name), (), _no_return)
+        try:
+            yield self
+        except BaseException:
+            self.execute(
+                "ROLLBACK TO SAVEPOINT {}".format(name), (), _no_return)
+            self.execute("RELEASE SAVEPOINT {}".format(name), (), _no_return)
+            raise
+        self.execute("RELEASE SAVEPOINT {}".format(name), (), _no_return)
+
     @staticmethod
     def connected(f):
 
@@ -0,0 +1,502 @@
+# -*- coding: utf-8 -*-
+""" Query instrumentation.
+
+Set an Instrumentation instance as the instrumentation attribute of a DB to
+get called before and after every query, on retries and at the end of
+transactions. Without one (the default) queries are not timed at all.
+"""
+from collections import deque
+from logging import WARNING
+from logging import getLogger
+from random import random
+from re import compile as re_compile
+from threading import Lock
+try:
+    from reprlib import Repr
+except ImportError:  # Python 2
+    from repr import Repr
+try:
+    from time import monotonic
+except ImportError:  # Python 2
+    from time import time as monotonic
+
+from .log_msg import LogMsg
+
+
+# Literals and parameter placeholders are replaced by ? in fingerprints.
+_STRING = re_compile(r"'(?:[^']|'')*'")
+_PLACEHOLDER = re_compile(r"%\([^)]+\)s|%s|\?|(?<!:):\w+|\$\d+")
+_NUMBER = re_compile(r"\b\d+(?:\.\d+)?\b")
+_VALUE_LIST = re_compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_WHITESPACE = re_compile(r"\s+")
+
+_FINGERPRINT_CACHE_SIZE = 1000
+
+# Statements EXPLAIN accepts.
+_EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "VALUES", "WITH")
+
+_MAX_LOGGED_SQL = 10000  # characters of the SQL in the slow query log
+
+# Abbreviates long parameters (and executemany parameter sets) in the slow
+# query log before they are formatted.
+_PARAMS_REPR = Repr()
+_PARAMS_REPR.maxstring = _PARAMS_REPR.maxother = 100
+_PARAMS_REPR.maxtuple = _PARAMS_REPR.maxlist = _PARAMS_REPR.maxdict = 20
+
+_LOG = getLogger(__name__)
+
+_fingerprints = {}  # SQL -> fingerprint
+
+
+def fingerprint(sql):
+    """ Normalize SQL so that queries which only differ in their literal
+    values, parameter style or white space get the same fingerprint:
+
+        >>> fingerprint("SELECT * FROM t WHERE id IN (1, 2,3) AND a = %s")
+        'SELECT * FROM t WHERE id IN (?) AND a = ?'
+
+    :rtype: str
+    """
+    result = _fingerprints.get(sql)
+    if result is None:
+        result = _STRING.sub("?", sql)
+        result = _PLACEHOLDER.sub("?", result)
+        result = _NUMBER.sub("?", result)
+        result = _VALUE_LIST.sub("(?)", result)
+        result = _WHITESPACE.sub(" ", result).strip()
+        if len(_fingerprints) >= _FINGERPRINT_CACHE_SIZE:
+            _fingerprints.clear()
+        _fingerprints[sql] = result
+    return result
+
+
+class _TimedCursor(object):
+    """ Adds the time spent in the fetch functions of cursor to the event.
+    """
+
+    def __init__(self, cursor, event):
+        self._cursor = cursor
+        self._event = event
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def _fetch(self, fetch, *args):
+        start = monotonic()
+        try:
+            return fetch(*args)
+        finally:
+            self._event.fetch_time += monotonic() - start
+
+    def fetchone(self):
+        row = self._fetch(self._cursor.fetchone)
+        if row is not None:
+            self._event.rows += 1
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._fetch(self._cursor.fetchmany, *args)
+        self._event.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._fetch(self._cursor.fetchall)
+        self._event.rows += len(rows)
+        return rows
+
+
+class QueryEvent(object):
+    """ Timings and counts of one query execution, all times in seconds.
+
+    execute_time: from the start until the query was executed, including
+        retries
+    fetch_time: spent fetching rows
+    format_time: spent in _produce_return apart from fetching, which is row
+        formatting and, for SelectIterator, the callback (rows formatted
+        lazily after the query returned are not included)
+    total_time: the whole query, set when it is finished
+    params: the query parameters
+    many: params is a sequence of parameter sets (executemany)
+    rows: number of fetched rows
+    rowcount: the cursor rowcount
+    retries: number of retries
+    error: the exception, if the query failed
+    """
+
+    __slots__ = (
+        "db", "sql", "params", "many", "start", "execute_time", "fetch_time",
+        "format_time", "total_time", "rows", "rowcount", "retries", "error")
+
+    def __init__(self, db, sql, params=None, many=False):
+        self.db = db
+        self.sql = sql
+        self.params = params
+        self.many = many
+        self.start = monotonic()
+        self.execute_time = None
+        self.fetch_time = 0.0
+        self.format_time = None
+        self.total_time = None
+        self.rows = 0
+        self.rowcount = None
+        self.retries = 0
+        self.error = None
+
+    @property
+    def fingerprint(self):
+        return fingerprint(self.sql)
+
+    def wrap(self, produce_return):
+        """ Time the produce_return function and the fetches it makes.
+
+        :rtype: function(cursor) -> response
+        """
+
+        def timed_produce_return(cursor):
+            start = monotonic()
+            self.execute_time = start - self.start
+            self.fetch_time = 0.0
+            self.rows = 0
+            try:
+                return produce_return(_TimedCursor(cursor, self))
+            finally:
+                self.rowcount = getattr(cursor, "rowcount", None)
+                self.format_time = monotonic() - start - self.fetch_time
+
+        return timed_produce_return
+
+    def finish(self, error=None):
+        self.total_time = monotonic() - self.start
+        if self.execute_time is None:  # no produce_return call
+            self.execute_time = self.total_time
+        self.error = error
+
+
+class Instrumentation(object):
+    """ Base class for instrumentations, all hooks do nothing.
+    """
+
+    def before_query(self, event):
+        """ Called before a query gets executed.
+
+        :type event: QueryEvent
+        """
+
+    def after_query(self, event):
+        """ Called after a query was executed or failed (event.error).
+
+        :type event: QueryEvent
+        """
+
+    def retry(self, event, error):
+        """ Called before a query gets retried.
+
+        :param error: the OperationalError which caused the retry
+        """
+
+    def commit(self, db, duration):
+        """ Called after a transaction was committed.
+
+        :param duration: seconds the commit took
+        """
+
+    def rollback(self, db, duration):
+        """ Called after a transaction was rolled back.
+
+        :param duration: seconds the roll back took
+        """
+
+    def circuit_state(self, db, state):
+        """ Called when the circuit breaker of the DB changed its state.
+
+        :param state: the new state, see dbquery.retry.CircuitBreaker
+        """
+
+
+class MultiInstrumentation(Instrumentation):
+    """ Calls several instrumentations, in the given order.
+    """
+
+    def __init__(self, *instrumentations):
+        self.instrumentations = list(instrumentations)
+
+    def before_query(self, event):
+        for instrumentation in self.instrumentations:
+            instrumentation.before_query(event)
+
+    def after_query(self, event):
+        for instrumentation in self.instrumentations:
+            instrumentation.after_query(event)
+
+    def retry(self, event, error):
+        for instrumentation in self.instrumentations:
+            instrumentation.retry(event, error)
+
+    def commit(self, db, duration):
+        for instrumentation in self.instrumentations:
+            instrumentation.commit(db, duration)
+
+    def rollback(self, db, duration):
+        for instrumentation in self.instrumentations:
+            instrumentation.rollback(db, duration)
+
+    def circuit_state(self, db, state):
+        for instrumentation in self.instrumentations:
+            instrumentation.circuit_state(db, state)
+
+
+def _percentile(ordered, fraction):
+    """ Nearest rank percentile of an ordered, non-empty list.
+    """
+    index = int(round(fraction * (len(ordered) - 1)))
+    return ordered[index]
+
+
+class LatencyAggregator(Instrumentation):
+    """ Collects the latency (total time) of queries per fingerprint, in
+    process.
+
+    The percentiles are calculated from the last window executions of each
+    fingerprint.
+    """
+
+    def __init__(self, window=1000):
+        """
+        :param window: number of latencies to keep per fingerprint
+        :type window: int
+        """
+        self._window = window
+        self._lock = Lock()
+        self._queries = {}  # fingerprint -> [count, errors, latencies]
+
+    def after_query(self, event):
+        key = event.fingerprint
+        with self._lock:
+            query = self._queries.get(key)
+            if query is None:
+                query = [0, 0, deque(maxlen=self._window)]
+                self._queries[key] = query
+            query[0] += 1
+            if event.error is not None:
+                query[1] += 1
+            query[2].append(event.total_time)
+
+    def stats(self):
+        """
+        :return: fingerprint -> {"count", "errors", "p50", "p95", "p99"}
+        :rtype: dict
+        """
+        with self._lock:
+            queries = [
+                (key, count, errors, sorted(latencies))
+                for key, (count, errors, latencies) in self._queries.items()]
+        return dict(
+            (key, {
+                "count": count,
+                "errors": errors,
+                "p50": _percentile(latencies, 0.50),
+                "p95": _percentile(latencies, 0.95),
+                "p99": _percentile(latencies, 0.99)})
+            for key, count, errors, latencies in queries)
+
+    def reset(self):
+        with self._lock:
+            self._queries.clear()
+
+
+class _Statistic(object):
+    """ Totals of one fingerprint, with its own lock so that different
+    queries do not wait for each other.
+    """
+
+    __slots__ = (
+        "lock", "calls", "total_time", "max_time", "execute_time",
+        "fetch_time", "format_time", "rows", "rowcount", "retries", "errors")
+
+    def __init__(self):
+        self.lock = Lock()
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.execute_time = 0.0
+        self.fetch_time = 0.0
+        self.format_time = 0.0
+        self.rows = 0
+        self.rowcount = 0
+        self.retries = 0
+        self.errors = 0
+
+    def add(self, event):
+        with self.lock:
+            self.calls += 1
+            self.total_time += event.total_time
+            if event.total_time > self.max_time:
+                self.max_time = event.total_time
+            self.execute_time += event.execute_time
+            self.fetch_time += event.fetch_time
+            self.format_time += event.format_time or 0.0
+            self.rows += event.rows
+            if event.rowcount is not None and event.rowcount > 0:
+                self.rowcount += event.rowcount
+            self.retries += event.retries
+            if event.error is not None:
+                self.errors += 1
+
+    def snapshot(self):
+        with self.lock:
+            values = dict(
+                (name, getattr(self, name)) for name in self.__slots__[1:])
+        values["mean_time"] = values["total_time"] / values["calls"]
+        return values
+
+
+class QueryStatistics(Instrumentation):
+    """ Totals per SQL fingerprint, like pg_stat_statements but on the client
+    side and for every database: calls, total, mean and max time (also split
+    into execute, fetch and format time), fetched rows, affected rows (the
+    sum of the cursor rowcounts), retries and errors.
+
+    Queries only lock the totals of their own fingerprint.
+    """
+
+    def __init__(self):
+        self._lock = Lock()  # for adding fingerprints
+        self._statistics = {}  # fingerprint -> _Statistic
+
+    def after_query(self, event):
+        key = event.fingerprint
+        statistic = self._statistics.get(key)
+        if statistic is None:
+            # Publish new totals with their first call, a snapshot must not
+            # see them without calls.
+            first = _Statistic()
+            first.add(event)
+            with self._lock:
+                statistic = self._statistics.setdefault(key, first)
+            if statistic is first:
+                return
+        statistic.add(event)
+
+    def snapshot(self):
+        """
+        :return: fingerprint -> {"calls", "total_time", "mean_time",
+            "max_time", "execute_time", "fetch_time", "format_time", "rows",
+            "rowcount", "retries", "errors"}
+        :rtype: dict
+        """
+        with self._lock:
+            statistics = list(self._statistics.items())
+        return dict((key, s.snapshot()) for key, s in statistics)
+
+    def top(self, count=10, key="total_time"):
+        """ Get the queries with the highest value of key, like the ones
+        with the most total time.
+
+        :rtype: [(fingerprint, statistics), ...]
+        """
+        return sorted(
+            self.snapshot().items(), key=lambda item: item[1][key],
+            reverse=True)[:count]
+
+    def reset(self):
+        """ Start counting from zero.
+        """
+        with self._lock:
+            self._statistics = {}
+
+
+class _RateLimit(object):
+    """ Token bucket: allows up to count events per period seconds, with
+    bursts of up to count events.
+    """
+
+    def __init__(self, count, period):
+        self._capacity = float(count)
+        self._rate = count / float(period)  # tokens per second
+        self._tokens = self._capacity
+        self._last = monotonic()
+        self._lock = Lock()
+
+    def allow(self):
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(
+                self._capacity,
+                self._tokens + (now - self._last) * self._rate)
+            self._last = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class SlowQueryLog(Instrumentation):
+    """ Logs queries which took at least threshold seconds: the SQL and the
+    parameters, the duration, the number of fetched rows and the rowcount.
+    The parameters are not merged into the SQL with DB.show, which might need
+    a connection of a database which is slow or down.
+
+    With explain set the query plan (DB.explain) is logged, too. Only for a
+    sample of the slow queries and at most explain_limit per minute, so that
+    the EXPLAIN queries do not add to the load of a database which is slow
+    already. Failed queries and queries within a transaction are not
+    explained, since a failing EXPLAIN would abort the transaction.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self, threshold=1.0, explain=False, explain_sample=1.0,
+            explain_limit=6, logger=None, level=WARNING):
+        """
+        :param threshold: seconds from which on a query is slow
+        :type threshold: float
+        :param explain: log the query plan, too
+        :type explain: bool
+        :param explain_sample: fraction of slow queries to explain, 0 to 1
+        :type explain_sample: float
+        :param explain_limit: maximum number of EXPLAINs per minute
+        :type explain_limit: int
+        :param logger: logging.Logger to use, default: this modules logger
+        :param level: log level
+        """
+        self._threshold = threshold
+        self._explain = explain
+        self._explain_sample = explain_sample
+        self._explain_limit = _RateLimit(explain_limit, 60)
+        self._logger = logger or _LOG
+        self._level = level
+
+    def after_query(self, event):
+        if event.total_time < self._threshold:
+            return
+        sql = "{} {}".format(event.sql, _PARAMS_REPR.repr(event.params))
+        if len(sql) > _MAX_LOGGED_SQL:
+            sql = sql[:_MAX_LOGGED_SQL] + "..."
+        plan = self._query_plan(event)
+        self._logger.log(
+            self._level,
+            LogMsg(
+                "Slow query ({:.3f}s, {} rows, rowcount {}{}): {}{}",
+                event.total_time, event.rows, event.rowcount,
+                ", failed" if event.error is not None else "", sql,
+                "\n" + plan if plan else ""))
+
+    def _query_plan(self, event):
+        """
+        :return: the query plan or None, if the query is not explained
+        """
+        words = event.sql.split(None, 1)
+        if (not self._explain or not words or
+                words[0].upper() not in _EXPLAINABLE or
+                event.many or event.error is not None or
+                event.db.in_transaction or
+                random() >= self._explain_sample or
+                not self._explain_limit.allow()):
+            return None
+        try:
+            return event.db.explain(event.sql, event.params)
+        except Exception:
+            self._logger.debug("EXPLAIN failed.", exc_info=True)
+            return None
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+""" Thread-safe connection pool.
+
+Used by the pooled DB classes to share a limited number of DB-API connections
+between many threads.
+"""
+from collections import deque
+from threading import Condition
+from threading import Lock
+from threading import local
+from time import time
+
+
+class PoolTimeoutError(Exception):
+    """ Raised when no connection could be checked out of a pool within the
+    configured timeout.
+    """
+
+
+class ConnectionPool(object):
+    """ Keeps between minsize and maxsize connections, created with the
+    connect function and closed with the close function.
+
+    Idle connections are handed out last in, first out, so that a small set of
+    connections stays warm while the ones not used for max_idle seconds are
+    closed (reaped), as long as more than minsize connections exist.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self, connect, close=None, minsize=1, maxsize=10, timeout=None,
+            max_idle=None):
+        """
+        :param connect: creates and returns a new connection
+        :type connect: function() -> connection
+        :param close: closes a connection, default calls its close method
+        :type close: function(connection)
+        :param minsize: Connections to keep open, even when idle.
+        :type minsize: int
+        :param maxsize: Maximum number of connections open at the same time.
+        :type maxsize: int
+        :param timeout: Seconds to wait for a free connection when maxsize
+            connections are checked out, None waits forever.
+        :type timeout: float
+        :param max_idle: Seconds after which an idle connection above minsize
+            gets closed, None keeps idle connections open.
+        :type max_idle: float
+        """
+        if minsize < 0 or maxsize < 1 or minsize > maxsize:
+            raise ValueError(
+                "Invalid pool size: min {}, max {}.".format(minsize, maxsize))
+        self._connect = connect
+        self._close = close or (lambda connection: connection.close())
+        self._minsize = minsize
+        self._maxsize = maxsize
+        self._timeout = timeout
+        self._max_idle = max_idle
+        self._idle = deque()  # (connection, idle since) tuples, newest last
+        self._size = 0  # open connections, idle and checked out
+        self._available = Condition(Lock())
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def idle(self):
+        return len(self._idle)
+
+    def get(self):
+        """ Check out an idle connection or open a new one if the pool is not
+        full yet. Otherwise wait up to timeout seconds for a connection to be
+        returned.
+
+        :raise PoolTimeoutError: if no connection became available in time
+        """
+        deadline = None
+        if self._timeout is not None:
+            deadline = time() + self._timeout
+        connection = None
+        with self._available:
+            expired = self._reap()
+            while not self._idle and self._size >= self._maxsize:
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time()
+                    if remaining <= 0:
+                        break
+                self._available.wait(remaining)
+            if self._idle:
+                connection = self._idle.pop()[0]
+            full = self._size >= self._maxsize
+            if connection is None and not full:
+                # Reserve the slot before connecting, so other threads do not
+                # exceed maxsize while the connection is being opened.
+                self._size += 1
+        self._close_all(expired)
+        if connection is not None:
+            return connection
+        if full:
+            raise PoolTimeoutError(
+                "No connection available after {}s.".format(self._timeout))
+        try:
+            return self._connect()
+        except Exception:
+            with self._available:
+                self._size -= 1
+                self._available.notify()
+            raise
+
+    def put(self, connection, discard=False):
+        """ Return a checked out connection to the pool.
+
+        :param discard: close the connection instead of keeping it, for
+            example because it is broken
+        """
+        with self._available:
+            if discard:
+                self._size -= 1
+            else:
+                self._idle.append((connection, time()))
+            expired = self._reap()
+            self._available.notify()
+        if discard:
+            expired.append(connection)
+        self._close_all(expired)
+
+    def close(self):
+        """ Close all idle connections. Checked out connections get closed
+        when they are returned with discard set.
+        """
+        with self._available:
+            connections = [c for c, _ in self._idle]
+            self._size -= len(connections)
+            self._idle.clear()
+            self._available.notify_all()
+        self._close_all(connections)
+
+    def _reap(self):
+        """ Remove connections that have been idle for longer than max_idle,
+        oldest first, keeping at least minsize connections.
+
+        Call with the lock held, close the returned connections without it.
+
+        :rtype: [connection, ...]
+        """
+        expired = []
+        if self._max_idle is None:
+            return expired
+        idle_since = time() - self._max_idle
+        while (self._idle and self._size > self._minsize and
+               self._idle[0][1] < idle_since):
+            expired.append(self._idle.popleft()[0])
+            self._size -= 1
+        return expired
+
+    def _close_all(self, connections):
+        for connection in connections:
+            try:
+                self._close(connection)
+            except Exception:
+                pass  # ignore
+
+
+class _ClosingCursor(object):
+    """ Wraps a cursor returned by nonclosing_execute and calls on_close once,
+    after the cursor itself was closed.
+    """
+
+    def __init__(self, cursor, on_close):
+        self._cursor = cursor
+        self._on_close = on_close
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def close(self):
+        try:
+            self._cursor.close()
+        finally:
+            on_close, self._on_close = self._on_close, None
+            if on_close is not None:
+                on_close()
+
+
+class ThreadLocalAttribute(object):
+    """ Descriptor which stores a DB attribute per thread.
+
+    Lets a pooled DB keep its transaction state (level, retry, connection)
+    separate for every thread, while the DB base class keeps using plain
+    attributes. The first value ever assigned is the default for all threads.
+
+    The owning instance needs a _local (threading.local) and a _defaults
+    (dict) attribute, set before the attribute is first assigned.
+    """
+
+    def __init__(self, name):
+        self._name = name
+
+    def __get__(self, db, owner=None):
+        if db is None:
+            return self
+        # pylint: disable=protected-access
+        try:
+            return getattr(db._local, self._name)
+        except AttributeError:
+            return db._defaults[self._name]
+
+    def __set__(self, db, value):
+        # pylint: disable=protected-access
+        db._defaults.setdefault(self._name, value)
+        setattr(db._local, self._name, value)
+
+
+def thread_local_state(db):
+    """ Prepare a DB instance for ThreadLocalAttribute descriptors.
+    """
+    # pylint: disable=protected-access
+    db._local = local()
+    db._defaults = {}
@@ -1,16 +1,480 @@
 # -*- coding: utf-8 -*-
+from binascii import hexlify
+from collections import OrderedDict
+from csv import writer as csv_writer
+from decimal import Decimal
+from functools import partial
+from functools import wraps
+from itertools import count
+from itertools import islice
+from logging import getLogger
+from re import IGNORECASE
+from re import compile as re_compile
+from select import select
+from threading import Event
+from threading import Lock
+from threading import Thread
+from weakref import WeakKeyDictionary
+
+from psycopg2 import Error as PGError
 from psycopg2 import OperationalError as PGOperationalError
 from psycopg2 import connect
+from psycopg2.errorcodes import FEATURE_NOT_SUPPORTED
+from psycopg2.errorcodes import INVALID_SQL_STATEMENT_NAME
+from psycopg2.extras import execute_batch
+from psycopg2.extras import execute_values
 
+from .cache import table_tags
 from .db import DB
+from .log_msg import LogMsg
+from .pool import ConnectionPool
+from .pool import _ClosingCursor
+from .pool import ThreadLocalAttribute
+from .pool import thread_local_state
+from .query import Query
 from .query import SelectOne
 
 
+_LOG = getLogger(__name__)
+
+_CURSOR_NAMES = count()  # makes server-side cursor names unique
+
+# INSERT ... VALUES %s statements can be executed with execute_values.
+_VALUES_TEMPLATE = re_compile(r"\bVALUES\s+%s", IGNORECASE)
+
+_PAGE_SIZE = 100  # psycopg2 default for execute_batch and execute_values
+
+_PREPARED_NAMES = count()  # makes prepared statement names unique
+
+# Placeholders (and the escaped percent sign) as psycopg2 interpolates them.
+_PLACEHOLDER = re_compile(r"%(?:\(([^)]+)\)s|s|%)")
+
+# Statements PREPARE accepts.
+_PREPARABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "VALUES", "WITH")
+
+# The types declared for the parameters of prepared statements, by the type
+# of the first values. Otherwise PREPARE infers them from the SQL and EXECUTE
+# converts the values, which would for example round 1.5 for an integer
+# column. Text is sent as quoted literal by psycopg2 and its type inferred
+# either way (unknown). Statements with parameters of other types are not
+# prepared.
+_PARAMETER_TYPES = {
+    bool: "boolean",
+    int: "bigint",
+    float: "double precision",
+    Decimal: "numeric",
+    str: "unknown",
+}
+if bytes is str:  # Python 2
+    # pylint: disable=undefined-variable
+    _PARAMETER_TYPES.update({long: "bigint", unicode: "unknown"})
+_BIGINT_RANGE = (-2 ** 63, 2 ** 63 - 1)
+
+# Errors of an outdated prepared statement, like "cached plan must not change
+# result type" after the table was changed.
+_PREPARED_STATEMENT_ERRORS = (
+    FEATURE_NOT_SUPPORTED, INVALID_SQL_STATEMENT_NAME)
+
+
+def _prepare_sql(sql):
+    """ Convert the psycopg2 placeholders of sql into PREPARE parameters ($1,
+    $2, ...).
+
+    :return: the statement for PREPARE, the argument list for EXECUTE (with
+        psycopg2 placeholders) and the parameter names (None for positional
+        parameters) or None, if the SQL can not be prepared
+    """
+    words = sql.split(None, 1)
+    if not words or words[0].upper() not in _PREPARABLE:
+        return None
+    if "%" in _PLACEHOLDER.sub("", sql):
+        return None  # invalid for psycopg2, let it raise the error
+    names = []  # the parameter names, None for positional parameters
+
+    def _replace(match):
+        if match.group(0) == "%%":
+            return "%"
+        name = match.group(1)
+        if name is not None and name in names:
+            return "${}".format(names.index(name) + 1)
+        names.append(name)
+        return "${}".format(len(names))
+
+    statement = _PLACEHOLDER.sub(_replace, sql)
+    if None in names:
+        if any(names):
+            return None  # mixes positional and named parameters
+        arguments = ", ".join("%s" for _ in names)
+    else:
+        arguments = ", ".join("%({})s".format(name) for name in names)
+    return statement, arguments, names
+
+
+def _parameter_types(params, names):
+    """ Get the types of the parameters of a prepared statement, see
+    _PARAMETER_TYPES.
+
+    :param names: the parameter names from _prepare_sql
+    :return: the type of every parameter (None for NULL) or None, if a
+        parameter is missing or has a type which can not be declared
+    """
+    if isinstance(params, dict):
+        if not all(name in params for name in names):
+            return None
+        params = [params[name] for name in names]
+    elif len(params or ()) != len(names):
+        return None
+    types = []
+    for value in params or ():
+        if value is None:
+            types.append(None)
+            continue
+        parameter_type = _PARAMETER_TYPES.get(type(value))
+        if parameter_type is None or (
+                parameter_type == "bigint" and
+                not _BIGINT_RANGE[0] <= value <= _BIGINT_RANGE[1]):
+            return None
+        types.append(parameter_type)
+    return types
+
+
+class _StatementCache(object):
+    """ Prepared statements of one connection.
+
+    Counts the executions of every SQL and prepares it once it was executed
+    threshold times, declaring the types of the parameters of that
+    execution. Executions with parameters of other types are not prepared.
+    At most size statements stay prepared, the least recently used one gets
+    deallocated to make room for a new one.
+    """
+
+    def __init__(self, threshold, size):
+        self._threshold = threshold
+        self._size = size
+        self._counts = OrderedDict()  # SQL -> executions, LRU order
+        # SQL -> (name, EXECUTE SQL, parameter names, parameter types), None
+        # if the SQL can not be prepared, in LRU order
+        self._statements = OrderedDict()
+        # Names of discarded statements, to deallocate outside a transaction.
+        self._deallocate = []
+
+    def lookup(self, cursor, sql, params, can_prepare):
+        """ Get the EXECUTE statement for sql, prepare it with cursor if it
+        gets executed often enough.
+
+        :param can_prepare: False while a transaction is in progress, which
+            a failing PREPARE would abort
+        :return: SQL to execute with the params or None to use sql itself
+        """
+        if can_prepare:
+            while self._deallocate:
+                self._deallocate_statement(cursor, self._deallocate.pop())
+        statement = self._statements.pop(sql, False)
+        if statement is False:  # not yet prepared
+            executions = self._counts.pop(sql, 0) + 1
+            if executions >= self._threshold and can_prepare:
+                statement = self._prepare(cursor, sql, params)
+            if statement is False:
+                self._counts[sql] = executions
+                if len(self._counts) > self._size:
+                    self._counts.popitem(last=False)
+                return None
+        self._statements[sql] = statement  # most recently used
+        if statement is None:
+            return None
+        _, execute_sql, names, declared_types = statement
+        types = _parameter_types(params, names)
+        if types is None or any(
+                t is not None and t != d
+                for t, d in zip(types, declared_types)):
+            # Let psycopg2 report wrong parameters, execute values of other
+            # types without the prepared statement.
+            return None
+        return execute_sql
+
+    def _prepare(self, cursor, sql, params):
+        """
+        :return: the prepared statement, None if the SQL can not be prepared
+            or False if not with these parameters
+        """
+        prepared = _prepare_sql(sql)
+        if prepared is None or (not params and "%" in sql):
+            # Without parameters psycopg2 does not interpolate at all.
+            return None
+        statement, arguments, names = prepared
+        types = _parameter_types(params, names)
+        if types is None:
+            return False
+        while len(self._statements) >= self._size:
+            _, evicted = self._statements.popitem(last=False)
+            if evicted is not None:
+                cursor.execute("DEALLOCATE {}".format(evicted[0]))
+        name = "dbquery_stmt_{}".format(next(_PREPARED_NAMES))
+        if types:
+            name_types = "{} ({})".format(
+                name, ", ".join(t or "unknown" for t in types))
+        else:
+            name_types = name
+        try:
+            cursor.execute("PREPARE {} AS {}".format(name_types, statement))
+        except PGOperationalError:
+            raise
+        except PGError:
+            return None  # remember that it can not be prepared
+        if arguments:
+            execute_sql = "EXECUTE {} ({})".format(name, arguments)
+        else:
+            execute_sql = "EXECUTE {}".format(name)
+        return name, execute_sql, names, [t or "unknown" for t in types]
+
+    @staticmethod
+    def _deallocate_statement(cursor, name):
+        try:
+            cursor.execute("DEALLOCATE {}".format(name))
+        except PGOperationalError:
+            raise
+        except PGError:
+            pass  # gone already
+
+    def discard(self, cursor, sql, can_deallocate):
+        """ Deallocate the prepared statement of sql, after its execution
+        failed, for example because the table it uses was changed.
+
+        :param can_deallocate: False while a transaction is in progress,
+            which is aborted by the failed execution, then it is deallocated
+            by the next lookup outside a transaction
+        """
+        statement = self._statements.pop(sql, None)
+        if statement is None:
+            return
+        if can_deallocate:
+            self._deallocate_statement(cursor, statement[0])
+        else:
+            self._deallocate.append(statement[0])
+
+
 class _NextVal(SelectOne):
 
     def __init__(self, db, sequence):
         super(_NextVal, self).__init__(
             db, 'SELECT nextval(\'{}\')'.format(sequence), None)
+        self._execute_function = db.execute  # changes the sequence
+
+
+_COPY_FORMATS = ("text", "csv", "binary")
+
+_COPY_BUFFER_SIZE = 8192  # psycopg2 default for copy_expert
+
+
+def _copy_options(copy_format, header):
+    if copy_format not in _COPY_FORMATS:
+        raise ValueError("Unknown COPY format: {}.".format(copy_format))
+    options = "FORMAT {}".format(copy_format)
+    if header:
+        options += ", HEADER true"
+    return options
+
+
+# Values copied as bytea. On Python 2 bytes is str, which is text there.
+if bytes is str:
+    # pylint: disable=undefined-variable
+    _BINARY_TYPES = (bytearray, memoryview, buffer)
+    _STRING_TYPES = (str, unicode)
+    _TEXT_TYPE = unicode
+else:
+    _BINARY_TYPES = (bytes, bytearray, memoryview)
+    _STRING_TYPES = (str,)
+    _TEXT_TYPE = str
+
+
+def _bytea_value(value):
+    """ Turn a binary value into the bytea hex format, other values are
+    returned unchanged.
+    """
+    if isinstance(value, _BINARY_TYPES):
+        return "\\x" + hexlify(value).decode("ascii")
+    return value
+
+
+def _text_value(value):
+    """ Turn a value into a field of the COPY text format.
+    """
+    if value is None:
+        return "\\N"
+    value = _bytea_value(value)
+    if not isinstance(value, _STRING_TYPES):
+        value = _TEXT_TYPE(value)
+    return (
+        value.replace("\\", "\\\\").replace("\t", "\\t")
+        .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+class _CSVLine(object):
+    """ File-like target for a csv writer, keeps the last written line.
+    """
+
+    def __init__(self):
+        self.line = None
+
+    def write(self, line):
+        self.line = line
+
+
+class _RowReader(object):
+    """ File-like object for copy_expert, which reads rows from an iterable
+    and returns them in the COPY text or CSV format.
+
+    Only as many rows are taken from the iterable as needed for one read.
+    """
+
+    def __init__(self, rows, copy_format):
+        self._rows = iter(rows)
+        if copy_format == "text":
+            self._format_row = self._text_row
+        elif copy_format == "csv":
+            self._csv_line = _CSVLine()
+            self._csv_writer = csv_writer(
+                self._csv_line, lineterminator="\n")
+            self._format_row = self._csv_row
+        else:
+            raise ValueError(
+                "Rows can not be copied in {} format.".format(copy_format))
+        self._buffer = ""
+
+    @staticmethod
+    def _text_row(row):
+        return "\t".join(_text_value(v) for v in row) + "\n"
+
+    def _csv_row(self, row):
+        self._csv_writer.writerow([_bytea_value(v) for v in row])
+        return self._csv_line.line
+
+    def read(self, size=-1):
+        lines = [self._buffer]
+        length = len(self._buffer)
+        for row in self._rows:
+            line = self._format_row(row)
+            lines.append(line)
+            length += len(line)
+            if 0 <= size <= length:
+                break
+        data = "".join(lines)
+        if size < 0:
+            self._buffer = ""
+            return data
+        self._buffer = data[size:]
+        return data[:size]
+
+
+class _BatchCursor(object):
+    """ Cursor used by executemany, with the rowcount of all pages.
+    """
+
+    def __init__(self, cursor, rowcount):
+        self._cursor = cursor
+        self.rowcount = rowcount
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+def _pages(seq_of_params, page_size):
+    """ Split an iterable into lists of up to page_size items.
+    """
+    iterator = iter(seq_of_params)
+    page = list(islice(iterator, page_size))
+    while page:
+        yield page
+        page = list(islice(iterator, page_size))
+
+
+class CopyIn(Query):
+    """ Loads data into a table with COPY ... FROM STDIN.
+
+    Called with either a file-like object (has a read function) with data in
+    the chosen format or with an iterable of rows (sequences of values) for
+    the text and CSV format. Rows are converted while the data is sent, so the
+    data is never held in memory at once.
+
+    Returns the number of copied rows. A failed copy is not retried, since
+    the data source can not be read again.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self, db, table, columns=None, copy_format="text", header=False,
+            size=_COPY_BUFFER_SIZE):
+        """
+        :param table: (schema qualified) table name
+        :param columns: column names, matching the data or None for all
+        :type columns: [str, ...]
+        :param copy_format: text, csv or binary
+        :param header: if the CSV data starts with a header line
+        :param size: bytes read from the data source at once
+        """
+        column_list = ""
+        if columns:
+            column_list = " ({})".format(", ".join(columns))
+        super(CopyIn, self).__init__(
+            db, "COPY {}{} FROM STDIN WITH ({})".format(
+                table, column_list, _copy_options(copy_format, header)))
+        self._copy_format = copy_format
+        self._size = size
+
+    def _produce_return(self, cursor):
+        return cursor.rowcount
+
+    def __call__(self, source):  # pylint: disable=arguments-differ
+        """
+        :param source: file-like object or iterable of rows
+        :rtype: int
+        """
+        if not hasattr(source, "read"):
+            source = _RowReader(source, self._copy_format)
+        return self._db.copy_expert(
+            self._sql, None, source, self._produce_return, self._size)
+
+
+class CopyOut(Query):
+    """ Writes the result of a query to a file-like object (has a write
+    function) with COPY ... TO STDOUT, in chunks as the server sends them.
+
+    Called with the file-like object followed by the query parameters, which
+    are merged into the SQL since COPY does not support query parameters.
+    Text files get strings, all others bytes.
+
+    Returns the number of copied rows.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self, db, sql, copy_format="csv", header=False,
+            size=_COPY_BUFFER_SIZE):
+        """
+        :param sql: a SELECT query or a (schema qualified) table name
+        :param copy_format: text, csv or binary
+        :param header: if the CSV data should start with a header line
+        :param size: bytes written to the file at once
+        """
+        if sql.split(None, 1)[0].upper() in ("SELECT", "WITH", "VALUES"):
+            sql = "({})".format(sql)
+        super(CopyOut, self).__init__(
+            db, "COPY {} TO STDOUT WITH ({})".format(
+                sql, _copy_options(copy_format, header)))
+        self._size = size
+
+    def _produce_return(self, cursor):
+        return cursor.rowcount
+
+    def __call__(self, target, *args, **kwds):
+        # pylint: disable=arguments-differ
+        """
+        :param target: file-like object
+        :rtype: int
+        """
+        params = args
+        if not params:
+            params = kwds  # pylint: disable=redefined-variable-type
+        return self._db.copy_expert(
+            self._sql, params, target, self._produce_return, self._size)
 
 
 class PostgresDB(DB):
@@ -27,49 +491,289 @@ class PostgresDB(DB):
 
     OperationalError = PGOperationalError
 
-    def __init__(self, dsn=None, retry=0, **kwds):
+    def __init__(  # pylint: disable=too-many-arguments
+            self, dsn=None, retry=0, prepare_threshold=5,
+            prepared_statements=100, invalidation_channel=None, **kwds):
+        """
+        :param prepare_threshold: Executions of the same SQL after which it
+            gets prepared on the server (PREPARE), None disables prepared
+            statements.
+        :param prepared_statements: Maximum number of prepared statements per
+            connection.
+        :param invalidation_channel: Also send the tables of invalidated
+            cached results to this channel (NOTIFY), for the PostgresListener
+            of other processes.
+        """
         super(PostgresDB, self).__init__(retry=retry)
         self._kwds = kwds or {}
         if dsn:
             self._kwds["dsn"] = dsn
         self._connection = None
+        self._invalidation_channel = invalidation_channel
+        self._prepare_threshold = prepare_threshold
+        self._prepared_statements = prepared_statements
+        self._statement_caches = WeakKeyDictionary()  # connection -> cache
+        self._statement_caches_lock = Lock()
+
+    def _new_connection(self):
+        connection = connect(**self._kwds)
+        connection.set_session(autocommit=True)
+        return connection
 
     def _connect(self):
         if self._connection is not None:
             raise RuntimeError("Connection still exists.")
-        self._connection = connect(**self._kwds)
-        self._connection.set_session(autocommit=True)
+        self._connection = self._new_connection()
+        # Prepared statements only exist on the connection they were made on.
+        self._statement_caches.pop(self._connection, None)
 
     def close(self):
         if self._connection is not None:
+            self._statement_caches.pop(self._connection, None)
             try:
                 self._connection.close()
             except Exception:
                 pass  # ignore
             self._connection = None
 
+    def _statement_cache(self):
+        """ Get the prepared statements of the current connection.
+
+        :rtype: _StatementCache or None, if disabled
+        """
+        if self._prepare_threshold is None:
+            return None
+        connection = self._connection
+        cache = self._statement_caches.get(connection)
+        if cache is None:
+            with self._statement_caches_lock:
+                cache = self._statement_caches.setdefault(
+                    connection,
+                    _StatementCache(
+                        self._prepare_threshold, self._prepared_statements))
+        return cache
+
+    def _execute_statement(self, cursor, sql, params):
+        """ Execute sql, as prepared statement if it was executed often
+        enough.
+
+        Statements are only prepared outside of transactions, since a failing
+        PREPARE aborts the transaction. For the same reason a statement which
+        failed because the prepared statement is outdated is only executed
+        again, without preparing it, outside of transactions.
+        """
+        cache = self._statement_cache()
+        if cache is not None:
+            autocommit = self._connection.autocommit
+            execute_sql = cache.lookup(cursor, sql, params, autocommit)
+            if execute_sql is not None:
+                try:
+                    cursor.execute(execute_sql, params)
+                    return
+                except PGOperationalError:
+                    raise  # the connection and its statements are gone
+                except PGError as error:
+                    # Other errors (like a unique violation) are caused by
+                    # the values, the statement stays prepared.
+                    if error.pgcode not in _PREPARED_STATEMENT_ERRORS:
+                        raise
+                    cache.discard(cursor, sql, autocommit)
+                    if not autocommit:
+                        raise
+        cursor.execute(sql, params)
+
     @DB.connected
     def execute(self, sql, params, return_function=None):
         with self._connection.cursor() as cursor:
-            cursor.execute(sql, params)
+            self._execute_statement(cursor, sql, params)
             if return_function:
                 return return_function(cursor)
 
     @DB.connected
     def nonclosing_execute(self, sql, params, return_function=None):
         cursor = self._connection.cursor()
-        cursor.execute(sql, params)
+        try:
+            self._execute_statement(cursor, sql, params)
+        except Exception:
+            cursor.close()
+            raise
         return cursor
 
+    @DB.connected
+    def executemany(  # pylint: disable=too-many-arguments
+            self, sql, seq_of_params, return_function=None, page_size=None,
+            count_rows=False):
+        """ Statements with a single "VALUES %s" placeholder are executed with
+        execute_values, one statement per page, all others with
+        execute_batch.
+
+        execute_batch sends several statements per round trip of which only
+        the row count of the last one is known, therefore the row count is
+        -1 (unknown) for those. With count_rows the cursor executemany is
+        used instead, which executes one statement per round trip and adds
+        up their row counts.
+        """
+        page_size = page_size or _PAGE_SIZE
+        connection = self._connection
+        own_transaction = connection.autocommit
+        if own_transaction:
+            connection.autocommit = False
+        try:
+            with connection.cursor() as cursor:
+                rowcount = 0
+                for page in _pages(seq_of_params, page_size):
+                    if _VALUES_TEMPLATE.search(sql):
+                        execute_values(cursor, sql, page, page_size=page_size)
+                        rowcount += cursor.rowcount
+                    elif count_rows:
+                        cursor.executemany(sql, page)
+                        rowcount += cursor.rowcount
+                    else:
+                        execute_batch(cursor, sql, page, page_size=page_size)
+                        rowcount = -1
+                result = None
+                if return_function:
+                    result = return_function(_BatchCursor(cursor, rowcount))
+        except Exception:
+            if own_transaction:
+                self._end_own_transaction(connection, False)
+            raise
+        if own_transaction:
+            self._end_own_transaction(connection, True)
+        return result
+
+    @DB.connected
+    def copy_expert(  # pylint: disable=too-many-arguments
+            self, sql, params, file, return_function=None,
+            size=_COPY_BUFFER_SIZE):
+        """ Execute a COPY statement, reading from or writing to file.
+
+        :param params: merged into the SQL with mogrify, if given
+        """
+        with self._connection.cursor() as cursor:
+            if params:
+                sql = cursor.mogrify(sql, params).decode(
+                    self._connection.encoding)
+            cursor.copy_expert(sql, file, size)
+            if return_function:
+                return return_function(cursor)
+
+    def _named_cursor(self, itersize):
+        """ Create a server-side cursor. Those only exist inside a transaction,
+        so start one if none is in progress.
+
+        :return: the cursor and if a transaction was started for it
+        """
+        cursor = self._connection.cursor(
+            "dbquery_{}".format(next(_CURSOR_NAMES)))
+        if itersize is not None:
+            cursor.itersize = itersize
+        own_transaction = self._connection.autocommit
+        if own_transaction:
+            self._connection.autocommit = False
+        return cursor, own_transaction
+
+    @staticmethod
+    def _end_own_transaction(connection, commit):
+        """ End a transaction started by the DB for a single method call.
+
+        A failing roll back is ignored, since it only happens while another
+        error is being handled.
+        """
+        if connection.closed:
+            return  # nothing to end anymore
+        if commit:
+            connection.commit()
+        else:
+            try:
+                connection.rollback()
+            except Exception:
+                return  # ignore, the connection is broken anyway
+        connection.autocommit = True
+
+    @DB.connected
+    def server_side_execute(
+            self, sql, params, return_function=None, itersize=None):
+        connection = self._connection
+        cursor, own_transaction = self._named_cursor(itersize)
+        try:
+            with cursor:
+                cursor.execute(sql, params)
+                result = None
+                if return_function:
+                    result = return_function(cursor)
+        except Exception:
+            if own_transaction:
+                self._end_own_transaction(connection, False)
+            raise
+        if own_transaction:
+            self._end_own_transaction(connection, True)
+        return result
+
+    @DB.connected
+    def nonclosing_server_side_execute(
+            self, sql, params, return_function=None, itersize=None):
+        connection = self._connection
+        cursor, own_transaction = self._named_cursor(itersize)
+        try:
+            cursor.execute(sql, params)
+        except Exception:
+            cursor.close()
+            if own_transaction:
+                self._end_own_transaction(connection, False)
+            raise
+        if not own_transaction:
+            return cursor
+        return _ClosingCursor(
+            cursor, lambda: self._end_own_transaction(connection, True))
+
     @DB.connected
     def show(self, sql, params):
         with self._connection.cursor() as cursor:
             return cursor.mogrify(sql, params).decode(
                 self._connection.encoding)
 
+    def explain(self, sql, params):
+        """ Uses EXPLAIN, which does not execute the statement (no ANALYZE).
+        """
+        return self.read_execute(
+            "EXPLAIN {}".format(sql), params,
+            lambda cursor: "\n".join(row[0] for row in cursor.fetchall()))
+
+    def notify(self, channel, payload=None):
+        """ Send a notification to the listeners of the channel (NOTIFY).
+        Within a transaction it is only delivered on commit.
+
+        :type channel: str
+        :type payload: str
+        """
+        self.Query("SELECT pg_notify(%s, %s)")(channel, payload or "")
+
+    def invalidate(self, tables):
+        """ Also notify the invalidation_channel, if set. Within a
+        transaction the notification is sent after the commit, it is not sent
+        if the transaction is rolled back.
+        """
+        super(PostgresDB, self).invalidate(tables)
+        tags = table_tags(tables)
+        if self._invalidation_channel is not None and tags:
+            self.after_commit(partial(
+                self.notify, self._invalidation_channel,
+                ",".join(sorted(tags))))
+
     def NextVal(self, sequence):
         return _NextVal(self, sequence)
 
+    def CopyIn(  # pylint: disable=too-many-arguments
+            self, table, columns=None, copy_format="text", header=False,
+            size=_COPY_BUFFER_SIZE):
+        return CopyIn(self, table, columns, copy_format, header, size)
+
+    def CopyOut(  # pylint: disable=too-many-arguments
+            self, sql, copy_format="csv", header=False,
+            size=_COPY_BUFFER_SIZE):
+        return CopyOut(self, sql, copy_format, header, size)
+
     @DB.connected
     def _begin(self):
         self._connection.autocommit = False
@@ -85,3 +789,325 @@ class PostgresDB(DB):
             raise RuntimeError("Connection lost, can not roll back!")
         self._connection.rollback()
         self._connection.autocommit = True
+
+
+def _checked_out(f):
+    """ Run a PooledPostgresDB method with a pooled connection, unless the
+    current thread already holds one (transaction). Return the connection to
+    the pool afterwards.
+    """
+
+    @wraps(f)
+    def new_f(self, *args, **kwds):
+        # pylint: disable=protected-access
+        if self._connection is not None:
+            return f(self, *args, **kwds)
+        self._connect()
+        try:
+            result = f(self, *args, **kwds)
+        except self.OperationalError:
+            self._release(discard=True)
+            raise
+        except Exception:
+            self._release()
+            raise
+        self._release()
+        return result
+
+    return new_f
+
+
+def _checked_out_until_closed(f):
+    """ Like _checked_out, for methods returning an open cursor: keep the
+    connection checked out until the cursor gets closed.
+    """
+
+    @wraps(f)
+    def new_f(self, *args, **kwds):
+        # pylint: disable=protected-access
+        if self._connection is not None:
+            return f(self, *args, **kwds)
+        self._connect()
+        connection = self._connection
+        try:
+            cursor = f(self, *args, **kwds)
+        except self.OperationalError:
+            self._release(discard=True)
+            raise
+        except Exception:
+            self._release()
+            raise
+        # The cursor keeps the connection, hand it back when it gets closed.
+        self._connection = None
+        return _ClosingCursor(
+            cursor,
+            lambda: self._pool.put(connection, bool(connection.closed)))
+
+    return new_f
+
+
+class PooledPostgresDB(PostgresDB):
+    """ PostgreSQL DB class sharing a pool of psycopg2 connections between
+    threads.
+
+    Every execute checks a connection out of the pool and returns it
+    afterwards. A transaction (with db:) keeps its connection checked out
+    until the commit or roll back, so each thread has its own transaction
+    state. Cursors from nonclosing_execute (QueryCursor) keep their
+    connection until they get closed.
+
+    Takes the same connection parameters as PostgresDB.
+    """
+
+    _connection = ThreadLocalAttribute("_connection")
+    _transaction_level = ThreadLocalAttribute("_transaction_level")
+    _retry = ThreadLocalAttribute("_retry")
+    _orig_retry = ThreadLocalAttribute("_orig_retry")
+    _after_commit = ThreadLocalAttribute("_after_commit")
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self, dsn=None, retry=0, minconn=1, maxconn=10, timeout=None,
+            max_idle=None, **kwds):
+        """
+        :param minconn: Connections to keep open, even when idle.
+        :param maxconn: Maximum number of connections open at the same time.
+        :param timeout: Seconds to wait for a free connection before raising
+            PoolTimeoutError, None waits forever.
+        :param max_idle: Seconds after which idle connections above minconn
+            get closed, None keeps them open.
+        """
+        thread_local_state(self)
+        super(PooledPostgresDB, self).__init__(dsn=dsn, retry=retry, **kwds)
+        self._pool = ConnectionPool(
+            self._new_connection, minsize=minconn, maxsize=maxconn,
+            timeout=timeout, max_idle=max_idle)
+
+    @property
+    def pool(self):
+        return self._pool
+
+    def _connect(self):
+        if self._connection is not None:
+            raise RuntimeError("Connection still exists.")
+        self._connection = self._pool.get()
+
+    def _release(self, discard=False):
+        """ Give the connection of the current thread back to the pool.
+
+        :param discard: close the connection instead, because it is broken
+        """
+        connection = self._connection
+        if connection is not None:
+            self._connection = None
+            discard = discard or bool(connection.closed)
+            if discard:
+                self._statement_caches.pop(connection, None)
+            self._pool.put(connection, discard)
+
+    def close(self):
+        """ Close (discard) the connection the current thread holds, if any.
+
+        Use close_all to close the idle connections of the pool.
+        """
+        self._release(discard=True)
+
+    def close_all(self):
+        """ Close the connection of the current thread and all idle ones.
+        """
+        self.close()
+        self._pool.close()
+
+    execute = _checked_out(PostgresDB.execute)
+
+    show = _checked_out(PostgresDB.show)
+
+    nonclosing_execute = _checked_out_until_closed(
+        PostgresDB.nonclosing_execute)
+
+    executemany = _checked_out(PostgresDB.executemany)
+
+    copy_expert = _checked_out(PostgresDB.copy_expert)
+
+    server_side_execute = _checked_out(PostgresDB.server_side_execute)
+
+    nonclosing_server_side_execute = _checked_out_until_closed(
+        PostgresDB.nonclosing_server_side_execute)
+
+    def _commit(self):
+        try:
+            super(PooledPostgresDB, self)._commit()
+        except Exception:
+            self._release(discard=True)
+            raise
+        self._release()
+
+    def _rollback(self):
+        try:
+            super(PooledPostgresDB, self)._rollback()
+        except Exception:
+            self._release(discard=True)
+            raise
+        self._release()
+
+
+_LISTENER_RETRY_DELAY = 1.0  # seconds to wait before reconnecting
+
+
+def _quote_ident(name):
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+class PostgresListener(object):
+    """ Receives notifications (LISTEN) on a dedicated connection and calls
+    the callbacks registered for their channel with the payload.
+
+    Either call start to handle the notifications in a background thread or
+    add the listener (fileno) to your own select loop and call poll whenever
+    it is readable.
+
+    After a reconnect notifications might have been missed, therefore all
+    callbacks are called with None as payload then.
+    """
+
+    def __init__(self, dsn=None, timeout=1.0, **kwds):
+        """
+        Takes the same connection parameters as PostgresDB.
+
+        :param timeout: seconds the background thread waits for
+            notifications before checking if it should stop
+        """
+        self._kwds = kwds or {}
+        if dsn:
+            self._kwds["dsn"] = dsn
+        self._timeout = timeout
+        self._lock = Lock()
+        self._callbacks = {}  # channel -> [callback, ...]
+        self._connection = None
+        self._connected = False  # if there was a connection before
+        self._thread = None
+        self._stop = Event()
+
+    def add_callback(self, channel, callback):
+        """ Call callback(payload) for every notification on channel.
+
+        :type channel: str
+        :type callback: function(str or None)
+        """
+        with self._lock:
+            listen = channel not in self._callbacks
+            self._callbacks.setdefault(channel, []).append(callback)
+        if listen and self._connection is not None:
+            self._listen(channel)
+
+    def remove_callback(self, channel, callback):
+        with self._lock:
+            callbacks = self._callbacks.get(channel, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def _connect(self):
+        connection = connect(**self._kwds)
+        connection.set_session(autocommit=True)
+        self._connection = connection
+        with self._lock:
+            channels = list(self._callbacks)
+        for channel in channels:
+            self._listen(channel)
+        if self._connected:  # reconnected
+            for channel in channels:
+                self._dispatch(channel, None)
+        self._connected = True
+
+    def _listen(self, channel):
+        with self._connection.cursor() as cursor:
+            cursor.execute("LISTEN {}".format(_quote_ident(channel)))
+
+    def _close(self):
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass  # ignore
+
+    def fileno(self):
+        """ The file descriptor of the connection, for select.
+        """
+        if self._connection is None:
+            self._connect()
+        return self._connection.fileno()
+
+    def poll(self):
+        """ Read the received notifications and call their callbacks.
+        """
+        if self._connection is None:
+            self._connect()
+        self._connection.poll()
+        notifies = self._connection.notifies
+        while notifies:
+            notify = notifies.pop(0)
+            self._dispatch(notify.channel, notify.payload)
+
+    def _dispatch(self, channel, payload):
+        with self._lock:
+            callbacks = list(self._callbacks.get(channel, ()))
+        for callback in callbacks:
+            try:
+                callback(payload)
+            except Exception:
+                _LOG.exception(
+                    LogMsg("Notification callback for {} failed.", channel))
+
+    def start(self):
+        """ Connect and handle notifications in a background (daemon)
+        thread.
+        """
+        if self._thread is not None:
+            raise RuntimeError("Listener already started.")
+        if self._connection is None:
+            self._connect()
+        self._stop.clear()
+        self._thread = Thread(target=self._run, name="PostgresListener")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """ Stop the background thread and close the connection.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self._connection is None:
+                    self._connect()
+                if select([self._connection], [], [], self._timeout)[0]:
+                    self.poll()
+            except (PGOperationalError, EnvironmentError, ValueError):
+                # ValueError: select on a closed connection
+                if self._stop.is_set():
+                    break
+                _LOG.warning("Listener connection failed.", exc_info=True)
+                self._close()
+                self._stop.wait(_LISTENER_RETRY_DELAY)
+
+
+def invalidation_callback(cache):
+    """ Create a PostgresListener callback which invalidates the tables sent
+    by a PostgresDB with an invalidation_channel in the given result cache.
+    Clears the whole cache after a reconnect.
+
+    :type cache: dbquery.cache.ResultCache
+    """
+
+    def invalidate(payload):
+        if payload is None:
+            cache.clear()
+        else:
+            cache.invalidate(payload.split(","))
+
+    return invalidate
@@ -5,34 +5,81 @@ Simplify SQL execution, using a configured DB class.
 """
 from logging import getLogger
 from contextlib import contextmanager
+from functools import partial
+try:
+    from queue import Full
+    from queue import Queue
+except ImportError:  # Python 2
+    from Queue import Full
+    from Queue import Queue
+from threading import Event
+from threading import Lock
+from threading import Thread
+from time import sleep
+from .cache import _size
+from .cache import table_tags
+from .columnar import ColumnBuilder
+from .instrument import QueryEvent
+from .instrument import monotonic
 from .log_msg import LogMsg
+from .retry import OPEN
+from .retry import retry_policy
+from .row_formatter import prepare_row_formatter
+from .row_formatter import to_dict_formatter  # pylint: disable=unused-import
 
 
 _LOG = getLogger(__name__)
 
+_COLUMNS_ARRAYSIZE = 1000  # default rows per fetch for SelectColumns
 
-def to_dict_formatter(row, cursor):
-    """ Take a row and use the column names from cursor to turn the row into a
-    dictionary.
+_PREFETCH_POLL = 0.1  # seconds between checks if prefetching should stop
 
-    Note: converts column names to lower-case!
+_STREAM_ARRAYSIZE = 100  # default rows per fetch for SelectStream
 
-    :param row: one database row, sequence of column values
-    :type row: (value, ...)
-    :param cursor: the cursor which was used to make the query
-    :type cursor: DB-API cursor object
+
+def _prefetch(rowsets, size):
+    """ Iterate the rowsets, which get fetched in a background thread, up to
+    size rowsets ahead. Exceptions of the fetch are raised by the iteration.
     """
-    # Empty row? Return.
-    if not row:
-        return row
-    # No cursor? Raise runtime error.
-    if cursor is None or cursor.description is None:
-        raise RuntimeError("No DB-API cursor or description available.")
+    queue = Queue(size)
+    stop = Event()
+
+    def put(item):
+        """ Wait for space in the queue, unless stop is set.
+        """
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=_PREFETCH_POLL)
+                return True
+            except Full:
+                pass
+        return False
 
-    # Give each value the appropriate column name within in the resulting
-    # dictionary.
-    column_names = (d[0] for d in cursor.description)  # 0 is the name
-    return {name: value for value, name in zip(row, column_names)}
+    def fetch():
+        try:
+            for rowset in rowsets:
+                if not put((rowset, None)):
+                    return
+        except Exception as error:  # pylint: disable=broad-except
+            put((None, error))
+            return
+        put((None, None))  # done
+
+    thread = Thread(target=fetch, name="SelectIterator prefetch")
+    thread.daemon = True
+    thread.start()
+    try:
+        while 1:
+            rowset, error = queue.get()
+            if error is not None:
+                raise error
+            if rowset is None:
+                return
+            yield rowset
+    finally:
+        # Stop fetching, before the cursor gets closed.
+        stop.set()
+        thread.join()
 
 
 class Query(object):
@@ -84,31 +131,98 @@ class Query(object):
         params = args
         if not params:
             params = kwds  # pylint: disable=redefined-variable-type
+        return self._execute(self._execute_function, params)
 
+    def _execute(self, execute_function, params, many=False):
+        """ Call the execute function with the SQL, params and the
+        _produce_return function, reporting to the DB instrumentation, if
+        any.
+
+        :param many: params is a sequence of parameter sets
+        :type many: bool
+        :rtype: Result of the _produce_return call.
+        """
+        instrumentation = self._db.instrumentation
+        if instrumentation is None:
+            return self._execute_retrying(
+                execute_function, params, self._produce_return)
+        event = QueryEvent(self._db, self._sql, params, many)
+        instrumentation.before_query(event)
+        try:
+            result = self._execute_retrying(
+                execute_function, params, event.wrap(self._produce_return),
+                event)
+        except Exception as error:
+            event.finish(error)
+            instrumentation.after_query(event)
+            raise
+        event.finish()
+        instrumentation.after_query(event)
+        return result
+
+    def _execute_retrying(
+            self, execute_function, params, produce_return, event=None):
+        """ Call the execute function, retry on an OperationalError as the
+        retry policy of the DB allows. Raises CircuitOpenError if the circuit
+        breaker of the DB does not allow the query.
+        """
+        policy = retry_policy(self._db.retry)
+        breaker = self._db.circuit_breaker
+        start = monotonic()
         # Try to execute the SQL through the slected connection.
         # If the connection is down try several times to open a new one.
         retry_count = 1
         while 1:  # either return or raise
+            if breaker is not None:
+                self._circuit_state(breaker.before())
             try:
                 # Execute and return.
-                return self._execute_function(
-                    self._sql, params, self._produce_return)
-            except self._db.OperationalError:
+                result = execute_function(self._sql, params, produce_return)
+            except self._db.OperationalError as error:
                 # Usually means a connection problem, log and try to connect
                 # again.
-                if retry_count < self._db.retry:
-                    _LOG.warning(
-                        LogMsg(
-                            "DB connection {} failed (retry {}).",
-                            self._db, retry_count),
-                        exc_info=1)
-                    retry_count += 1
-                    # Make sure that a new connection is established by closing
-                    # the current (damaged or closed) one.
-                    self._db.close()
-                else:
+                delay = None
+                if breaker is not None and not self._db.failing_over:
+                    self._circuit_state(breaker.failed())
+                if breaker is None or breaker.state != OPEN:
+                    delay = policy.delay(retry_count, monotonic() - start)
+                if delay is None:
                     # No (more) retry, raise the exception.
                     raise
+                _LOG.warning(
+                    LogMsg(
+                        "DB connection {} failed (retry {}).",
+                        self._db, retry_count),
+                    exc_info=1)
+                retry_count += 1
+                if event is not None:
+                    event.retries += 1
+                    self._db.instrumentation.retry(event, error)
+                # Make sure that a new connection is established by closing
+                # the current (damaged or closed) one.
+                self._db.close()
+                if delay:
+                    sleep(delay)
+            except Exception:
+                # The database did respond.
+                if breaker is not None:
+                    self._circuit_state(breaker.succeeded())
+                raise
+            else:
+                if breaker is not None:
+                    self._circuit_state(breaker.succeeded())
+                policy.succeeded()
+                return result
+
+    def _circuit_state(self, state):
+        """ Report a state change of the circuit breaker.
+        """
+        if state is not None:
+            _LOG.warning(
+                LogMsg("Circuit breaker of {} {}.", self._db, state))
+            instrumentation = self._db.instrumentation
+            if instrumentation is not None:
+                instrumentation.circuit_state(self._db, state)
 
     def show(self, *args, **kwds):
         """ Show how the SQL looks like when executed by the DB.
@@ -129,10 +243,20 @@ class QueryCursor(Query):
     """ Use when you need access to the cursor. Ensures closing.
     """
 
-    def __init__(self, db, sql):
+    def __init__(self, db, sql, itersize=None):
+        """
+        :param itersize: Use a server-side cursor which transfers this many
+            rows per round trip when iterating over it, None uses a normal
+            (client-side) cursor.
+        :type itersize: integer
+        """
         super(QueryCursor, self).__init__(db, sql)
         # Since we close cursor in __call__.
-        self._execute_function = self._db.nonclosing_execute
+        if itersize is None:
+            self._execute_function = self._db.nonclosing_execute
+        else:
+            self._execute_function = partial(
+                self._db.nonclosing_server_side_execute, itersize=itersize)
 
     @contextmanager
     def __call__(self, *args, **kwds):
@@ -157,18 +281,95 @@ class Select(Query):
     Performs a DB-API fetchall and returns its row list when called.
 
     If a row formatter is provided each row will be passed through it first and
-    a generator instead of a sequence will be returned.
+    an iterator instead of a sequence will be returned.
+
+    With cache_ttl set results are kept in the DB result_cache for cache_ttl
+    seconds, per parameter set. Within a transaction the cache is neither
+    used nor filled. Cached rows are shared between calls, do not change
+    them. Cached results are removed when a Manipulation writing to one of
+    the tables the Select reads is executed (or its transaction committed).
+
+    With single_flight set concurrent calls with the same parameters (of any
+    Select of the DB with the same SQL) share one execution, outside of
+    transactions. The rows are shared as well.
     """
 
-    def __init__(self, db, sql, row_formatter):
+    def __init__(  # pylint: disable=too-many-arguments
+            self, db, sql, row_formatter, cache_ttl=None, tables=None,
+            single_flight=False):
         """
         :param row_formatter: function that 'formats' a row, for example into
-            a dictionary. take to_dict_formatter as an example if you want to
-            implement your own.
-        :type row_formatter: function(tuple, Select) -> tuple
+            a dictionary, or an object with a prepare function, see
+            dbquery.row_formatter.
+        :type row_formatter: function(tuple, cursor) -> tuple
+        :param cache_ttl: seconds to cache results, None: do not cache
+        :type cache_ttl: float
+        :param tables: the tables the query reads, for invalidating cached
+            results
+        :type tables: str or [str, ...]
+        :param single_flight: share the execution with concurrent calls
+        :type single_flight: bool
         """
         super(Select, self).__init__(db, sql)
         self._row_formatter = row_formatter
+        self._cache_ttl = cache_ttl
+        self._single_flight = single_flight
+        self._tables = table_tags(tables)
+        self._execute_function = self._db.read_execute
+
+    def _cache_key(self, params):
+        """
+        :return: the result cache key or None, if params are not hashable
+        """
+        if isinstance(params, dict):
+            params = tuple(sorted(params.items()))
+        key = (type(self), self._sql, self._row_formatter, params)
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def _execute(self, execute_function, params, many=False):
+        """ Use the result cache and single flight, if enabled and not within
+        a transaction.
+        """
+        key = None
+        if ((self._cache_ttl is not None or self._single_flight) and
+                not self._db.in_transaction):
+            key = self._cache_key(params)
+        if key is None:
+            return super(Select, self)._execute(
+                execute_function, params, many)
+        if self._cache_ttl is not None:
+            found, result = self._db.result_cache.get(key)
+            if found:
+                return self._copy_result(result)
+        load = partial(self._load, execute_function, params, key)
+        if self._single_flight:
+            result = self._db.single_flight.do(key, load)
+        else:
+            result = load()
+        return self._copy_result(result)
+
+    def _load(self, execute_function, params, key):
+        """ Execute the query and cache the result, if enabled.
+        """
+        cache = self._db.result_cache
+        generation = None
+        if self._cache_ttl is not None:
+            generation = cache.generation(self._tables)
+        result = self._copy_result(
+            super(Select, self)._execute(execute_function, params))
+        if self._cache_ttl is not None:
+            cache.put(key, result, self._cache_ttl, self._tables, generation)
+        return result
+
+    def _copy_result(self, result):  # pylint: disable=no-self-use
+        """ Copy a result for the cache, also turns the row formatter
+        iterator into a list.
+        """
+        return list(result)
 
     def _produce_return(self, cursor):
         """ Get the rows from the cursor and apply the row formatter.
@@ -178,9 +379,10 @@ class Select(Query):
         """
         results = cursor.fetchall()
 
-        # Format rows within a generator?
+        # Format rows within an iterator?
         if self._row_formatter is not None:
-            return (self._row_formatter(r, cursor) for r in results)
+            return map(
+                prepare_row_formatter(self._row_formatter, cursor), results)
 
         return results
 
@@ -192,6 +394,9 @@ class SelectOne(Select):
     If the query returns something other than one row the call returns None.
     """
 
+    def _copy_result(self, result):
+        return result
+
     def _produce_return(self, cursor):
         """ Return the one result.
         """
@@ -202,13 +407,191 @@ class SelectOne(Select):
         # Return the one row, or the one column.
         row = results[0]
         if self._row_formatter is not None:
-            row = self._row_formatter(row, cursor)
+            row = prepare_row_formatter(self._row_formatter, cursor)(row)
         elif len(row) == 1:
             row = row[0]
 
         return row
 
 
+def _column_names(cursor):
+    return tuple(d[0] for d in cursor.description)  # 0 is the name
+
+
+class SelectColumns(Select):
+    """ Returns the result column by column, as an OrderedDict of column name
+    and sequence of values.
+
+    Rows are fetched in blocks of arraysize rows and added to the columns,
+    so that the result is never held as row tuples. Integer and float columns
+    are stored in array.array instances (or NumPy arrays with use_numpy),
+    all others in lists.
+    """
+
+    def __init__(self, db, sql, arraysize=None, use_numpy=False):
+        """
+        :param arraysize: rows per fetch
+        :type arraysize: integer
+        :param use_numpy: return numeric columns as NumPy arrays
+        :type use_numpy: bool
+        """
+        super(SelectColumns, self).__init__(db, sql, None)
+        self._arraysize = arraysize or _COLUMNS_ARRAYSIZE
+        self._use_numpy = use_numpy
+
+    def _produce_return(self, cursor):
+        """
+        :rtype: OrderedDict
+        """
+        rowset = cursor.fetchmany(self._arraysize)
+        if cursor.description is None:
+            return None  # not a query returning rows
+        builder = ColumnBuilder(_column_names(cursor), self._use_numpy)
+        while rowset:
+            builder.add(rowset)
+            rowset = cursor.fetchmany(self._arraysize)
+        return builder.columns()
+
+
+class AdaptiveArraysize(object):
+    """ An arraysize for SelectIterator which adapts to the measured fetch
+    time and row size.
+
+    The next arraysize is chosen so that a fetch takes about target_time
+    seconds and, with max_bytes set, the rows of a block take up to about
+    max_bytes (estimated with sys.getsizeof). It grows by at most factor 2
+    per fetch, but shrinks immediately.
+
+    Use one instance per SelectIterator, it keeps adapting over all calls.
+    """
+
+    _WEIGHT = 0.3  # of a new measurement in the moving averages
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self, target_time=0.1, max_bytes=None, initial=100, minimum=1,
+            maximum=100000):
+        """
+        :param target_time: seconds a fetch should take
+        :type target_time: float
+        :param max_bytes: (estimated) memory for the rows of a block, None:
+            no limit
+        :type max_bytes: int
+        :param initial: arraysize of the first fetch
+        :param minimum: smallest arraysize
+        :param maximum: largest arraysize
+        """
+        self._target_time = target_time
+        self._max_bytes = max_bytes
+        self._minimum = minimum
+        self._maximum = maximum
+        self._lock = Lock()
+        self.arraysize = max(minimum, min(initial, maximum))
+        self._fetches = 0
+        self._rows = 0
+        self._seconds_per_row = None
+        self._bytes_per_row = None
+        self._smallest = self._largest = self.arraysize
+
+    def _average(self, average, value):
+        if average is None:
+            return value
+        return average + self._WEIGHT * (value - average)
+
+    def record(self, rowset, seconds):
+        """ Record a fetch and choose the next arraysize.
+
+        :param rowset: the fetched rows
+        :param seconds: time the fetch took
+        """
+        if not rowset:
+            return
+        rows = len(rowset)
+        row_bytes = None
+        if self._max_bytes is not None:
+            row_bytes = _size(rowset[0])  # the first row as sample
+        with self._lock:
+            self._fetches += 1
+            self._rows += rows
+            self._seconds_per_row = self._average(
+                self._seconds_per_row, seconds / rows)
+            if row_bytes is not None:
+                self._bytes_per_row = self._average(
+                    self._bytes_per_row, row_bytes)
+            arraysize = self._maximum
+            if self._seconds_per_row > 0:
+                arraysize = self._target_time / self._seconds_per_row
+            if self._bytes_per_row:
+                arraysize = min(
+                    arraysize, self._max_bytes / self._bytes_per_row)
+            arraysize = int(min(arraysize, 2 * self.arraysize))
+            self.arraysize = max(self._minimum, min(arraysize, self._maximum))
+            self._smallest = min(self._smallest, self.arraysize)
+            self._largest = max(self._largest, self.arraysize)
+
+    def stats(self):
+        """
+        :return: {"arraysize", "smallest", "largest", "fetches", "rows",
+            "seconds_per_row", "bytes_per_row"}, the arraysize for the next
+            fetch, the smallest and largest chosen so far and the moving
+            averages (None before the first fetch)
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                "arraysize": self.arraysize,
+                "smallest": self._smallest,
+                "largest": self._largest,
+                "fetches": self._fetches,
+                "rows": self._rows,
+                "seconds_per_row": self._seconds_per_row,
+                "bytes_per_row": self._bytes_per_row}
+
+
+def _arraysize(arraysize, default):
+    """ Check the arraysize parameter of a query.
+    """
+    if isinstance(arraysize, AdaptiveArraysize):
+        return arraysize
+    if arraysize is not None and arraysize > 0:
+        return arraysize
+    return default
+
+
+def _rowsets(cursor, arraysize):
+    """ Yields the blocks of arraysize rows fetched from the cursor.
+
+    :type arraysize: int or AdaptiveArraysize
+    """
+    adaptive = isinstance(arraysize, AdaptiveArraysize)
+    while 1:
+        if adaptive:
+            start = monotonic()
+            rowset = cursor.fetchmany(arraysize.arraysize)
+            if rowset:
+                arraysize.record(rowset, monotonic() - start)
+        else:
+            rowset = cursor.fetchmany(arraysize)
+        if not rowset:
+            return
+        yield rowset
+
+
+def _rows(rowsets, cursor, row_formatter):
+    """ Yields the rows of the rowsets, formatted if there is a row
+    formatter.
+    """
+    format_row = None
+    for rowset in rowsets:
+        if row_formatter is not None:
+            if format_row is None:
+                # Prepare after the first fetch, server-side cursors only
+                # have a description from then on.
+                format_row = prepare_row_formatter(row_formatter, cursor)
+            rowset = map(format_row, rowset)
+        for row in rowset:
+            yield row
+
+
 class SelectIterator(Select):
     """ Takes a callback, optional callback arguments and arraysize.
     Calls callback once with a generator. The generator yields individual rows
@@ -216,57 +599,190 @@ class SelectIterator(Select):
     already processed inside generator.
 
     The arraysize parameter allows fetching data internally in optimal chunks
-    from db.
+    from db. Use an AdaptiveArraysize to let it adapt to the fetch time and
+    row size.
+
+    With itersize set a server-side cursor is used, so that only arraysize rows
+    at a time are held in memory, instead of the whole result.
+
+    With columnar set the generator yields the columns of each fetched block,
+    like SelectColumns returns them, instead of single rows.
+
+    With prefetch set the blocks are fetched in a background thread, up to
+    prefetch blocks ahead of the callback. This needs a connection which can
+    be used from another thread (not SQLiteDB, but PooledSQLiteDB).
 
     Callback needs to handle the row generator.
     """
 
     def __init__(  # pylint: disable=too-many-arguments
             self, db, sql, callback, cb_args=None, arraysize=None,
-            row_formatter=None):
+            row_formatter=None, itersize=None, columnar=False,
+            use_numpy=False, prefetch=None):
         """
-        :param row_formatter: function that 'formats' a row, for example into
-            a dictionary. take to_dict_formatter as an example if you want to
-            implement your own.
-        :type row_formatter: function(tuple, Select) -> tuple
+        :param row_formatter: function that 'formats' a row, see Select.
+        :type row_formatter: function(tuple, cursor) -> tuple
         :param callback: function that handles the row generator.
         :type callback: function(row_generator, cb_args),
         :param cb_args: Extra parameters for the callback.
         :type cb_args: [arg1, arg2, ...]
         :param arraysize: Max number of rows per rowset fetched internally from
             db.
-        :type arraysize: integer
+        :type arraysize: integer or AdaptiveArraysize
+        :param itersize: Use a server-side cursor, None uses a normal
+            (client-side) one. Also the default for arraysize.
+        :type itersize: integer
+        :param columnar: yield the columns of every block instead of rows
+        :type columnar: bool
+        :param use_numpy: columnar with NumPy arrays, see SelectColumns
+        :type use_numpy: bool
+        :param prefetch: number of blocks to fetch ahead in a background
+            thread, None: fetch when the callback needs the next block
+        :type prefetch: int
         """
         super(SelectIterator, self).__init__(db, sql, row_formatter)
+        if columnar and row_formatter is not None:
+            raise ValueError("A row formatter can not be used with columnar.")
+        self._columnar = columnar
+        self._use_numpy = use_numpy
+        self._prefetch = prefetch
 
-        if arraysize is not None and arraysize > 0:
-            self._arraysize = arraysize
-        else:
-            self._arraysize = 1  # same as psycopg2 default
+        if itersize is not None:
+            self._execute_function = partial(
+                self._db.server_side_execute, itersize=itersize)
+            if arraysize is None:
+                arraysize = itersize
+
+        self._arraysize = _arraysize(arraysize, 1)  # same as psycopg2
 
         self.callback = callback
         self.cb_args = cb_args or []
 
-    def _row_generator(self, cursor):
+    def _row_generator(self, rowsets, cursor):
         """ Yields individual rows until no more rows
         exist in query result. Applies row formatter if such exists.
         """
-        rowset = cursor.fetchmany(self._arraysize)
-        while rowset:
-            if self._row_formatter is not None:
-                rowset = (self._row_formatter(r, cursor) for r in rowset)
-            for row in rowset:
-                yield row
-            rowset = cursor.fetchmany(self._arraysize)
+        return _rows(rowsets, cursor, self._row_formatter)
+
+    def _column_generator(self, rowsets, cursor):
+        """ Yields the columns of every block of rows.
+        """
+        for rowset in rowsets:
+            builder = ColumnBuilder(_column_names(cursor), self._use_numpy)
+            builder.add(rowset)
+            yield builder.columns()
 
     def _produce_return(self, cursor):
         """ Calls callback once with generator.
             :rtype: None
         """
-        self.callback(self._row_generator(cursor), *self.cb_args)
+        rowsets = _rowsets(cursor, self._arraysize)
+        if self._prefetch:
+            rowsets = _prefetch(rowsets, self._prefetch)
+        if self._columnar:
+            generator = self._column_generator(rowsets, cursor)
+        else:
+            generator = self._row_generator(rowsets, cursor)
+        try:
+            self.callback(generator, *self.cb_args)
+        finally:
+            rowsets.close()  # stops prefetching, if the callback did not
         return None
 
 
+class RowStream(object):
+    """ Iterator over the rows of a SelectStream call, which holds its cursor
+    until all rows are read or close gets called.
+    """
+
+    def __init__(self, cursor, rows):
+        """
+        :param cursor: the cursor to close
+        :param rows: iterator over the rows of the cursor
+        """
+        self._cursor = cursor
+        self._rows = rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._cursor is None:
+            raise StopIteration()
+        try:
+            return next(self._rows)
+        except Exception:  # including StopIteration
+            self.close()
+            raise
+
+    next = __next__  # Python 2
+
+    @property
+    def closed(self):
+        return self._cursor is None
+
+    def close(self):
+        """ Close the cursor, which returns a pooled connection.
+        """
+        cursor, self._cursor = self._cursor, None
+        if cursor is not None:
+            try:
+                cursor.close()
+            except Exception:
+                _LOG.warning("Couldn't close cursor.", exc_info=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+
+class SelectStream(Query):
+    """ Returns a RowStream when called, an iterator which fetches the rows in
+    blocks of arraysize rows while it gets iterated.
+
+    The cursor, and the connection of a connection pool, are kept until all
+    rows are read, the RowStream gets closed or garbage collected. Close it
+    (or use it with "with") when not reading all rows.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self, db, sql, row_formatter=None, arraysize=None,
+            itersize=None):
+        """
+        :param row_formatter: function that 'formats' a row, see Select.
+        :type row_formatter: function(tuple, cursor) -> tuple
+        :param arraysize: rows per fetch
+        :type arraysize: integer or AdaptiveArraysize
+        :param itersize: Use a server-side cursor, None uses a normal
+            (client-side) one. Also the default for arraysize.
+        :type itersize: integer
+        """
+        super(SelectStream, self).__init__(db, sql)
+        self._row_formatter = row_formatter
+        if itersize is None:
+            self._execute_function = self._db.nonclosing_execute
+        else:
+            self._execute_function = partial(
+                self._db.nonclosing_server_side_execute, itersize=itersize)
+            if arraysize is None:
+                arraysize = itersize
+        self._arraysize = _arraysize(arraysize, _STREAM_ARRAYSIZE)
+
+    def __call__(self, *args, **kwds):
+        """
+        :rtype: RowStream
+        """
+        cursor = super(SelectStream, self).__call__(*args, **kwds)
+        rows = _rows(
+            _rowsets(cursor, self._arraysize), cursor, self._row_formatter)
+        return RowStream(cursor, rows)
+
+
 class ManipulationCheckError(Exception):
     """ Error marker for when a Manipulation call does not behave as expected.
     """
@@ -279,16 +795,32 @@ class Manipulation(Query):
 
     Can do an automatic row count check and raises ManipulationCheckError if
     the numbers don't match.
+
+    Use executemany to execute the query for many parameter sets at once.
+
+    With tables set the cached results of Selects reading one of those
+    tables are invalidated after each successful execution or, within a
+    transaction, after the commit.
     """
 
-    def __init__(self, db, sql, rowcount):
+    def __init__(self, db, sql, rowcount, tables=None):
         """
         :param rowcount: the expected row count for the query or None, if no
             check should be performed
         :type rowcount: int
+        :param tables: the tables the query writes
+        :type tables: str or [str, ...]
         """
         super(Manipulation, self).__init__(db, sql)
         self._rowcount = rowcount
+        self._tables = table_tags(tables)
+
+    def _execute(self, execute_function, params, many=False):
+        result = super(Manipulation, self)._execute(
+            execute_function, params, many)
+        if self._tables:
+            self._db.invalidate(self._tables)
+        return result
 
     def _produce_return(self, cursor):
         """ Return the rowcount property from the used cursor.
@@ -306,3 +838,28 @@ class Manipulation(Query):
                 "Count was {}, expected {}.".format(rowcount, self._rowcount))
 
         return rowcount
+
+    def executemany(self, seq_of_params, page_size=None):
+        """ Execute the SQL once for every parameter set, in as few round trips
+        as the DB allows and within one transaction.
+
+        The row count is the total of all executions and checked against the
+        expected rowcount, if one was given.
+
+        :param seq_of_params: parameter tuples or dictionaries
+        :type seq_of_params: iterable
+        :param page_size: parameter sets sent to the DB per round trip, None
+            uses the DB default
+        :type page_size: int
+        :rtype: int
+        """
+        # A one-shot iterator could not be executed again after a connection
+        # failure, keep its values for the retry.
+        if (retry_policy(self._db.retry).attempts > 1 and
+                iter(seq_of_params) is seq_of_params):
+            seq_of_params = list(seq_of_params)
+        return self._execute(
+            partial(
+                self._db.executemany, page_size=page_size,
+                count_rows=self._rowcount is not None),
+            seq_of_params, many=True)
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+""" Route reading queries to replicas of a primary database.
+"""
+from logging import getLogger
+from threading import Lock
+from threading import local
+
+from .db import DB
+from .db import _no_return
+from .instrument import monotonic
+from .log_msg import LogMsg
+
+
+_LOG = getLogger(__name__)
+
+# Replica selection strategies.
+ROUND_ROBIN = "round_robin"
+LEAST_LATENCY = "least_latency"
+
+_LATENCY_WEIGHT = 0.2  # of a new measurement in the latency average
+
+
+class _Replica(object):
+    """ A replica and its health state.
+    """
+
+    __slots__ = ("db", "down_until", "latency")
+
+    def __init__(self, db):
+        self.db = db
+        self.down_until = 0  # monotonic time until which it is not used
+        self.latency = None  # moving average of the query times, seconds
+
+
+class ReplicatedDB(DB):  # pylint: disable=abstract-method
+    """ Sends the queries of the Select classes (read_execute and
+    server_side_execute) to replicas, outside of transactions. All other
+    queries and everything within a transaction (with db:) go to the
+    primary.
+
+    A replica failing with an OperationalError is closed and not used for
+    down_time seconds, the retry of the query then goes to another replica
+    or, if none is left, to the primary. check_replicas tests all replicas
+    right away.
+
+    Replicas might lag behind the primary, a Select outside of a transaction
+    does not necessarily see the changes just made.
+
+    Attributes not defined here (like NextVal or CopyIn of a PostgresDB) are
+    taken from the primary.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self, primary, replicas, strategy=ROUND_ROBIN, down_time=30,
+            retry=None):
+        """
+        :param primary: DB for writing and transactions
+        :type primary: dbquery.db.DB
+        :param replicas: DBs for reading
+        :type replicas: [dbquery.db.DB, ...]
+        :param strategy: ROUND_ROBIN or LEAST_LATENCY (the replica with the
+            lowest average query time)
+        :param down_time: seconds a failed replica is not used
+        :type down_time: float
+        :param retry: attempts per query, None: enough to try every replica
+            and the primary once
+        :type retry: int
+        """
+        if strategy not in (ROUND_ROBIN, LEAST_LATENCY):
+            raise ValueError("Unknown strategy: {}.".format(strategy))
+        if retry is None:
+            retry = len(replicas) + 1
+        super(ReplicatedDB, self).__init__(retry)
+        self._primary = primary
+        self._replicas = [_Replica(db) for db in replicas]
+        self._strategy = strategy
+        self._down_time = down_time
+        self._lock = Lock()
+        self._next = 0  # round robin position
+        # replica_failed: the last query of the thread failed on a replica
+        self._local = local()
+        self.OperationalError = primary.OperationalError
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._primary, name)
+
+    @property
+    def primary(self):
+        return self._primary
+
+    @property
+    def retry(self):
+        # A transaction on the primary can not continue on another
+        # connection, the primary disables its retry then.
+        if self._primary.in_transaction:
+            return self._primary.retry
+        return self._retry
+
+    @property
+    def in_transaction(self):
+        return self._primary.in_transaction
+
+    @property
+    def failing_over(self):
+        return getattr(self._local, "replica_failed", False)
+
+    def _choose(self):
+        """ Get the replica for the next query, None if all are down.
+        """
+        now = monotonic()
+        with self._lock:
+            replicas = [r for r in self._replicas if r.down_until <= now]
+            if not replicas:
+                return None
+            if self._strategy == LEAST_LATENCY:
+                # Untested replicas first.
+                return min(replicas, key=lambda r: r.latency or 0)
+            self._next += 1
+            return replicas[self._next % len(replicas)]
+
+    def _succeeded(self, replica, seconds):
+        with self._lock:
+            replica.down_until = 0
+            if replica.latency is None:
+                replica.latency = seconds
+            else:
+                replica.latency += _LATENCY_WEIGHT * (
+                    seconds - replica.latency)
+
+    def _failed(self, replica):
+        _LOG.warning(
+            LogMsg("Replica {} failed.", replica.db), exc_info=True)
+        with self._lock:
+            replica.down_until = monotonic() + self._down_time
+        try:
+            replica.db.close()
+        except Exception:
+            _LOG.warning("Couldn't close replica.", exc_info=True)
+
+    def _read(self, name, *args, **kwds):
+        """ Call the execute function of the given name on a replica, if not
+        within a transaction and one is available, otherwise on the primary.
+        """
+        self._local.replica_failed = False
+        replica = None
+        if not self.in_transaction:
+            replica = self._choose()
+        if replica is None:
+            return getattr(self._primary, name)(*args, **kwds)
+        start = monotonic()
+        try:
+            result = getattr(replica.db, name)(*args, **kwds)
+        except replica.db.OperationalError:
+            self._failed(replica)
+            self._local.replica_failed = True
+            raise
+        self._succeeded(replica, monotonic() - start)
+        return result
+
+    def read_execute(self, sql, params, produce_return):
+        return self._read("read_execute", sql, params, produce_return)
+
+    def server_side_execute(
+            self, sql, params, produce_return, itersize=None):
+        return self._read(
+            "server_side_execute", sql, params, produce_return,
+            itersize=itersize)
+
+    def check_replicas(self):
+        """ Execute a test query on every replica and update its state.
+
+        :return: see status
+        """
+        for replica in self._replicas:
+            start = monotonic()
+            try:
+                replica.db.execute("SELECT 1", (), _no_return)
+            except replica.db.OperationalError:
+                self._failed(replica)
+            else:
+                self._succeeded(replica, monotonic() - start)
+        return self.status()
+
+    def status(self):
+        """
+        :return: per replica: if it is used (not down) and its average query
+            time in seconds (None if not used yet)
+        :rtype: [(dbquery.db.DB, bool, float), ...]
+        """
+        now = monotonic()
+        with self._lock:
+            return [
+                (r.db, r.down_until <= now, r.latency)
+                for r in self._replicas]
+
+    def execute(self, sql, params, produce_return):
+        self._local.replica_failed = False
+        return self._primary.execute(sql, params, produce_return)
+
+    def nonclosing_execute(self, sql, params, return_function=None):
+        return self._primary.nonclosing_execute(sql, params, return_function)
+
+    def executemany(  # pylint: disable=too-many-arguments
+            self, sql, seq_of_params, produce_return, page_size=None,
+            count_rows=False):
+        return self._primary.executemany(
+            sql, seq_of_params, produce_return, page_size, count_rows)
+
+    def nonclosing_server_side_execute(
+            self, sql, params, return_function=None, itersize=None):
+        return self._primary.nonclosing_server_side_execute(
+            sql, params, return_function, itersize)
+
+    def close(self):
+        """ Close the connection of the primary, unless the last query of the
+        thread failed on a replica, which got closed already.
+        """
+        if getattr(self._local, "replica_failed", False):
+            self._local.replica_failed = False
+            return
+        self._primary.close()
+
+    def close_all(self):
+        """ Close the connections of the primary and all replicas.
+        """
+        for db in [self._primary] + [r.db for r in self._replicas]:
+            getattr(db, "close_all", db.close)()
+
+    def show(self, sql, params):
+        return self._primary.show(sql, params)
+
+    def explain(self, sql, params):
+        return self._primary.explain(sql, params)
+
+    def __enter__(self):
+        self._primary.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self._primary.__exit__(exc_type, exc_value, traceback)
+
+    def after_commit(self, callback):
+        self._primary.after_commit(callback)
+
+    def invalidate(self, tables):
+        """ Invalidate the own result_cache and the primary, which for
+        example notifies the invalidation_channel of a PostgresDB.
+        """
+        super(ReplicatedDB, self).invalidate(tables)
+        self._primary.invalidate(tables)
+
+    def abort_transaction(self):
+        self._primary.abort_transaction()
+
+    def savepoint(self):
+        return self._primary.savepoint()
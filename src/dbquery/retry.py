@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+""" Retry policies for queries failing with an OperationalError.
+
+The retry of a DB is either the number of attempts per query, retried right
+away, or a RetryPolicy which waits between the attempts.
+
+A CircuitBreaker set on a DB stops the queries from waiting for a database
+which is down.
+"""
+from random import uniform
+from threading import Lock
+
+from .instrument import monotonic
+
+
+class RetryBudget(object):
+    """ Limits the retries of all queries sharing the budget (like all
+    threads using a DB), so that an outage does not multiply the load on the
+    database with retries.
+
+    Every retry takes a token. Tokens are added by successful queries (ratio
+    per query) and over time (min_per_second), up to max_tokens.
+    """
+
+    def __init__(self, ratio=0.1, min_per_second=10, max_tokens=100):
+        """
+        :param ratio: tokens added per successful query
+        :type ratio: float
+        :param min_per_second: tokens added per second
+        :type min_per_second: float
+        :param max_tokens: maximum and initial number of tokens
+        :type max_tokens: float
+        """
+        self._ratio = ratio
+        self._rate = min_per_second
+        self._max_tokens = float(max_tokens)
+        self._tokens = self._max_tokens
+        self._last = monotonic()
+        self._lock = Lock()
+
+    @property
+    def tokens(self):
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def _refill(self):
+        """ Add the tokens for the time passed, call with the lock held.
+        """
+        now = monotonic()
+        self._tokens = min(
+            self._max_tokens, self._tokens + (now - self._last) * self._rate)
+        self._last = now
+
+    def deposit(self):
+        """ Add the tokens for a successful query.
+        """
+        with self._lock:
+            self._tokens = min(self._max_tokens, self._tokens + self._ratio)
+
+    def withdraw(self):
+        """ Take a token for a retry.
+
+        :return: if there was a token left
+        :rtype: bool
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class RetryPolicy(object):
+    """ Retries a query up to attempts times in total, waiting with
+    exponential backoff and full jitter in between: before the n-th retry a
+    random time between 0 and min(max_delay, base_delay * 2 ** (n - 1))
+    seconds. This spreads the reconnects of many threads and processes after
+    an outage.
+
+    Optionally gives up once max_elapsed seconds have passed since the first
+    attempt or if the RetryBudget has no tokens left.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self, attempts=5, base_delay=0.05, max_delay=5.0,
+            max_elapsed=None, budget=None):
+        """
+        :param attempts: maximum number of attempts per query
+        :type attempts: int
+        :param base_delay: maximum seconds to wait before the first retry
+        :type base_delay: float
+        :param max_delay: maximum seconds to wait before any retry
+        :type max_delay: float
+        :param max_elapsed: seconds after the first attempt after which no
+            more retries are made, None: no limit
+        :type max_elapsed: float
+        :param budget: shared limit of the retries, None: no limit
+        :type budget: RetryBudget
+        """
+        self.attempts = attempts
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._max_elapsed = max_elapsed
+        self.budget = budget
+
+    def delay(self, attempt, elapsed):
+        """ Decide if a failed attempt is retried.
+
+        :param attempt: the number of the failed attempt, starting with 1
+        :param elapsed: seconds since the first attempt started
+        :return: seconds to wait before the retry, None: do not retry
+        :rtype: float
+        """
+        if attempt >= self.attempts:
+            return None
+        delay = 0
+        if self._base_delay:
+            delay = uniform(0, min(
+                self._max_delay, self._base_delay * 2 ** (attempt - 1)))
+        if (self._max_elapsed is not None and
+                elapsed + delay > self._max_elapsed):
+            return None
+        if self.budget is not None and not self.budget.withdraw():
+            return None
+        return delay
+
+    def succeeded(self):
+        """ Called after a successful query.
+        """
+        if self.budget is not None:
+            self.budget.deposit()
+
+
+_immediate_policies = {}  # attempts -> RetryPolicy without delay
+
+
+def retry_policy(retry):
+    """ Get the RetryPolicy for the retry of a DB.
+
+    :type retry: int or RetryPolicy
+    :rtype: RetryPolicy
+    """
+    if isinstance(retry, RetryPolicy):
+        return retry
+    policy = _immediate_policies.get(retry)
+    if policy is None:
+        policy = RetryPolicy(attempts=retry, base_delay=0)
+        _immediate_policies[retry] = policy
+    return policy
+
+
+# Circuit breaker states.
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """ Raised instead of executing a query while a circuit breaker is open.
+    """
+
+
+class CircuitBreaker(object):
+    """ Counts the consecutive OperationalErrors of the queries of a DB.
+
+    After failure_threshold of them it opens: for reset_timeout seconds
+    queries fail right away with a CircuitOpenError. Then it is half open and
+    lets one query through as probe. If it succeeds the breaker closes again,
+    if it fails the breaker opens again. The next probe is allowed if a probe
+    did not finish within reset_timeout seconds.
+
+    The functions return the new state on a state change, None otherwise.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        """
+        :param failure_threshold: consecutive failures which open the breaker
+        :type failure_threshold: int
+        :param reset_timeout: seconds until a probe query is allowed
+        :type reset_timeout: float
+        """
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._lock = Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._since = None  # monotonic time of opening or of the probe
+
+    @property
+    def state(self):
+        return self._state
+
+    def before(self):
+        """ Called before a query gets executed.
+
+        :raises CircuitOpenError: if the query is not allowed
+        """
+        if self._state == CLOSED:
+            return None
+        with self._lock:
+            state = self._state
+            if state == CLOSED:
+                return None
+            if monotonic() - self._since < self._reset_timeout:
+                raise CircuitOpenError(
+                    "Circuit breaker {}.".format(state.replace("_", " ")))
+            # Let a probe through.
+            self._since = monotonic()
+            if state == OPEN:
+                self._state = HALF_OPEN
+                return HALF_OPEN
+            return None
+
+    def succeeded(self):
+        """ Called when the database responded.
+        """
+        if self._state == CLOSED and not self._failures:
+            return None
+        with self._lock:
+            self._failures = 0
+            if self._state == CLOSED:
+                return None
+            self._state = CLOSED
+            self._since = None
+            return CLOSED
+
+    def failed(self):
+        """ Called when a query failed with an OperationalError.
+        """
+        with self._lock:
+            self._failures += 1
+            if self._state == OPEN or (
+                    self._state == CLOSED and
+                    self._failures < self._failure_threshold):
+                return None
+            self._state = OPEN
+            self._since = monotonic()
+            return OPEN
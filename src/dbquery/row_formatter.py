@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+""" Row formatters.
+
+A row formatter is either a function(row, cursor) -> row, called for every
+row, or an object with a prepare function. prepare gets called once per
+query execution with the cursor description and returns a function(row) ->
+row. This way the work depending on the columns (like getting their names) is
+done once and not for every row.
+
+The formatters in this module implement both.
+"""
+from collections import namedtuple
+from keyword import iskeyword
+
+
+def prepare_row_formatter(row_formatter, cursor):
+    """ Get a function(row) -> row for the given row formatter and cursor.
+    """
+    prepare = getattr(row_formatter, "prepare", None)
+    if prepare is not None:
+        return prepare(cursor.description)
+    return lambda row: row_formatter(row, cursor)
+
+
+def _no_description(row):
+    """ Row function used when there is no cursor description, like for
+    queries which do not return rows. Only empty rows can be formatted.
+    """
+    if not row:
+        return row
+    raise RuntimeError("No DB-API cursor or description available.")
+
+
+class RowFormatter(object):
+    """ Base class for row formatters using the column names.
+
+    Implement _prepare_names.
+    """
+
+    def _prepare_names(self, names):
+        """ Create the function formatting a row.
+
+        :param names: column names, in the order of the row values
+        :type names: (str, ...)
+        :rtype: function(row) -> row
+        """
+        raise NotImplementedError()
+
+    def prepare(self, description):
+        """
+        :param description: DB-API cursor description
+        :rtype: function(row) -> row
+        """
+        if description is None:
+            return _no_description
+        return self._prepare_names(tuple(d[0] for d in description))
+
+    def __call__(self, row, cursor):
+        """ Format a single row, for use as a plain row formatter function.
+
+        Prefer prepare when formatting many rows.
+        """
+        # Empty row? Return.
+        if not row:
+            return row
+        # No cursor? Raise runtime error.
+        if cursor is None or cursor.description is None:
+            raise RuntimeError("No DB-API cursor or description available.")
+        return self.prepare(cursor.description)(row)
+
+
+class DictFormatter(RowFormatter):
+    """ Turns a row into a dictionary, using the column names as keys.
+    """
+
+    def _prepare_names(self, names):
+
+        def format_row(row):
+            if not row:
+                return row
+            return dict(zip(names, row))
+
+        return format_row
+
+
+class NamedTupleFormatter(RowFormatter):
+    """ Turns a row into a namedtuple, with the column names as field names.
+
+    The namedtuple class is created once for every set of column names. Column
+    names which are no valid field names get replaced by _<index>.
+    """
+
+    def __init__(self, typename="Row"):
+        self._typename = typename
+        self._classes = {}  # column names -> namedtuple class
+
+    def row_class(self, names):
+        row_class = self._classes.get(names)
+        if row_class is None:
+            row_class = namedtuple(self._typename, names, rename=True)
+            self._classes[names] = row_class
+        return row_class
+
+    def _prepare_names(self, names):
+        make = self.row_class(names)._make
+
+        def format_row(row):
+            if not row:
+                return row
+            return make(row)
+
+        return format_row
+
+
+class _Record(object):
+    """ Base class for the records created by RecordFormatter.
+    """
+
+    __slots__ = ()
+
+    def __iter__(self):
+        return (getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and tuple(self) == tuple(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None  # mutable
+
+    def __repr__(self):
+        return "{}({})".format(
+            type(self).__name__,
+            ", ".join(
+                "{}={!r}".format(name, getattr(self, name))
+                for name in self.__slots__))
+
+
+class RecordFormatter(NamedTupleFormatter):
+    """ Turns a row into a mutable record, an object with one attribute per
+    column which uses __slots__ instead of a __dict__ to save memory.
+
+    Column names need to be valid Python identifiers.
+    """
+
+    def row_class(self, names):
+        row_class = self._classes.get(names)
+        if row_class is None:
+            # type checks that the names are identifiers.
+            row_class = type(
+                str(self._typename), (_Record, ), {"__slots__": names})
+            if any(iskeyword(name) for name in names):
+                raise ValueError(
+                    "Column names must not be keywords: {}.".format(names))
+            # Generate the __init__ function, like namedtuple does, which is
+            # much faster than setting the attributes in a loop.
+            namespace = {}
+            # pylint: disable=exec-used
+            exec("def __init__(self, {}):\n    {}\n".format(
+                ", ".join(names),
+                "\n    ".join("self.{0} = {0}".format(n) for n in names) or
+                "pass"), namespace)
+            row_class.__init__ = namespace["__init__"]
+            self._classes[names] = row_class
+        return row_class
+
+    def _prepare_names(self, names):
+        row_class = self.row_class(names)
+
+        def format_row(row):
+            if not row:
+                return row
+            return row_class(*row)
+
+        return format_row
+
+
+# Take a row and use the column names from cursor to turn the row into a
+# dictionary.
+to_dict_formatter = DictFormatter()
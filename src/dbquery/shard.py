@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+""" Query databases which are sharded by key.
+
+Python 2 needs the futures backport of concurrent.futures.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from heapq import merge
+from itertools import chain
+from itertools import islice
+from sys import version_info
+from threading import Lock
+from zlib import crc32
+
+from .instrument import monotonic
+
+
+def _merge_ordered(iterables, key, reverse):
+    """ heapq.merge with key and reverse, which it has from Python 3.5 on.
+    Picks the next item from the heads of the iterables, there are only a
+    few (one per shard).
+    """
+    iterators = [iter(iterable) for iterable in iterables]
+    heads = []  # [key, item, iterator] of the not exhausted iterators
+    for iterator in iterators:
+        for item in iterator:
+            heads.append([key(item), item, iterator])
+            break
+    while heads:
+        best = heads[0]
+        for head in heads[1:]:
+            if (best[0] < head[0]) if reverse else (head[0] < best[0]):
+                best = head
+        yield best[1]
+        for item in best[2]:
+            best[0] = key(item)
+            best[1] = item
+            break
+        else:
+            heads.remove(best)
+
+
+def _merge(iterables, key, reverse):
+    if version_info >= (3, 5):
+        return merge(*iterables, key=key, reverse=reverse)
+    return _merge_ordered(iterables, key, reverse)
+
+
+def shard_index(key, shards):
+    """ The shard of a key: the CRC32 of its string (UTF-8) modulo the number
+    of shards. Unlike hash this is the same in every process.
+
+    :type shards: int
+    :rtype: int
+    """
+    if not isinstance(key, bytes):
+        key = str(key).encode("utf-8")
+    return (crc32(key) & 0xffffffff) % shards
+
+
+class ShardedDB(object):
+    """ A database which is split into several shards, each one with its own
+    DB instance.
+
+    Use on(key) to query the shard of a key. Select and Manipulation
+    execute on all shards at the same time, in a thread pool, so a query
+    takes about as long as on the slowest shard. Since queries of different
+    threads can run on a shard at the same time, use DB classes which
+    support that, like PooledPostgresDB.
+    """
+
+    def __init__(self, shards, max_workers=None):
+        """
+        :param shards: DB instance for every shard, in shard order
+        :type shards: [dbquery.db.DB, ...]
+        :param max_workers: threads executing the shard queries, None: one
+            per shard
+        :type max_workers: int
+        """
+        if not shards:
+            raise ValueError("No shards.")
+        self._shards = list(shards)
+        self._max_workers = max_workers or len(self._shards)
+        self._lock = Lock()
+        self._executor = None
+
+    @property
+    def shards(self):
+        return self._shards
+
+    def on(self, key):  # pylint: disable=invalid-name
+        """ The DB of the shard of key, see shard_index.
+
+        :rtype: dbquery.db.DB
+        """
+        return self._shards[shard_index(key, len(self._shards))]
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self._max_workers)
+            return self._executor
+
+    def map(self, function):
+        """ Call function with every shard DB, at the same time.
+
+        Waits for all calls. If calls fail the exception of the first shard
+        which failed is raised.
+
+        :type function: function(dbquery.db.DB) -> result
+        :return: the results of all shards and the seconds each call took
+        :rtype: ([result, ...], [float, ...])
+        """
+        return self._run([partial(function, shard) for shard in self._shards])
+
+    def _run(self, calls):
+        """ Run the functions (one per shard) in the thread pool, see map.
+        """
+        def timed(call):
+            start = monotonic()
+            result = call()
+            return result, monotonic() - start
+
+        executor = self._get_executor()
+        futures = [executor.submit(timed, call) for call in calls]
+        results = []
+        timings = []
+        error = None
+        for future in futures:
+            try:
+                result, seconds = future.result()
+            except Exception as exception:  # pylint: disable=broad-except
+                if error is None:
+                    error = exception
+                continue
+            results.append(result)
+            timings.append(seconds)
+        if error is not None:
+            raise error
+        return results, timings
+
+    def Select(  # pylint: disable=too-many-arguments
+            self, sql, row_formatter=None, key=None, reverse=False,
+            limit=None):
+        return ShardedSelect(self, sql, row_formatter, key, reverse, limit)
+
+    def Manipulation(self, sql, rowcount=None):
+        return ShardedManipulation(self, sql, rowcount)
+
+    def close(self):
+        """ Close the connections of all shards.
+        """
+        for shard in self._shards:
+            shard.close()
+
+    def shutdown(self):
+        """ Stop the threads of the thread pool.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+
+class ShardedSelect(object):
+    """ Executes a Select on all shards and merges the rows.
+
+    Without key the rows of all shards are concatenated, in shard order. With
+    key the rows are merged into the order of key, the rows of every single
+    shard have to be ordered already (ORDER BY). Limit takes the first rows
+    of the merged result, the SQL should limit the rows per shard as well.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self, db, sql, row_formatter=None, key=None, reverse=False,
+            limit=None):
+        """
+        :type db: ShardedDB
+        :param row_formatter: see dbquery.query.Select
+        :param key: function returning the sort key of a (formatted) row
+        :type key: function(row) -> key
+        :param reverse: the rows are ordered in descending order
+        :type reverse: bool
+        :param limit: maximum number of rows returned
+        :type limit: int
+        """
+        self._db = db
+        self._key = key
+        self._reverse = reverse
+        self._limit = limit
+        self._selects = [
+            shard.Select(sql, row_formatter) for shard in db.shards]
+
+    def timed(self, *args, **kwds):
+        """ Like calling the ShardedSelect, but also get the time each shard
+        took.
+
+        :return: the rows and the seconds per shard
+        :rtype: ([row, ...], [float, ...])
+        """
+        # pylint: disable=protected-access
+        results, timings = self._db._run(
+            [partial(select, *args, **kwds) for select in self._selects])
+        if self._key is None:
+            rows = chain.from_iterable(results)
+        else:
+            rows = _merge(results, self._key, self._reverse)
+        if self._limit is not None:
+            rows = islice(rows, self._limit)
+        return list(rows), timings
+
+    def __call__(self, *args, **kwds):
+        """
+        :return: the merged rows of all shards
+        :rtype: [row, ...]
+        """
+        return self.timed(*args, **kwds)[0]
+
+
+class ShardedManipulation(object):
+    """ Executes a Manipulation on all shards, returns the total row count.
+    """
+
+    def __init__(self, db, sql, rowcount=None):
+        """
+        :type db: ShardedDB
+        :param rowcount: the expected row count per shard, see
+            dbquery.query.Manipulation
+        """
+        self._db = db
+        self._manipulations = [
+            shard.Manipulation(sql, rowcount) for shard in db.shards]
+
+    def __call__(self, *args, **kwds):
+        # pylint: disable=protected-access
+        rowcounts, _ = self._db._run(
+            [partial(m, *args, **kwds) for m in self._manipulations])
+        return sum(rowcounts)
@@ -1,36 +1,108 @@
 # -*- coding: utf-8 -*-
+from collections import OrderedDict
+from functools import wraps
+from re import compile as re_compile
 from sqlite3 import OperationalError as SQL3OperationalError
 from sqlite3 import connect
+from threading import RLock
 
 from .db import DB
+from .pool import ConnectionPool
+from .pool import ThreadLocalAttribute
+from .pool import _ClosingCursor
+from .pool import thread_local_state
+
+
+_ISOLATION_LEVELS = ("DEFERRED", "IMMEDIATE", "EXCLUSIVE")
+
+# PRAGMA does not support parameters, only allow plain names and values.
+_PRAGMA_NAME = re_compile(r"^\w+$")
+_PRAGMA_VALUE = re_compile(r"^-?\w+$")
+
+# Tuning for read heavy databases with concurrent readers: write ahead log,
+# no fsync on every commit (still safe with WAL), a 64 MiB page cache and
+# memory mapped reads of up to 256 MiB.
+PERFORMANCE_PRAGMAS = OrderedDict([
+    ("page_size", 4096),  # before journal_mode, can not be changed in WAL
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("cache_size", -65536),  # negative: KiB instead of pages
+    ("mmap_size", 268435456),
+    ("temp_store", "MEMORY"),
+    ("busy_timeout", 5000),  # milliseconds
+])
+
+
+def _pragma_statements(pragmas):
+    """ Create the PRAGMA statements, page_size first since it has to be set
+    before switching to WAL.
+
+    :type pragmas: {name: value} or [(name, value), ...]
+    :rtype: [str, ...]
+    """
+    if hasattr(pragmas, "items"):
+        pragmas = pragmas.items()
+    pragmas = sorted(pragmas, key=lambda p: p[0].lower() != "page_size")
+    statements = []
+    for name, value in pragmas:
+        value = str(value)
+        if not _PRAGMA_NAME.match(name) or not _PRAGMA_VALUE.match(value):
+            raise ValueError("Invalid pragma: {}={}.".format(name, value))
+        statements.append("PRAGMA {}={}".format(name, value))
+    return statements
 
 
-# TODO: complete or remove?
 class SQLiteDB(DB):  # pylint: disable=abstract-method
     """ SQLite DB class.
     From https://docs.python.org/3/library/sqlite3.html
     Needs at least:
      - 'database': database file/URI
 
-    No support for transactions.
+    Outside of a transaction (with db:) every statement is committed on its
+    own.
     No support for read_obj.
     """
 
     OperationalError = SQL3OperationalError
 
-    def __init__(self, database, retry=0, **kwds):
+    def __init__(  # pylint: disable=too-many-arguments
+            self, database, retry=0, isolation_level="DEFERRED", pragmas=None,
+            **kwds):
+        """
+        :param isolation_level: How transactions begin: DEFERRED (lock the
+            database on the first access), IMMEDIATE (take the write lock
+            right away) or EXCLUSIVE.
+        :param pragmas: PRAGMA settings for every new connection, for example
+            PERFORMANCE_PRAGMAS.
+        :type pragmas: {name: value} or [(name, value), ...]
+        """
         super(SQLiteDB, self).__init__(retry=retry)
+        if isolation_level not in _ISOLATION_LEVELS:
+            raise ValueError(
+                "Unknown isolation level: {}.".format(isolation_level))
         self._database = database
+        self._isolation_level = isolation_level
+        self._pragmas = _pragma_statements(pragmas or ())
         self._kwds = kwds
         self._connection = None
 
+    def _new_connection(self):
+        connection = connect(self._database, **self._kwds)
+        try:
+            connection.isolation_level = None  # auto commit
+            for pragma in self._pragmas:
+                connection.execute(pragma).fetchall()  # some return a row
+        except Exception:
+            connection.close()
+            raise
+        return connection
+
     def _connect(self):
         """Try to create a connection to the database if not yet connected.
         """
         if self._connection is not None:
             raise RuntimeError('Close connection first.')
-        self._connection = connect(self._database, **self._kwds)
-        self._connection.isolation_level = None  # auto commit
+        self._connection = self._new_connection()
 
     def close(self):
         if self._connection is not None:
@@ -45,8 +117,218 @@ class SQLiteDB(DB):  # pylint: disable=abstract-method
         c = self._connection.execute(sql, params)
         return produce_return(c)
 
+    @DB.connected
+    def nonclosing_execute(self, sql, params, return_function=None):
+        cursor = self._connection.cursor()
+        try:
+            cursor.execute(sql, params)
+        except Exception:
+            cursor.close()
+            raise
+        return cursor
+
+    @DB.connected
+    def executemany(  # pylint: disable=too-many-arguments,unused-argument
+            self, sql, seq_of_params, produce_return, page_size=None,
+            count_rows=False):
+        """ Uses the sqlite3 executemany, which streams the parameters, so
+        page_size is not needed and ignored. The row count is always known.
+
+        If no transaction is in progress one is used for all executions,
+        instead of committing every single one. It is committed after
+        produce_return, so a failing row count check rolls it back.
+        """
+        own_transaction = self._transaction_level <= 0
+        if own_transaction:
+            self._connection.execute("BEGIN")
+        try:
+            result = produce_return(
+                self._connection.executemany(sql, seq_of_params))
+        except Exception:
+            if own_transaction:
+                self._connection.rollback()
+            raise
+        if own_transaction:
+            self._connection.commit()
+        return result
+
+    def server_side_execute(
+            self, sql, params, produce_return, itersize=None):
+        """ SQLite cursors already step through the result while fetching, so
+        this is the same as read_execute.
+        """
+        return self.read_execute(sql, params, produce_return)
+
+    def nonclosing_server_side_execute(
+            self, sql, params, return_function=None, itersize=None):
+        """ The same as nonclosing_execute, see server_side_execute.
+        """
+        return self.nonclosing_execute(sql, params, return_function)
+
     def show(self, sql, params):
         """SQLite does not provide a function for showing the actual, formated
         SQL. This function just returns the SQL and the parameters as a string.
         """
         return '{} {}'.format(sql, params)
+
+    def explain(self, sql, params):
+        """ Uses EXPLAIN QUERY PLAN, one line per plan step.
+        """
+        return self.read_execute(
+            "EXPLAIN QUERY PLAN {}".format(sql), params,
+            lambda cursor: "\n".join(row[-1] for row in cursor.fetchall()))
+
+    @DB.connected
+    def _begin(self):
+        # The connection is in auto commit mode (isolation_level None), so
+        # sqlite3 leaves the transaction handling to us.
+        self._connection.execute("BEGIN {}".format(self._isolation_level))
+
+    def _commit(self):
+        if self._connection is None:
+            raise RuntimeError("Connection lost, can not commit!")
+        self._connection.commit()
+
+    def _rollback(self):
+        if self._connection is None:
+            raise RuntimeError("Connection lost, can not roll back!")
+        self._connection.rollback()
+
+
+def _writer(f):
+    """ Run a PooledSQLiteDB method with the writer lock held.
+    """
+
+    @wraps(f)
+    def new_f(self, *args, **kwds):
+        # pylint: disable=protected-access
+        with self._writer_lock:
+            return f(self, *args, **kwds)
+
+    return new_f
+
+
+class PooledSQLiteDB(SQLiteDB):
+    """ SQLite DB class for many threads: one writer connection and a pool of
+    reader connections.
+
+    The Select classes (read_execute) check out a reader connection, so
+    several threads read at the same time. All other queries and
+    transactions use the writer connection, one thread at a time. A
+    transaction keeps the writer until it ends and reads within it use the
+    writer, too, to see the own changes.
+
+    Readers are opened with PRAGMA query_only, use a transaction for
+    QueryCursors which write. Needs a database file, best in WAL mode (see
+    PERFORMANCE_PRAGMAS), so readers and the writer do not block each other.
+    """
+
+    _transaction_level = ThreadLocalAttribute("_transaction_level")
+    _retry = ThreadLocalAttribute("_retry")
+    _orig_retry = ThreadLocalAttribute("_orig_retry")
+    _after_commit = ThreadLocalAttribute("_after_commit")
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self, database, retry=0, isolation_level="DEFERRED", pragmas=None,
+            readers=4, pool_timeout=None, **kwds):
+        """
+        :param readers: Maximum number of reader connections.
+        :param pool_timeout: Seconds to wait for a free reader connection
+            before raising PoolTimeoutError, None waits forever.
+        """
+        thread_local_state(self)
+        kwds["check_same_thread"] = False
+        super(PooledSQLiteDB, self).__init__(
+            database, retry, isolation_level, pragmas, **kwds)
+        self._writer_lock = RLock()
+        self._readers = ConnectionPool(
+            self._new_reader, maxsize=readers, timeout=pool_timeout)
+
+    @property
+    def pool(self):
+        """ The pool of reader connections.
+        """
+        return self._readers
+
+    def _new_reader(self):
+        connection = self._new_connection()
+        connection.execute("PRAGMA query_only=1")
+        return connection
+
+    def read_execute(self, sql, params, produce_return):
+        if self._transaction_level > 0:
+            return self.execute(sql, params, produce_return)
+        connection = self._readers.get()
+        try:
+            cursor = connection.execute(sql, params)
+            try:
+                result = produce_return(cursor)
+            finally:
+                cursor.close()  # ends the read transaction
+        except self.OperationalError:
+            self._readers.put(connection, discard=True)
+            raise
+        except Exception:
+            self._readers.put(connection)
+            raise
+        self._readers.put(connection)
+        return result
+
+    def nonclosing_execute(self, sql, params, return_function=None):
+        """ Within a transaction use the writer, otherwise a reader which is
+        returned to the pool when the cursor gets closed.
+        """
+        if self._transaction_level > 0:
+            return self._writer_nonclosing_execute(sql, params)
+        connection = self._readers.get()
+        cursor = connection.cursor()
+        try:
+            cursor.execute(sql, params)
+        except self.OperationalError:
+            cursor.close()
+            self._readers.put(connection, discard=True)
+            raise
+        except Exception:
+            cursor.close()
+            self._readers.put(connection)
+            raise
+        return _ClosingCursor(cursor, lambda: self._readers.put(connection))
+
+    _writer_nonclosing_execute = _writer(SQLiteDB.nonclosing_execute)
+
+    execute = _writer(SQLiteDB.execute)
+
+    executemany = _writer(SQLiteDB.executemany)
+
+    def close(self):
+        """ Close the writer connection.
+
+        Use close_all to close the idle reader connections, too.
+        """
+        with self._writer_lock:
+            super(PooledSQLiteDB, self).close()
+
+    def close_all(self):
+        self.close()
+        self._readers.close()
+
+    def _begin(self):
+        # Hold the writer until the transaction ends.
+        self._writer_lock.acquire()
+        try:
+            super(PooledSQLiteDB, self)._begin()
+        except Exception:
+            self._writer_lock.release()
+            raise
+
+    def _commit(self):
+        try:
+            super(PooledSQLiteDB, self)._commit()
+        finally:
+            self._writer_lock.release()
+
+    def _rollback(self):
+        try:
+            super(PooledSQLiteDB, self)._rollback()
+        finally:
+            self._writer_lock.release()
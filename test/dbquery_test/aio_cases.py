@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+""" The asyncio tests, imported by test_aio on Python 3.7 or newer.
+"""
+from asyncio import Event
+from asyncio import create_task
+from asyncio import run
+from asyncio import wait
+from unittest import TestCase
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+from dbquery import ManipulationCheckError
+from dbquery import to_dict_formatter
+from dbquery.aio import AsyncDB
+from dbquery.aio import AsyncSQLiteDB
+
+
+_RETRY = 2
+
+
+class _FailingDB(AsyncDB):  # pylint: disable=abstract-method
+    """ Raises an OperationalError on every execute.
+    """
+
+    def __init__(self):
+        super(_FailingDB, self).__init__(_RETRY)
+        self.execute_calls = 0
+        self.close_calls = 0
+
+    async def execute(self, sql, params, produce_return):
+        self.execute_calls += 1
+        raise self.OperationalError()
+
+    async def close(self):
+        self.close_calls += 1
+
+
+class AsyncQueryTest(TestCase):
+    """ Test retrying in AsyncQuery.
+    """
+
+    def test_retry(self):
+        """ Retry as often as configured, closing the connection in between.
+        """
+        db = _FailingDB()
+        with self.assertRaises(db.OperationalError):
+            with patch("dbquery.aio.query._LOG"):  # hide log
+                run(db.Query("")())
+        self.assertEqual(db.execute_calls, _RETRY)
+        self.assertEqual(db.close_calls, _RETRY - 1)
+
+
+class AsyncSQLiteTest(TestCase):
+    """ Test the async SQLite DB and the async query classes.
+    """
+
+    def setUp(self):
+        self.db = AsyncSQLiteDB(":memory:")
+
+    def tearDown(self):
+        run(self._close())
+
+    async def _close(self):
+        await self.db.close()
+
+    async def _create(self):
+        await self.db.Manipulation(
+            "CREATE TABLE test (id INTEGER, val VARCHAR)")()
+        insert = self.db.Manipulation("INSERT INTO test VALUES(?, ?)", 1)
+        for i in range(3):
+            await insert(i, "hello{}".format(i))
+
+    def test_settings(self):
+        """ The pragmas are set on the connection.
+        """
+        with self.assertRaises(ValueError):
+            AsyncSQLiteDB(":memory:", isolation_level="LATER")
+        db = AsyncSQLiteDB(
+            ":memory:", isolation_level="IMMEDIATE",
+            pragmas={"cache_size": -1024})
+
+        async def _test():
+            async with db:
+                self.assertEqual(
+                    await db.SelectOne("PRAGMA cache_size")(), -1024)
+            await db.close()
+
+        run(_test())
+
+    def test_select(self):
+        """ Insert rows and read them with Select and SelectOne.
+        """
+
+        async def _test():
+            await self._create()
+            select = self.db.Select("SELECT * FROM test ORDER BY id")
+            self.assertEqual((await select())[0], (0, "hello0"))
+            select_one = self.db.SelectOne("SELECT val FROM test WHERE id=?")
+            self.assertEqual(await select_one(1), "hello1")
+            select = self.db.Select(
+                "SELECT * FROM test WHERE id=:id", to_dict_formatter)
+            self.assertEqual(await select(id=2), [{"id": 2, "val": "hello2"}])
+
+        run(_test())
+
+    def test_rowcount_check(self):
+        """ A wrong row count raises a ManipulationCheckError.
+        """
+
+        async def _test():
+            await self._create()
+            await self.db.Manipulation("DELETE FROM test", rowcount=1)()
+
+        with self.assertRaises(ManipulationCheckError):
+            run(_test())
+
+    def test_select_iterator(self):
+        """ The callback gets an async generator.
+        """
+        rows = []
+
+        async def _callback(row_generator, prefix):
+            async for row in row_generator:
+                rows.append(prefix + row[1])
+
+        async def _test():
+            await self._create()
+            select = self.db.SelectIterator(
+                "SELECT * FROM test ORDER BY id", _callback, ["> "], 2)
+            await select()
+
+        run(_test())
+        self.assertEqual(rows, ["> hello0", "> hello1", "> hello2"])
+
+    def test_context(self):
+        """ Commit a transaction, roll back an aborted one.
+        """
+
+        async def _test():
+            await self._create()
+            count = self.db.SelectOne("SELECT count(*) FROM test")
+            delete = self.db.Manipulation("DELETE FROM test WHERE id=?")
+            async with self.db:
+                await delete(0)
+            self.assertEqual(await count(), 2)
+            async with self.db as db:
+                await delete(1)
+                db.abort_transaction()
+            self.assertEqual(await count(), 2)
+            with self.assertRaises(RuntimeError):
+                async with self.db:
+                    await delete(1)
+                    raise RuntimeError()
+            self.assertEqual(await count(), 2)
+            self.assertEqual(self.db.retry, 0)
+
+        run(_test())
+
+    def test_tasks(self):
+        """ The queries of other tasks wait until the transaction ended, they
+        are not rolled back with it.
+        """
+
+        async def _insert(started):
+            await started.wait()
+            await self.db.Manipulation("INSERT INTO test VALUES(3, 'x')")()
+
+        async def _test():
+            await self._create()
+            count = self.db.SelectOne("SELECT count(*) FROM test")
+            started = Event()
+            insert = create_task(_insert(started))
+            async with self.db as db:
+                await self.db.Manipulation("DELETE FROM test")()
+                started.set()
+                done, _ = await wait([insert], timeout=0.05)
+                self.assertFalse(done)
+                db.abort_transaction()
+            await insert
+            self.assertEqual(await count(), 4)
+
+        run(_test())
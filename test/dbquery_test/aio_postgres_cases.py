@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Imported by test_aio_postgres on Python 3.7 or newer.
+
+Enable the PostgreSQL tests by setting the environment variable in
+_DBQUERY_POSTGRES_TEST to the Postgres DSN to be used.
+"""
+from asyncio import run
+from unittest import TestCase, skipUnless
+from os import getenv
+
+from dbquery.aio.postgres import AsyncPostgresDB
+
+
+_TEST_SCHEMA = "dbquery_test"
+
+_DBQUERY_POSTGRES_TEST = "DBQUERY_POSTGRES_TEST"
+
+
+@skipUnless(
+    getenv(_DBQUERY_POSTGRES_TEST), 'PostgreSQL connection tests not enabled.')
+class AsyncPostgresTest(TestCase):
+    """ Test the AsyncPostgresDB class in the test schema.
+    """
+
+    def setUp(self):
+        self.db = AsyncPostgresDB(
+            getenv(_DBQUERY_POSTGRES_TEST),
+            options="-c search_path={}".format(_TEST_SCHEMA))
+        run(self._manipulate(
+            "DROP SCHEMA IF EXISTS {0} CASCADE; CREATE SCHEMA {0}".format(
+                _TEST_SCHEMA)))
+
+    def tearDown(self):
+        run(self._manipulate(
+            "DROP SCHEMA IF EXISTS {} CASCADE".format(_TEST_SCHEMA)))
+
+    async def _manipulate(self, sql):
+        await self.db.Manipulation(sql)()
+        await self.db.close()
+
+    def test_context(self):
+        """ Insert in a transaction, then select and show.
+        """
+
+        async def _test():
+            await self.db.Manipulation("CREATE TABLE test (test VARCHAR)")()
+            insert = self.db.Manipulation("INSERT INTO test VALUES(%s)")
+            async with self.db:
+                await insert("hello")
+            async with self.db as db:
+                await insert("world")
+                db.abort_transaction()
+            select = self.db.Select("SELECT * FROM test")
+            self.assertEqual(await select(), [("hello", )])
+            self.assertIn("'x'", await self.db.show("SELECT %s", ["x"]))
+            await self.db.close()
+
+        run(_test())
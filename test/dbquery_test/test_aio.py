@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+""" dbquery.aio needs Python 3.7 or newer, on older versions the tests are not
+even imported (async syntax).
+"""
+from sys import version_info
+
+if version_info >= (3, 7):
+    # pylint: disable=unused-import
+    from .aio_cases import AsyncQueryTest
+    from .aio_cases import AsyncSQLiteTest
@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+""" See test_aio.
+"""
+from sys import version_info
+
+if version_info >= (3, 7):
+    # pylint: disable=unused-import
+    from .aio_postgres_cases import AsyncPostgresTest
@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+from sqlite3 import connect
+from threading import Event
+from threading import Semaphore
+from threading import Thread
+from time import sleep
+from unittest import TestCase
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+from dbquery import SQLiteDB
+from dbquery import to_dict_formatter
+from dbquery.cache import ResultCache
+from dbquery.cache import SingleFlight
+from dbquery.cache import _Call
+from dbquery.cache import table_tags
+
+
+class ResultCacheTest(TestCase):
+    """ Test the ResultCache class.
+    """
+
+    def test_get_put(self):
+        cache = ResultCache()
+        self.assertEqual(cache.get("a"), (False, None))
+        cache.put("a", [(1, )])
+        self.assertEqual(cache.get("a"), (True, [(1, )]))
+        self.assertEqual(
+            cache.stats(), {"entries": 1, "bytes": 0, "hits": 1, "misses": 1})
+
+    def test_ttl(self):
+        """ An entry expires after its TTL.
+        """
+        cache = ResultCache()
+        cache.put("a", 1, ttl=0.01)
+        cache.put("b", 2, ttl=10)
+        sleep(0.02)
+        self.assertEqual(cache.get("a"), (False, None))
+        self.assertEqual(cache.get("b"), (True, 2))
+
+    def test_max_entries(self):
+        """ The least recently used entry gets evicted.
+        """
+        cache = ResultCache(max_entries=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get("b"), (False, None))
+        self.assertEqual(cache.get("a"), (True, 1))
+
+    def test_max_bytes(self):
+        """ Entries get evicted to stay below max_bytes, values larger than
+        that are not cached.
+        """
+        row = [("x" * 100, )]
+        cache = ResultCache(max_bytes=500)
+        cache.put("a", row)
+        size = cache.bytes
+        self.assertGreater(size, 100)
+        cache.put("b", row)
+        cache.put("c", row)
+        self.assertLessEqual(cache.bytes, 500)
+        self.assertEqual(cache.get("c"), (True, row))
+        cache.put("d", [("x" * 1000, )])
+        self.assertEqual(cache.get("d"), (False, None))
+        cache.clear()
+        self.assertEqual((len(cache), cache.bytes), (0, 0))
+
+    def test_invalidate(self):
+        """ Only the entries tagged with an invalidated table are removed.
+        """
+        cache = ResultCache()
+        cache.put("a", 1, tags=table_tags(["A", "b"]))
+        cache.put("b", 2, tags=table_tags("b"))
+        cache.put("c", 3, tags=table_tags("c"))
+        cache.invalidate("a")
+        self.assertEqual(cache.get("a"), (False, None))
+        self.assertEqual(cache.get("b"), (True, 2))
+        cache.invalidate(["B", "x"])
+        self.assertEqual(len(cache), 1)
+
+    def test_table_tags(self):
+        """ A single table name can be any string.
+        """
+        self.assertEqual(table_tags(u"Users"), frozenset(["users"]))
+        self.assertEqual(table_tags("users"), frozenset(["users"]))
+        self.assertEqual(table_tags(["A", "b"]), frozenset(["a", "b"]))
+
+    def test_generation(self):
+        """ A value read before its table got invalidated is not cached.
+        """
+        cache = ResultCache()
+        tags = table_tags("a")
+        generation = cache.generation(tags)
+        cache.invalidate("a")
+        cache.put("a", 1, tags=tags, generation=generation)
+        self.assertEqual(len(cache), 0)
+        cache.put("a", 1, tags=tags, generation=cache.generation(tags))
+        self.assertEqual(len(cache), 1)
+
+    def test_clear_generation(self):
+        """ A value read before the cache was cleared is not cached.
+        """
+        cache = ResultCache()
+        generation = cache.generation(frozenset())
+        cache.clear()
+        cache.put("a", 1, generation=generation)
+        self.assertEqual(len(cache), 0)
+
+
+class SelectCacheTest(TestCase):
+    """ Test caching Select and SelectOne results with SQLite.
+    """
+
+    def setUp(self):
+        self.db = SQLiteDB(":memory:")
+        self.db.Manipulation("CREATE TABLE test (i INTEGER, t VARCHAR)")()
+        self.insert = self.db.Manipulation("INSERT INTO test VALUES(?, ?)")
+        self.insert(1, "a")
+
+    def test_select_one(self):
+        """ The result is cached per parameter set.
+        """
+        select = self.db.SelectOne(
+            "SELECT t FROM test WHERE i=?", cache_ttl=60)
+        self.assertEqual(select(1), "a")
+        self.db.Manipulation("UPDATE test SET t='b'")()
+        self.assertEqual(select(1), "a")  # cached
+        self.assertIsNone(select(2))
+        stats = self.db.result_cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+
+    def test_select(self):
+        """ Formatted rows are cached as list and every call gets its own
+        list.
+        """
+        select = self.db.Select(
+            "SELECT i, t FROM test", to_dict_formatter, cache_ttl=60)
+        rows = select()
+        self.assertEqual(rows, [{"i": 1, "t": "a"}])
+        rows.append(None)
+        self.assertEqual(select(), [{"i": 1, "t": "a"}])
+
+    def test_keywords(self):
+        select = self.db.SelectOne(
+            "SELECT t FROM test WHERE i=:i", cache_ttl=60)
+        self.assertEqual(select(i=1), "a")
+        self.assertEqual(select(i=1), "a")
+        self.assertEqual(self.db.result_cache.hits, 1)
+
+    def test_transaction(self):
+        """ Within a transaction the cache is not used.
+        """
+        select = self.db.SelectOne(
+            "SELECT t FROM test WHERE i=?", cache_ttl=60)
+        select(1)
+        with self.db:
+            self.db.Manipulation("UPDATE test SET t='b'")()
+            self.assertEqual(select(1), "b")
+        self.assertEqual(select(1), "a")  # cached before the transaction
+        self.assertEqual(len(self.db.result_cache), 1)
+
+    def test_no_cache(self):
+        select = self.db.SelectOne("SELECT t FROM test WHERE i=?")
+        select(1)
+        select(1)
+        self.assertEqual(len(self.db.result_cache), 0)
+
+
+class _WaitingCall(_Call):
+    """ _Call which releases the waiting semaphore for every call which is
+    about to wait for it.
+    """
+
+    waiting = None
+
+    def __init__(self):
+        super(_WaitingCall, self).__init__()
+        self.event = self.done
+        self.done = self
+
+    def wait(self, timeout=None):
+        self.waiting.release()
+        return self.event.wait(timeout)
+
+    def set(self):
+        self.event.set()
+
+
+def _start_waiting(threads, started):
+    """ Start the first thread, once it executes start the other ones and
+    return once they all wait for it.
+    """
+    _WaitingCall.waiting = Semaphore(0)
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    for _ in threads[1:]:
+        _WaitingCall.waiting.acquire()
+
+
+class SingleFlightTest(TestCase):
+    """ Test sharing concurrent calls with SingleFlight.
+    """
+
+    def setUp(self):
+        self.single_flight = SingleFlight()
+        self.started = Event()
+        self.release = Event()
+        self.calls = 0
+
+    def _function(self, result):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _run(self, count, result):
+        """ Call do from count threads, the first one blocks until all are
+        waiting.
+        """
+        results = []
+
+        def call():
+            try:
+                results.append(self.single_flight.do(
+                    "key", lambda: self._function(result)))
+            except ValueError as error:
+                results.append(error)
+
+        threads = [Thread(target=call) for _ in range(count)]
+        with patch("dbquery.cache._Call", _WaitingCall):
+            _start_waiting(threads, self.started)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_shared(self):
+        self.assertEqual(self._run(5, 1), [1] * 5)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(len(self.single_flight), 0)
+
+    def test_error(self):
+        """ All waiting calls get the exception.
+        """
+        error = ValueError()
+        self.assertEqual(self._run(3, error), [error] * 3)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(len(self.single_flight), 0)
+
+    def test_sequential(self):
+        """ Only calls in flight are shared.
+        """
+        self.release.set()
+        self.assertEqual(self.single_flight.do("key", lambda: 1), 1)
+        self.assertEqual(self.single_flight.do("key", lambda: 2), 2)
+
+
+class SelectSingleFlightTest(TestCase):
+    """ Test Select and SelectOne with single_flight.
+    """
+
+    def setUp(self):
+        self.db = SQLiteDB(":memory:")
+        self.started = Event()
+        self.release = Event()
+        self.calls = []
+        self.db.read_execute = self._read_execute
+
+    def _read_execute(self, sql, params, produce_return):
+        self.calls.append(params)
+        self.started.set()
+        self.release.wait(5)
+        connection = connect(":memory:")  # the DB connection is not shared
+        try:
+            return produce_return(connection.execute(sql, params))
+        finally:
+            connection.close()
+
+    def test_select(self):
+        """ Concurrent calls with the same parameters share the execution,
+        every call gets its own list.
+        """
+        select = self.db.Select("SELECT ?", single_flight=True)
+        results = []
+
+        def call():
+            results.append(select(1))
+
+        threads = [Thread(target=call) for _ in range(4)]
+        with patch("dbquery.cache._Call", _WaitingCall):
+            _start_waiting(threads, self.started)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [[(1, )]] * 4)
+        self.assertEqual(len(set(id(r) for r in results)), 4)
+        self.assertEqual(self.calls, [(1, )])
+
+    def test_transaction(self):
+        """ Within a transaction every call executes.
+        """
+        self.release.set()
+        select = self.db.SelectOne("SELECT ?", single_flight=True)
+        with self.db:
+            self.assertEqual(select(1), 1)
+        self.assertEqual(select(1), 1)
+        self.assertEqual(self.calls, [(1, ), (1, )])
+
+
+class InvalidationTest(TestCase):
+    """ Test invalidating cached results with Manipulation queries.
+    """
+
+    def setUp(self):
+        self.db = SQLiteDB(":memory:")
+        self.db.Manipulation("CREATE TABLE test (i INTEGER, t VARCHAR)")()
+        self.db.Manipulation("INSERT INTO test VALUES(1, 'a')")()
+        self.select = self.db.SelectOne(
+            "SELECT t FROM test WHERE i=1", cache_ttl=60, tables="test")
+        self.update = self.db.Manipulation(
+            "UPDATE test SET t=?", tables=["TEST"])
+        self.select()  # cached
+
+    def test_manipulation(self):
+        self.update("b")
+        self.assertEqual(self.select(), "b")
+
+    def test_executemany(self):
+        self.update.executemany([("b", ), ("c", )])
+        self.assertEqual(self.select(), "c")
+
+    def test_failed(self):
+        """ A failing Manipulation does not invalidate.
+        """
+        with self.assertRaises(SQLiteDB.OperationalError):
+            self.db.Manipulation("UPDATE test SET x=1", tables="test")()
+        self.assertEqual(len(self.db.result_cache), 1)
+
+    def test_other_table(self):
+        """ A Manipulation of another table does not invalidate.
+        """
+        self.db.Manipulation("CREATE TABLE other (i INTEGER)")()
+        self.db.Manipulation("INSERT INTO other VALUES(1)", tables="other")()
+        self.db.Manipulation("UPDATE test SET t='b'")()
+        self.assertEqual(self.select(), "a")
+
+    def test_commit(self):
+        """ Within a transaction the cache is invalidated on commit.
+        """
+        with self.db:
+            self.update("b")
+            self.assertEqual(len(self.db.result_cache), 1)
+        self.assertEqual(len(self.db.result_cache), 0)
+        self.assertEqual(self.select(), "b")
+
+    def test_rollback(self):
+        with self.db as db:
+            self.update("b")
+            db.abort_transaction()
+        self.assertEqual(len(self.db.result_cache), 1)
+        self.assertEqual(self.select(), "a")
+
+    def test_after_commit(self):
+        """ Without a transaction the callback is called right away.
+        """
+        calls = []
+        self.db.after_commit(lambda: calls.append(1))
+        with self.db:
+            self.db.after_commit(lambda: calls.append(2))
+            self.assertEqual(calls, [1])
+        self.assertEqual(calls, [1, 2])
+
+    def test_after_commit_error(self):
+        """ A failing callback is logged, the following ones are called.
+        """
+        def fail():
+            raise SQLiteDB.OperationalError()
+
+        with patch("dbquery.db._LOG") as log:
+            with self.db:
+                self.db.after_commit(fail)
+                self.update("b")
+        self.assertTrue(log.exception.called)
+        self.assertEqual(len(self.db.result_cache), 0)
+        self.assertEqual(self.select(), "b")
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+from array import array
+from unittest import TestCase, skipUnless
+
+from dbquery.columnar import ColumnBuilder
+from dbquery.columnar import _INTEGER
+from dbquery.columnar import numpy
+
+
+class ColumnBuilderTest(TestCase):
+    """ Test collecting rows into columns.
+    """
+
+    def test_types(self):
+        """ Integers and floats go into arrays, everything else into lists.
+        """
+        builder = ColumnBuilder(("i", "f", "s", "b"))
+        builder.add([(1, 1.5, "a", True), (2, 2.5, "b", False)])
+        builder.add([(3, 3.5, "c", True)])
+        columns = builder.columns()
+        self.assertEqual(list(columns), ["i", "f", "s", "b"])
+        self.assertEqual(columns["i"], array(_INTEGER, [1, 2, 3]))
+        self.assertEqual(columns["f"], array("d", [1.5, 2.5, 3.5]))
+        self.assertEqual(columns["s"], ["a", "b", "c"])
+        self.assertEqual(columns["b"], [True, False, True])
+
+    def test_int_to_float(self):
+        """ A float in an integer column turns it into a float array.
+        """
+        builder = ColumnBuilder(("n", ))
+        builder.add([(1, ), (2, )])
+        builder.add([(3, ), (4.5, )])
+        self.assertEqual(builder.columns()["n"], array("d", [1, 2, 3, 4.5]))
+
+    def test_to_list(self):
+        """ A NULL (None) value turns an array into a list, without losing or
+        repeating values.
+        """
+        builder = ColumnBuilder(("n", ))
+        builder.add([(1, )])
+        builder.add([(2, ), (None, ), (3, )])
+        self.assertEqual(builder.columns()["n"], [1, 2, None, 3])
+
+    def test_bool(self):
+        """ Bools turn an array into a list, in any batch.
+        """
+        builder = ColumnBuilder(("n", ))
+        builder.add([(1, )])
+        builder.add([(True, )])
+        self.assertEqual(builder.columns()["n"], [1, True])
+
+    def test_overflow(self):
+        """ Integers which do not fit into the array go into a list.
+        """
+        builder = ColumnBuilder(("n", ))
+        builder.add([(1, ), (2 ** 70, )])
+        self.assertEqual(builder.columns()["n"], [1, 2 ** 70])
+
+    def test_empty(self):
+        """ Without rows all columns are empty.
+        """
+        columns = ColumnBuilder(("a", "b")).columns()
+        self.assertEqual(columns, {"a": [], "b": []})
+
+    @skipUnless(numpy, "NumPy not installed.")
+    def test_numpy(self):
+        """ Numeric columns become NumPy arrays.
+        """
+        builder = ColumnBuilder(("i", "s"), use_numpy=True)
+        builder.add([(1, "a"), (2, "b")])
+        columns = builder.columns()
+        self.assertEqual(columns["i"].dtype, numpy.int64)
+        self.assertEqual(columns["i"].tolist(), [1, 2])
+        self.assertEqual(columns["s"], ["a", "b"])
+
+    @skipUnless(numpy is None, "NumPy installed.")
+    def test_no_numpy(self):
+        """ Asking for NumPy arrays without NumPy raises an error.
+        """
+        with self.assertRaises(RuntimeError):
+            ColumnBuilder(("i", ), use_numpy=True)
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+from logging import getLogger
+from unittest import TestCase
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+from dbquery import SQLiteDB
+from dbquery.instrument import Instrumentation
+from dbquery.instrument import LatencyAggregator
+from dbquery.instrument import MultiInstrumentation
+from dbquery.instrument import QueryStatistics
+from dbquery.instrument import SlowQueryLog
+from dbquery.instrument import _RateLimit
+from dbquery.instrument import _Statistic
+from dbquery.instrument import fingerprint
+
+
+class _Recorder(Instrumentation):
+    """ Remembers all calls.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def before_query(self, event):
+        self.calls.append(("before", event))
+
+    def after_query(self, event):
+        self.calls.append(("after", event))
+
+    def retry(self, event, error):
+        self.calls.append(("retry", event))
+
+    def commit(self, db, duration):
+        self.calls.append(("commit", duration))
+
+    def rollback(self, db, duration):
+        self.calls.append(("rollback", duration))
+
+
+class _FailingSQLiteDB(SQLiteDB):
+    """ Fails the first execution with an OperationalError.
+    """
+
+    def __init__(self, *args, **kwds):
+        super(_FailingSQLiteDB, self).__init__(*args, **kwds)
+        self.fail = True
+
+    def execute(self, sql, params, produce_return):
+        if self.fail:
+            self.fail = False
+            raise self.OperationalError()
+        return super(_FailingSQLiteDB, self).execute(
+            sql, params, produce_return)
+
+
+class FingerprintTest(TestCase):
+
+    def test_literals(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t1 WHERE a='x''y' AND b=1.5"),
+            "SELECT * FROM t1 WHERE a=? AND b=?")
+
+    def test_placeholders(self):
+        """ All parameter styles give the same fingerprint.
+        """
+        fingerprints = set(
+            fingerprint("SELECT a::int FROM t WHERE b={}".format(p))
+            for p in ("%s", "%(b)s", "?", ":b", "$1"))
+        self.assertEqual(fingerprints, {"SELECT a::int FROM t WHERE b=?"})
+
+    def test_value_list(self):
+        self.assertEqual(
+            fingerprint("SELECT *\n  FROM t WHERE a IN ( ?, ?,? )"),
+            "SELECT * FROM t WHERE a IN (?)")
+
+
+class InstrumentationTest(TestCase):
+    """ Test the instrumentation hooks with SQLite.
+    """
+
+    def setUp(self):
+        self.db = SQLiteDB(":memory:")
+        self.db.Manipulation("CREATE TABLE test (test INTEGER)")()
+        self.db.Manipulation("INSERT INTO test VALUES(?)").executemany(
+            (i, ) for i in range(5))
+        self.recorder = _Recorder()
+        self.db.instrumentation = self.recorder
+
+    def test_select(self):
+        """ The event has the timings and the fetched rows.
+        """
+        select = self.db.SelectIterator(
+            "SELECT test FROM test", list, arraysize=2)
+        select()
+        (before, event), (after, after_event) = self.recorder.calls
+        self.assertEqual((before, after), ("before", "after"))
+        self.assertIs(event, after_event)
+        self.assertEqual(event.rows, 5)
+        self.assertEqual(event.fingerprint, "SELECT test FROM test")
+        self.assertIsNone(event.error)
+        self.assertEqual(event.retries, 0)
+        self.assertGreater(event.fetch_time, 0)
+        self.assertGreaterEqual(event.format_time, 0)
+        self.assertGreaterEqual(
+            event.total_time, event.execute_time + event.fetch_time)
+
+    def test_manipulation(self):
+        self.db.Manipulation("DELETE FROM test")()
+        event = self.recorder.calls[-1][1]
+        self.assertEqual(event.rowcount, 5)
+        self.assertEqual(event.rows, 0)
+
+    def test_error(self):
+        with self.assertRaises(Exception):
+            self.db.Select("SELECT * FROM missing")()
+        name, event = self.recorder.calls[-1]
+        self.assertEqual(name, "after")
+        self.assertIsNotNone(event.error)
+
+    def test_retry(self):
+        db = _FailingSQLiteDB(":memory:", retry=2)
+        db.instrumentation = self.recorder
+        self.assertEqual(db.SelectOne("SELECT 1")(), 1)
+        self.assertEqual(
+            [name for name, _ in self.recorder.calls],
+            ["before", "retry", "after"])
+        self.assertEqual(self.recorder.calls[-1][1].retries, 1)
+
+    def test_transaction(self):
+        with self.db:
+            self.db.Manipulation("DELETE FROM test")()
+        with self.db as db:
+            db.abort_transaction()
+        self.assertEqual(
+            [name for name, _ in self.recorder.calls],
+            ["before", "after", "commit", "rollback"])
+
+    def test_multi(self):
+        """ MultiInstrumentation calls all instrumentations.
+        """
+        other = _Recorder()
+        self.db.instrumentation = MultiInstrumentation(self.recorder, other)
+        self.db.SelectOne("SELECT 1")()
+        self.assertEqual(len(self.recorder.calls), 2)
+        self.assertEqual(len(other.calls), 2)
+
+
+class LatencyAggregatorTest(TestCase):
+
+    def test_stats(self):
+        db = SQLiteDB(":memory:")
+        aggregator = LatencyAggregator()
+        db.instrumentation = aggregator
+        select = db.SelectOne("SELECT ?")
+        for i in range(10):
+            select(i)
+        with self.assertRaises(Exception):
+            db.SelectOne("SELECT * FROM missing")()
+        stats = aggregator.stats()
+        self.assertEqual(
+            set(stats), {"SELECT ?", "SELECT * FROM missing"})
+        stat = stats["SELECT ?"]
+        self.assertEqual((stat["count"], stat["errors"]), (10, 0))
+        self.assertLessEqual(stat["p50"], stat["p95"])
+        self.assertLessEqual(stat["p95"], stat["p99"])
+        self.assertEqual(stats["SELECT * FROM missing"]["errors"], 1)
+        aggregator.reset()
+        self.assertEqual(aggregator.stats(), {})
+
+
+class QueryStatisticsTest(TestCase):
+
+    def setUp(self):
+        self.db = SQLiteDB(":memory:")
+        self.statistics = QueryStatistics()
+        self.db.instrumentation = self.statistics
+        self.db.Manipulation("CREATE TABLE test (test INTEGER)")()
+
+    def test_snapshot(self):
+        """ Rows, affected rows and errors are counted per fingerprint.
+        """
+        insert = self.db.Manipulation("INSERT INTO test VALUES(?)")
+        for i in range(3):
+            insert(i)
+        select = self.db.Select("SELECT * FROM test WHERE test < ?")
+        select(2)
+        select(10)
+        with self.assertRaises(Exception):
+            insert("x", "y")
+        snapshot = self.statistics.snapshot()
+        inserts = snapshot["INSERT INTO test VALUES(?)"]
+        self.assertEqual(
+            (inserts["calls"], inserts["rowcount"], inserts["errors"]),
+            (4, 3, 1))
+        selects = snapshot["SELECT * FROM test WHERE test < ?"]
+        self.assertEqual((selects["calls"], selects["rows"]), (2, 5))
+        self.assertAlmostEqual(
+            selects["mean_time"], selects["total_time"] / 2)
+        self.assertLessEqual(selects["max_time"], selects["total_time"])
+
+    def test_snapshot_first_call(self):
+        """ A snapshot taken while the first call of a fingerprint is added
+        does not see its totals without calls.
+        """
+        snapshots = []
+        add = _Statistic.add
+
+        def add_snapshot(statistic, event):
+            snapshots.append(self.statistics.snapshot())
+            add(statistic, event)
+
+        with patch.object(_Statistic, "add", add_snapshot):
+            self.db.SelectOne("SELECT count(*) FROM test")()
+        self.assertNotIn("SELECT count(*) FROM test", snapshots[0])
+        snapshot = self.statistics.snapshot()
+        self.assertEqual(snapshot["SELECT count(*) FROM test"]["calls"], 1)
+
+    def test_top_reset(self):
+        select = self.db.SelectOne("SELECT count(*) FROM test")
+        for _ in range(3):
+            select()
+        top = self.statistics.top(1, key="calls")
+        self.assertEqual(top[0][0], "SELECT count(*) FROM test")
+        self.assertEqual(top[0][1]["calls"], 3)
+        self.statistics.reset()
+        self.assertEqual(self.statistics.snapshot(), {})
+
+
+class SlowQueryLogTest(TestCase):
+
+    def setUp(self):
+        self.db = SQLiteDB(":memory:")
+        self.db.Manipulation("CREATE TABLE test (test INTEGER)")()
+        self.logger = getLogger("dbquery_test.slow")
+
+    def _log(self, query, *args, **kwds):
+        """ Execute the query and return the slow query log messages.
+        """
+        with self.assertLogs(self.logger) as logs:
+            query(*args)
+            self.logger.warning("end")  # assertLogs needs one message
+        return logs.output[:-1]
+
+    def test_slow(self):
+        """ The slow query is logged with its parameters and plan.
+        """
+        self.db.instrumentation = SlowQueryLog(
+            0, explain=True, logger=self.logger)
+        select = self.db.Select("SELECT * FROM test WHERE test=?")
+        log, = self._log(select, 1)
+        self.assertIn("0 rows", log)
+        self.assertIn("SELECT * FROM test WHERE test=? (1,)", log)
+        self.assertIn("SCAN", log)  # the query plan
+
+    def test_failed(self):
+        """ A failed query is logged without using the DB to show or explain
+        it.
+        """
+        self.db.instrumentation = SlowQueryLog(
+            0, explain=True, logger=self.logger)
+        select = self.db.Select("SELECT x FROM test WHERE test=?")
+        with patch.object(self.db, "show") as show:
+            with self.assertLogs(self.logger) as logs:
+                with self.assertRaises(SQLiteDB.OperationalError):
+                    select(1)
+        self.assertFalse(show.called)
+        log, = logs.output
+        self.assertIn("failed", log)
+        self.assertIn("SELECT x FROM test WHERE test=? (1,)", log)
+        self.assertNotIn("\n", log)
+
+    def test_long_params(self):
+        """ Long parameters are abbreviated.
+        """
+        self.db.instrumentation = SlowQueryLog(0, logger=self.logger)
+        select = self.db.Select("SELECT * FROM test WHERE test=?")
+        log, = self._log(select, "x" * 100000)
+        self.assertIn("...", log)
+        self.assertLess(len(log), 1000)
+
+    def test_executemany(self):
+        """ The parameter sets of executemany are abbreviated and the
+        statement is not explained.
+        """
+        self.db.instrumentation = SlowQueryLog(
+            0, explain=True, logger=self.logger)
+        insert = self.db.Manipulation("INSERT INTO test VALUES(?)")
+        with patch.object(self.db, "explain") as explain:
+            log, = self._log(insert.executemany, [(i,) for i in range(1000)])
+        self.assertFalse(explain.called)
+        self.assertIn("INSERT INTO test VALUES(?) [(0,), (1,),", log)
+        self.assertLess(len(log), 1000)
+
+    def test_threshold(self):
+        self.db.instrumentation = SlowQueryLog(10, logger=self.logger)
+        self.assertEqual(self._log(self.db.Select("SELECT 1")), [])
+
+    def test_no_explain(self):
+        """ No plan without explain, for statements which can not be
+        explained, when not sampled and within transactions.
+        """
+        queries = [
+            (SlowQueryLog(0, logger=self.logger), "SELECT * FROM test"),
+            (SlowQueryLog(0, explain=True, logger=self.logger),
+             "CREATE TABLE other (test INTEGER)"),
+            (SlowQueryLog(
+                0, explain=True, explain_sample=0, logger=self.logger),
+             "SELECT * FROM test")]
+        for instrumentation, sql in queries:
+            self.db.instrumentation = instrumentation
+            log, = self._log(self.db.Query(sql))
+            self.assertNotIn("\n", log)
+        self.db.instrumentation = SlowQueryLog(
+            0, explain=True, logger=self.logger)
+        with self.db:
+            log, = self._log(self.db.Query("SELECT * FROM test"))
+        self.assertNotIn("\n", log)
+
+    def test_rate_limit(self):
+        limit = _RateLimit(2, 60)
+        self.assertEqual(
+            [limit.allow() for _ in range(3)], [True, True, False])
@@ -123,6 +123,22 @@ class TestSelectIterator(PostgresTestCase):
         self.assertEqual(sg, None)
 
 
+    def test_select_iterator_server_side(self):
+        """ Use a server-side cursor and check that the connection is back in
+        autocommit mode afterwards.
+        """
+        self.db.Manipulation("CREATE TABLE test (id INTEGER)")()
+        self.db.Manipulation(
+            "INSERT INTO test SELECT generate_series(0, 99)")()
+        rows = []
+        select = self.db.SelectIterator(
+            "SELECT id FROM test ORDER BY id", rows.extend, itersize=10)
+        select()
+        self.assertEqual(rows, [(i, ) for i in range(100)])
+        self.assertTrue(
+            self.db._connection.autocommit)  # pylint: disable=protected-access
+
+
 class TestQueryCursor(PostgresTestCase):
     """ Insert several items and test QueryCursor. """
 
@@ -166,3 +182,15 @@ class TestQueryCursor(PostgresTestCase):
                 (row_counter, "hello" + str(row_counter)))
             row_counter += 1
         self.assertEqual(row_counter, 10)
+
+    def test_query_cursor_server_side(self):
+        """ Iterate over a server-side cursor.
+        """
+        self.db.Manipulation("CREATE TABLE test (id INTEGER)")()
+        self.db.Manipulation(
+            "INSERT INTO test SELECT generate_series(0, 99)")()
+        select = self.db.QueryCursor(
+            "SELECT id FROM test ORDER BY id", itersize=10)
+        with select() as cursor:
+            self.assertEqual(list(cursor), [(i, ) for i in range(100)])
+        self.assertTrue(cursor.closed)
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+from threading import Thread
+from time import sleep
+from unittest import TestCase
+
+from dbquery import PoolTimeoutError
+from dbquery.pool import ConnectionPool
+
+
+class _Connection():
+    """ Dummy connection, remembers if it was closed.
+    """
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTest(TestCase):
+    """ Test checking connections in and out of the ConnectionPool.
+    """
+
+    def setUp(self):
+        self.connections = []
+
+    def _connect(self):
+        connection = _Connection()
+        self.connections.append(connection)
+        return connection
+
+    def test_reuse(self):
+        """ A returned connection is handed out again, instead of opening a
+        new one.
+        """
+        pool = ConnectionPool(self._connect)
+        connection = pool.get()
+        pool.put(connection)
+        self.assertIs(pool.get(), connection)
+        self.assertEqual(len(self.connections), 1)
+
+    def test_discard(self):
+        """ A discarded connection gets closed and is not reused.
+        """
+        pool = ConnectionPool(self._connect)
+        connection = pool.get()
+        pool.put(connection, discard=True)
+        self.assertTrue(connection.closed)
+        self.assertIsNot(pool.get(), connection)
+        self.assertEqual(pool.size, 1)
+
+    def test_timeout(self):
+        """ With all connections checked out get waits for the timeout and
+        raises a PoolTimeoutError.
+        """
+        pool = ConnectionPool(self._connect, maxsize=2, timeout=0.01)
+        pool.get()
+        pool.get()
+        with self.assertRaises(PoolTimeoutError):
+            pool.get()
+        self.assertEqual(pool.size, 2)
+
+    def test_wait(self):
+        """ A waiting thread gets the connection as soon as it is returned.
+        """
+        pool = ConnectionPool(self._connect, maxsize=1, timeout=5)
+        connection = pool.get()
+
+        def _put():
+            sleep(0.01)
+            pool.put(connection)
+
+        thread = Thread(target=_put)
+        thread.start()
+        self.assertIs(pool.get(), connection)
+        thread.join()
+
+    def test_reap(self):
+        """ Idle connections above minsize get closed after max_idle.
+        """
+        pool = ConnectionPool(self._connect, minsize=1, max_idle=0.001)
+        first, second = pool.get(), pool.get()
+        pool.put(first)
+        sleep(0.01)
+        pool.put(second)
+        self.assertEqual(pool.size, 1)
+        self.assertEqual(pool.idle, 1)
+        self.assertTrue(first.closed)
+        self.assertFalse(second.closed)
+
+    def test_connect_error(self):
+        """ A failing connect must not use up a slot of the pool.
+        """
+
+        def _connect():
+            raise RuntimeError()
+
+        pool = ConnectionPool(_connect, maxsize=1)
+        with self.assertRaises(RuntimeError):
+            pool.get()
+        self.assertEqual(pool.size, 0)
+
+    def test_close(self):
+        """ Closing the pool closes all idle connections.
+        """
+        pool = ConnectionPool(self._connect)
+        connection = pool.get()
+        pool.put(connection)
+        pool.close()
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.size, 0)
+
+    def test_invalid_size(self):
+        """ minsize must not be larger than maxsize.
+        """
+        with self.assertRaises(ValueError):
+            ConnectionPool(self._connect, minsize=2, maxsize=1)
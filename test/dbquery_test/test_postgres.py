@@ -8,9 +8,26 @@ Prepare a PostgreSQL test database:
   =# CREATE DATABASE <database> WITH OWNER <user>;
 """
 from unittest import TestCase, skipUnless
+from decimal import Decimal
+from io import BytesIO
+from io import StringIO
 from os import getenv
+from threading import Event
+from threading import Thread
 
+from psycopg2 import IntegrityError
+from psycopg2 import NotSupportedError
+from psycopg2.errorcodes import FEATURE_NOT_SUPPORTED
+
+from dbquery import ManipulationCheckError
+from dbquery.cache import ResultCache
+from dbquery.postgres import PooledPostgresDB
 from dbquery.postgres import PostgresDB
+from dbquery.postgres import PostgresListener
+from dbquery.postgres import _RowReader
+from dbquery.postgres import _StatementCache
+from dbquery.postgres import _prepare_sql
+from dbquery.postgres import invalidation_callback
 
 
 _TEST_SCHEMA = "dbquery_test"
@@ -80,6 +97,44 @@ class PostgresTest(PostgresTestCase):
         select = self.db.Select("SELECT * FROM test")
         self.assertEqual(select()[0][0], test_value)
 
+    def test_executemany_values(self):
+        """ Insert rows with execute_values, in several pages.
+        """
+        self.db.Manipulation("CREATE TABLE test (i INTEGER, t VARCHAR)")()
+        insert = self.db.Manipulation(
+            "INSERT INTO test (i, t) VALUES %s", rowcount=25)
+        rows = ((i, str(i)) for i in range(25))
+        self.assertEqual(insert.executemany(rows, page_size=10), 25)
+        self.assertEqual(
+            self.db.SelectOne("SELECT count(*) FROM test")(), 25)
+
+    def test_executemany_batch(self):
+        """ Update rows with execute_batch, the row count is unknown.
+        """
+        self.db.Manipulation("CREATE TABLE test (i INTEGER)")()
+        self.db.Manipulation("INSERT INTO test VALUES (%s)").executemany(
+            [(1, ), (2, )])
+        update = self.db.Manipulation(
+            "UPDATE test SET i=%(new)s WHERE i=%(old)s")
+        self.assertEqual(
+            update.executemany([{"old": 1, "new": 3}, {"old": 2, "new": 4}]),
+            -1)
+        self.assertEqual(
+            self.db.Select("SELECT i FROM test ORDER BY i")(), [(3, ), (4, )])
+
+    def test_executemany_rowcount(self):
+        """ With a row count check the rows of all statements are counted.
+        """
+        self.db.Manipulation("CREATE TABLE test (i INTEGER, t VARCHAR)")()
+        insert = self.db.Manipulation(
+            "INSERT INTO test VALUES (%s, %s)", rowcount=25)
+        rows = ((i, str(i)) for i in range(25))
+        self.assertEqual(insert.executemany(rows, page_size=10), 25)
+        with self.assertRaises(ManipulationCheckError):
+            insert.executemany([(1, "1")])
+        self.assertEqual(
+            self.db.SelectOne("SELECT count(*) FROM test")(), 25)
+
     def test_show(self):
         """ Test show SQL, without parameters.
         """
@@ -192,3 +247,502 @@ class TestNextVal(PostgresTestCase):
         self.db.Manipulation(create_sql)()
         n = self.db.NextVal('{}_{}_seq'.format(table_name, column_name))
         self.assertEqual(n(), 1, 'Should be the first id, 1.')
+
+
+class PooledPostgresTest(PostgresTestCase):
+    """ Test the PooledPostgresDB class, using the test schema through the
+    search_path connection option.
+    """
+
+    def setUp(self):
+        super(PooledPostgresTest, self).setUp()
+        self.pooled_db = PooledPostgresDB(
+            getenv(_DBQUERY_POSTGRES_TEST), maxconn=4, timeout=10,
+            options="-c search_path={}".format(_TEST_SCHEMA))
+        self.pooled_db.Manipulation("CREATE TABLE test (test INTEGER)")()
+
+    def tearDown(self):
+        self.pooled_db.close_all()
+        super(PooledPostgresTest, self).tearDown()
+
+    def test_threads(self):
+        """ Insert rows from several threads at the same time.
+        """
+        insert = self.pooled_db.Manipulation("INSERT INTO test VALUES(%s)")
+
+        def _insert(value):
+            for _ in range(10):
+                insert(value)
+
+        threads = [Thread(target=_insert, args=(i, )) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        count = self.pooled_db.SelectOne("SELECT count(*) FROM test")
+        self.assertEqual(count(), 80)
+        self.assertLessEqual(self.pooled_db.pool.size, 4)
+
+    def test_context_rollback(self):
+        """ A transaction keeps its connection and rolls back on abort.
+        """
+        with self.pooled_db as db:
+            db.Manipulation("INSERT INTO test VALUES(%s)")(1)
+            self.assertEqual(db.pool.idle, 0)
+            db.abort_transaction()
+        self.assertEqual(
+            self.pooled_db.SelectOne("SELECT count(*) FROM test")(), 0)
+        self.assertEqual(self.pooled_db.pool.idle, 1)
+
+    def test_query_cursor(self):
+        """ A QueryCursor returns its connection to the pool when closed.
+        """
+        self.pooled_db.Manipulation("INSERT INTO test VALUES(%s)")(1)
+        with self.pooled_db.QueryCursor("SELECT * FROM test")() as cursor:
+            self.assertEqual(self.pooled_db.pool.idle, 0)
+            self.assertEqual(cursor.fetchone(), (1, ))
+        self.assertEqual(self.pooled_db.pool.idle, 1)
+
+
+class RowReaderTest(TestCase):
+    """ Test converting rows into COPY data, no database needed.
+    """
+
+    def test_text(self):
+        """ Check escaping and NULL values in the text format.
+        """
+        reader = _RowReader(
+            [(1, "a\tb", None), (2, "c\\d\n", bytearray(b"\x01"))], "text")
+        self.assertEqual(
+            reader.read(),
+            "1\ta\\tb\t\\N\n2\tc\\\\d\\n\t\\\\x01\n")
+
+    def test_text_binary(self):
+        """ Binary values are copied in the bytea hex format, str (bytes on
+        Python 2) is text.
+        """
+        reader = _RowReader([(memoryview(b"\x02"), str("x"))], "text")
+        self.assertEqual(reader.read(), "\\\\x02\tx\n")
+
+    def test_text_unicode(self):
+        """ Non-ASCII unicode is copied as is, str() fails on Python 2.
+        """
+        reader = _RowReader([(u"\xe4", Decimal("1.5"))], "text")
+        self.assertEqual(reader.read(), u"\xe4\t1.5\n")
+
+    def test_csv(self):
+        """ Check quoting in the CSV format.
+        """
+        reader = _RowReader([(1, "a,b", None)], "csv")
+        self.assertEqual(reader.read(), '1,"a,b",\n')
+
+    def test_csv_binary(self):
+        """ Binary values are copied in the bytea hex format as in text.
+        """
+        reader = _RowReader([(bytearray(b"\x01\x02"), 1)], "csv")
+        self.assertEqual(reader.read(), "\\x0102,1\n")
+
+    def test_read_size(self):
+        """ Reading in small chunks returns all the data.
+        """
+        rows = [(i, "value") for i in range(10)]
+        expected = _RowReader(rows, "text").read()
+        reader = _RowReader(rows, "text")
+        chunks = []
+        chunk = reader.read(3)
+        while chunk:
+            self.assertLessEqual(len(chunk), 3)
+            chunks.append(chunk)
+            chunk = reader.read(3)
+        self.assertEqual("".join(chunks), expected)
+
+    def test_binary(self):
+        """ Rows can not be converted into the binary format.
+        """
+        with self.assertRaises(ValueError):
+            _RowReader([], "binary")
+
+
+class _Cursor(object):
+    """ Remembers the executed SQL, raises error for EXECUTE, if set.
+    """
+
+    def __init__(self):
+        self.executed = []
+        self.error = None
+
+    def execute(self, sql, params=None):
+        self.executed.append(sql)
+        if self.error is not None and sql.startswith("EXECUTE "):
+            raise self.error
+
+
+class _Connection(object):
+    """ Connection outside of a transaction.
+    """
+
+    autocommit = True
+
+
+class _OutdatedError(NotSupportedError):
+    """ Error of a prepared statement after its table was changed.
+    """
+
+    pgcode = FEATURE_NOT_SUPPORTED
+
+
+class PrepareSQLTest(TestCase):
+    """ Test converting SQL for PREPARE, no database needed.
+    """
+
+    def test_positional(self):
+        self.assertEqual(
+            _prepare_sql("SELECT * FROM t WHERE a=%s AND b LIKE '%%x'"),
+            ("SELECT * FROM t WHERE a=$1 AND b LIKE '%x'", "%s", [None]))
+
+    def test_named(self):
+        """ A name used twice is the same parameter.
+        """
+        self.assertEqual(
+            _prepare_sql("UPDATE t SET a=%(a)s WHERE b=%(b)s OR a=%(a)s"),
+            ("UPDATE t SET a=$1 WHERE b=$2 OR a=$1", "%(a)s, %(b)s",
+             ["a", "b"]))
+
+    def test_not_preparable(self):
+        self.assertIsNone(_prepare_sql("CREATE TABLE t (a INTEGER)"))
+        self.assertIsNone(_prepare_sql("SELECT %s, %(a)s"))
+        self.assertIsNone(_prepare_sql("SELECT '%d'"))
+
+
+class StatementCacheTest(TestCase):
+    """ Test when the _StatementCache prepares statements, no database needed.
+    """
+
+    def setUp(self):
+        self.cursor = _Cursor()
+        self.cache = _StatementCache(2, 2)
+
+    def _lookup(self, sql, can_prepare=True, params=(1, )):
+        return self.cache.lookup(self.cursor, sql, params, can_prepare)
+
+    def test_threshold(self):
+        """ The SQL is prepared on its second execution.
+        """
+        sql = "SELECT * FROM t WHERE a=%s"
+        self.assertIsNone(self._lookup(sql))
+        execute_sql = self._lookup(sql)
+        self.assertTrue(execute_sql.startswith("EXECUTE dbquery_stmt_"))
+        self.assertEqual(self._lookup(sql), execute_sql)
+        self.assertEqual(len(self.cursor.executed), 1)
+        self.assertTrue(self.cursor.executed[0].startswith("PREPARE "))
+        self.assertIn(" (bigint) AS ", self.cursor.executed[0])
+
+    def test_types(self):
+        """ Values of other types than when preparing are executed without
+        the prepared statement, statements with parameters of unknown types
+        are not prepared.
+        """
+        sql = "SELECT * FROM t WHERE a=%(a)s AND b=%(b)s"
+        self._lookup(sql, params={"a": 1, "b": None})
+        self.assertIsNotNone(self._lookup(sql, params={"a": 1, "b": None}))
+        self.assertIn(" (bigint, unknown) AS ", self.cursor.executed[0])
+        self.assertIsNotNone(self._lookup(sql, params={"a": None, "b": "x"}))
+        self.assertIsNone(self._lookup(sql, params={"a": 1.5, "b": None}))
+        self.assertIsNone(self._lookup(sql, params={"a": 1, "b": 2}))
+        self.assertIsNone(self._lookup(sql, params={"a": 2 ** 64, "b": "x"}))
+        self.assertIsNone(self._lookup(sql, params={"a": 1}))
+        sql = "SELECT * FROM t WHERE a=%s"
+        for _ in range(3):
+            self.assertIsNone(self._lookup(sql, params=([1], )))
+        self.assertIsNotNone(self._lookup(sql, params=(True, )))
+        self.assertIn(" (boolean) AS ", self.cursor.executed[-1])
+
+    def test_transaction(self):
+        """ Nothing is prepared during a transaction.
+        """
+        sql = "SELECT * FROM t WHERE a=%s"
+        for _ in range(3):
+            self.assertIsNone(self._lookup(sql, can_prepare=False))
+        self.assertIsNotNone(self._lookup(sql))
+
+    def test_evict(self):
+        """ The least recently used statement gets deallocated.
+        """
+        sqls = ["SELECT {} FROM t WHERE a=%s".format(i) for i in range(3)]
+        for sql in sqls:
+            self._lookup(sql)
+            self._lookup(sql)
+        self.assertTrue(self.cursor.executed[-2].startswith("DEALLOCATE "))
+        self.assertTrue(self.cursor.executed[-1].startswith("PREPARE "))
+        self.assertIn(self.cursor.executed[-2][11:], self.cursor.executed[0])
+
+    def test_execute_error(self):
+        """ A failing EXECUTE keeps the statement prepared, unless the error
+        is caused by the prepared statement. Then it is deallocated and the
+        SQL executed again.
+        """
+        # pylint: disable=protected-access
+        db = PostgresDB()
+        db._connection = _Connection()
+        db._statement_caches[db._connection] = self.cache
+        sql = "INSERT INTO t VALUES(%s)"
+        self._lookup(sql)
+        self.cursor.error = IntegrityError()
+        with self.assertRaises(IntegrityError):
+            db._execute_statement(self.cursor, sql, (1, ))
+        self.assertTrue(self.cursor.executed[-1].startswith("EXECUTE "))
+        self.assertIsNotNone(self._lookup(sql))
+        self.cursor.error = _OutdatedError()
+        db._execute_statement(self.cursor, sql, (1, ))
+        self.assertTrue(self.cursor.executed[-2].startswith("DEALLOCATE "))
+        self.assertEqual(self.cursor.executed[-1], sql)
+        self.assertIsNone(self._lookup(sql))
+
+    def test_discard(self):
+        """ After a discard the SQL is counted again, the statement is
+        deallocated right away or after the transaction.
+        """
+        sql = "SELECT * FROM t WHERE a=%s"
+        self._lookup(sql)
+        self._lookup(sql)
+        self.cache.discard(self.cursor, sql, True)
+        name = self.cursor.executed[0].split()[1]
+        self.assertEqual(self.cursor.executed[-1], "DEALLOCATE " + name)
+        self.assertIsNone(self._lookup(sql))
+        self._lookup(sql)
+        self.cache.discard(self.cursor, sql, False)
+        name = self.cursor.executed[-1].split()[1]
+        self.assertIsNone(self._lookup(sql, can_prepare=False))
+        self.assertTrue(self.cursor.executed[-1].startswith("PREPARE "))
+        self._lookup(sql)
+        self.assertEqual(self.cursor.executed[-2], "DEALLOCATE " + name)
+        self.assertTrue(self.cursor.executed[-1].startswith("PREPARE "))
+
+
+class PreparedStatementTest(PostgresTestCase):
+    """ Test executing prepared statements.
+    """
+
+    def setUp(self):
+        super(PreparedStatementTest, self).setUp()
+        self.db.Manipulation("CREATE TABLE test (i INTEGER, t VARCHAR)")()
+        self.db.Manipulation("INSERT INTO test VALUES(%s, %s)").executemany(
+            (i, str(i)) for i in range(10))
+        self.prepared = self.db.Select(
+            "SELECT name FROM pg_prepared_statements")
+
+    def test_prepared(self):
+        """ Repeated queries use a prepared statement and get the same
+        results.
+        """
+        select = self.db.SelectOne("SELECT t FROM test WHERE i=%(i)s")
+        self.assertEqual([select(i=i) for i in range(10)], [
+            str(i) for i in range(10)])
+        self.assertEqual(len(self.prepared()), 1)
+        update = self.db.Manipulation("UPDATE test SET t=%s WHERE i=%s")
+        self.assertEqual([update("x", i) for i in range(10)], [1] * 10)
+        self.assertEqual(len(self.prepared()), 2)
+
+    def test_types(self):
+        """ The prepared statement does not change the results for values of
+        another type.
+        """
+        count = self.db.SelectOne("SELECT count(*) FROM test WHERE i=%s")
+        self.assertEqual([count(1) for _ in range(10)], [1] * 10)
+        self.assertEqual(count(1.5), 0)
+        self.assertEqual(len(self.prepared()), 1)
+
+    def test_changed_table(self):
+        """ After the table was changed the statement is executed again
+        without the prepared statement, outside of transactions.
+        """
+        select = self.db.Select("SELECT * FROM test WHERE i=%s")
+        for _ in range(10):
+            select(1)
+        self.db.Manipulation("ALTER TABLE test ADD COLUMN x INTEGER")()
+        self.assertEqual(select(1), [(1, "1", None)])
+        for _ in range(10):
+            select(1)
+        self.db.Manipulation("ALTER TABLE test DROP COLUMN x")()
+        with self.assertRaises(NotSupportedError):
+            with self.db:
+                select(1)
+        self.assertEqual(select(1), [(1, "1")])
+
+    def test_reconnect(self):
+        """ Prepared statements are gone after closing the connection.
+        """
+        select = self.db.SelectOne("SELECT t FROM test WHERE i=%s")
+        for i in range(10):
+            select(i)
+        self.db.close()
+        self.set_search_path()
+        self.assertEqual(len(self.prepared()), 0)
+        self.assertEqual(select(1), "1")
+
+    def test_disabled(self):
+        """ Without prepare_threshold nothing gets prepared.
+        """
+        db = PostgresDB(
+            getenv(_DBQUERY_POSTGRES_TEST), prepare_threshold=None,
+            options="-c search_path={}".format(_TEST_SCHEMA))
+        select = db.SelectOne("SELECT t FROM test WHERE i=%s")
+        for i in range(10):
+            select(i)
+        self.assertEqual(
+            db.Select("SELECT name FROM pg_prepared_statements")(), [])
+        db.close()
+
+
+class CopyTest(PostgresTestCase):
+    """ Test CopyIn and CopyOut.
+    """
+
+    def setUp(self):
+        super(CopyTest, self).setUp()
+        self.db.Manipulation("CREATE TABLE test (i INTEGER, t VARCHAR)")()
+
+    def test_copy_in_rows(self):
+        """ Copy rows from a generator into the table.
+        """
+        copy_in = self.db.CopyIn("test")
+        rows = ((i, "row\t{}".format(i)) for i in range(1000))
+        self.assertEqual(copy_in(rows), 1000)
+        self.assertEqual(
+            self.db.SelectOne("SELECT t FROM test WHERE i=7")(), "row\t7")
+
+    def test_copy_in_file(self):
+        """ Copy CSV data from a file, only into some columns.
+        """
+        copy_in = self.db.CopyIn("test", ["i"], copy_format="csv")
+        self.assertEqual(copy_in(StringIO("1\n2\n")), 2)
+        self.assertEqual(
+            self.db.Select("SELECT i, t FROM test ORDER BY i")(),
+            [(1, None), (2, None)])
+
+    def test_copy_out(self):
+        """ Copy a query result with parameters as CSV into a text file.
+        """
+        self.db.CopyIn("test")([(1, "a"), (2, "b,c")])
+        target = StringIO()
+        copy_out = self.db.CopyOut(
+            "SELECT i, t FROM test WHERE i > %s ORDER BY i", header=True)
+        self.assertEqual(copy_out(target, 0), 2)
+        self.assertEqual(target.getvalue(), 'i,t\n1,a\n2,"b,c"\n')
+
+    def test_copy_out_binary(self):
+        """ Copy a whole table in the binary format into a bytes file.
+        """
+        self.db.CopyIn("test")([(1, "a")])
+        target = BytesIO()
+        self.db.CopyOut("test", copy_format="binary")(target)
+        self.assertTrue(target.getvalue().startswith(b"PGCOPY\n"))
+
+
+class InvalidationCallbackTest(TestCase):
+    """ Test invalidation_callback and calling the listener callbacks.
+    """
+
+    def setUp(self):
+        super(InvalidationCallbackTest, self).setUp()
+        self.cache = ResultCache()
+        self.cache.put("a", 1, tags=frozenset(["a"]))
+        self.cache.put("b", 2, tags=frozenset(["b"]))
+        self.cache.put("c", 3, tags=frozenset(["c"]))
+        self.invalidate = invalidation_callback(self.cache)
+
+    def test_tables(self):
+        """ The payload lists the tables to invalidate.
+        """
+        self.invalidate("a,c")
+        self.assertEqual(self.cache.get("b"), (True, 2))
+        self.assertEqual(len(self.cache), 1)
+
+    def test_reconnect(self):
+        """ None (after a reconnect) clears the cache.
+        """
+        self.invalidate(None)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_dispatch(self):
+        """ A failing callback does not stop the others.
+        """
+        listener = PostgresListener()
+        payloads = []
+
+        def fail(payload):
+            raise ValueError(payload)
+
+        listener.add_callback("channel", fail)
+        listener.add_callback("channel", payloads.append)
+        listener.add_callback("other", self.invalidate)
+        listener._dispatch("channel", "x")  # pylint: disable=protected-access
+        self.assertEqual(payloads, ["x"])
+        self.assertEqual(len(self.cache), 3)
+
+
+class ListenerTest(PostgresTestCase):
+    """ Test PostgresListener with NOTIFY.
+    """
+
+    def setUp(self):
+        super(ListenerTest, self).setUp()
+        self.listener = PostgresListener(
+            getenv(_DBQUERY_POSTGRES_TEST), timeout=0.1)
+
+    def tearDown(self):
+        self.listener.stop()
+        super(ListenerTest, self).tearDown()
+
+    def test_poll(self):
+        """ Notifications are delivered by poll, after the commit.
+        """
+        payloads = []
+        self.listener.add_callback("dbquery test", payloads.append)
+        self.listener.fileno()  # connects
+        with self.db:
+            self.db.notify("dbquery test", "payload")
+            self.listener.poll()
+            self.assertEqual(payloads, [])
+        self.listener.poll()
+        self.assertEqual(payloads, ["payload"])
+
+    def test_invalidation(self):
+        """ Invalidating tables in one process clears the results cached by
+        another.
+        """
+        db = PostgresDB(
+            getenv(_DBQUERY_POSTGRES_TEST),
+            invalidation_channel="dbquery_invalidate")
+        cache = ResultCache()
+        cache.put("key", 1, tags=frozenset(["test"]))
+        invalidated = Event()
+
+        def invalidate(payload):
+            invalidation_callback(cache)(payload)
+            invalidated.set()
+
+        self.listener.add_callback("dbquery_invalidate", invalidate)
+        self.listener.start()
+        db.invalidate(["Test"])
+        db.close()
+        self.assertTrue(invalidated.wait(5))
+        self.assertEqual(len(cache), 0)
+
+    def test_invalidation_rollback(self):
+        """ The invalidation is only sent after a commit.
+        """
+        db = PostgresDB(
+            getenv(_DBQUERY_POSTGRES_TEST),
+            invalidation_channel="dbquery_invalidate")
+        payloads = []
+        self.listener.add_callback("dbquery_invalidate", payloads.append)
+        self.listener.fileno()  # connects
+        with db:
+            db.invalidate("rolled_back")
+            db.abort_transaction()
+        with db:
+            db.invalidate("committed")
+        db.close()
+        self.listener.poll()
+        self.assertEqual(payloads, ["committed"])
@@ -6,7 +6,15 @@ except ImportError:
     from mock import patch
 
 from dbquery import ManipulationCheckError, to_dict_formatter
+from dbquery import NamedTupleFormatter
+from dbquery import RecordFormatter
 from dbquery.db import DB as DBBase
+from dbquery.query import AdaptiveArraysize
+from dbquery import CircuitOpenError
+from dbquery.instrument import Instrumentation
+from dbquery.retry import CircuitBreaker
+from dbquery.retry import RetryBudget
+from dbquery.retry import RetryPolicy
 
 
 _RETRY = 2
@@ -24,6 +32,7 @@ class DB(DBBase):  # pylint: disable=abstract-method
         self._raise_on_exec = False
         self._exec_cursor = None
         self.execute_calls = 0
+        self.itersize = None
 
     def set_raise_on_exec(self):
         """ Advice execute to raise a InternaLError exception.
@@ -49,6 +58,13 @@ class DB(DBBase):  # pylint: disable=abstract-method
             return produce_return(self._exec_cursor)
         return produce_return((sql, params))
 
+    def server_side_execute(
+            self, sql, params, produce_return, itersize=None):
+        """ Remember itersize, then execute.
+        """
+        self.itersize = itersize
+        return self.execute(sql, params, produce_return)
+
     def show(self, sql, params):
         """ Returns unmodified (sql, params) right back.
         """
@@ -113,6 +129,16 @@ class _Cursor():
         self.closed = True
 
 
+class _StreamCursor(_Cursor):
+    """ Dummy cursor which returns every row only once, like a real cursor.
+    """
+
+    def fetchmany(self, count):
+        rows = super(_StreamCursor, self).fetchmany(count)
+        self._results = self._results[count:]
+        return rows
+
+
 class QueryTest(TestCase):
     """ Test the Query class.
     """
@@ -172,6 +198,57 @@ class QueryTest(TestCase):
                 self.db.Query("")()
         self.assertEqual(self.db.execute_calls, _RETRY)
 
+    def test_retry_policy(self):
+        """ With a RetryPolicy Query waits between the attempts.
+        """
+        self.db._retry = RetryPolicy(attempts=4, base_delay=1)
+        self.db.set_raise_on_exec()
+        with self.assertRaises(self.db.OperationalError):
+            with patch("dbquery.query._LOG"):  # hide log
+                with patch("dbquery.query.sleep") as sleep:
+                    self.db.Query("")()
+        self.assertEqual(self.db.execute_calls, 4)
+        delays = [args[0] for args, _ in sleep.call_args_list]
+        self.assertEqual(len(delays), 3)
+        self.assertTrue(all(0 <= d <= 4 for d in delays))
+
+    def test_retry_budget(self):
+        """ Retries of all queries stop when the budget is used up.
+        """
+        budget = RetryBudget(min_per_second=0, max_tokens=3)
+        self.db._retry = RetryPolicy(attempts=3, base_delay=0, budget=budget)
+        self.db.set_raise_on_exec()
+        query = self.db.Query("")
+        with patch("dbquery.query._LOG"):  # hide log
+            for _ in range(3):
+                with self.assertRaises(self.db.OperationalError):
+                    query()
+        self.assertEqual(self.db.execute_calls, 3 + 2 + 1)
+
+    def test_circuit_breaker(self):
+        """ An open circuit breaker stops retrying and fails queries without
+        executing them, state changes are reported to the instrumentation.
+        """
+        states = []
+
+        class _Instrumentation(Instrumentation):
+
+            def circuit_state(self, db, state):
+                states.append(state)
+
+        self.db.instrumentation = _Instrumentation()
+        self.db.circuit_breaker = CircuitBreaker(
+            failure_threshold=1, reset_timeout=60)
+        self.db.set_raise_on_exec()
+        query = self.db.Query("")
+        with patch("dbquery.query._LOG"):  # hide log
+            with self.assertRaises(self.db.OperationalError):
+                query()
+            with self.assertRaises(CircuitOpenError):
+                query()
+        self.assertEqual(self.db.execute_calls, 1)
+        self.assertEqual(states, ["open"])
+
 
 class SelectTest(TestCase):
     """ Test the Select class.
@@ -208,6 +285,51 @@ class SelectTest(TestCase):
             list(s()), [{"test": 0, "test2": 1}, ],
             "Result should be the same")
 
+    def _description_cursor(self, results):
+        """ Cursor with the columns a and b.
+        """
+        return _Cursor(
+            results,
+            (("a", None, None, None, None, None, None),
+             ("b", None, None, None, None, None, None)))
+
+    def test_named_tuple_formatter(self):
+        """ Rows become namedtuples, the class is only created once.
+        """
+        formatter = NamedTupleFormatter()
+        self.db.set_cursor(self._description_cursor([(0, 1), (2, 3)]))
+        s = self.db.Select("", row_formatter=formatter)
+        rows = list(s())
+        self.assertEqual(rows, [(0, 1), (2, 3)])
+        self.assertEqual(rows[1].b, 3)
+        self.assertIs(type(list(s())[0]), type(rows[0]))
+
+    def test_record_formatter(self):
+        """ Rows become records with one attribute per column.
+        """
+        self.db.set_cursor(self._description_cursor([(0, 1)]))
+        row, = self.db.Select("", row_formatter=RecordFormatter())()
+        self.assertEqual((row.a, row.b), (0, 1))
+        self.assertEqual(tuple(row), (0, 1))
+        self.assertFalse(hasattr(row, "__dict__"))
+        row.a = 5
+        self.assertEqual(row.a, 5)
+
+    def test_plain_formatter(self):
+        """ A function(row, cursor) is still called for every row.
+        """
+        cursor = self._description_cursor([(0, 1), (2, 3)])
+        self.db.set_cursor(cursor)
+        calls = []
+
+        def _formatter(row, row_cursor):
+            calls.append(row_cursor)
+            return sum(row)
+
+        s = self.db.Select("", row_formatter=_formatter)
+        self.assertEqual(list(s()), [1, 5])
+        self.assertEqual(calls, [cursor, cursor])
+
     def test_to_dict_formatter_empty_row(self):
         """Do give the formatter an empty row and check that an empty row is
         returned.
@@ -257,6 +379,149 @@ class SelectOneTest(TestCase):
         self.assertEqual(s(), None)
 
 
+class SelectIteratorTest(TestCase):
+    """ Test SelectIterator class.
+    """
+
+    def setUp(self):
+        self.db = DB()
+
+    def test_itersize(self):
+        """ With itersize the server-side execute function is used and
+        arraysize defaults to itersize.
+        """
+        cursor = _StreamCursor([(0, ), (1, ), (2, )], None)
+        fetched = []
+        fetchmany = cursor.fetchmany
+
+        def _fetchmany(count):
+            fetched.append(count)
+            return fetchmany(count)
+
+        cursor.fetchmany = _fetchmany
+        self.db.set_cursor(cursor)
+        rows = []
+        select = self.db.SelectIterator(
+            "", lambda row_generator: rows.extend(row_generator), itersize=2)
+        select()
+        self.assertEqual(self.db.itersize, 2)
+        self.assertEqual(rows, [(0, ), (1, ), (2, )])
+        self.assertEqual(fetched, [2, 2, 2])
+
+    def test_no_itersize(self):
+        """ Without itersize the normal execute function is used.
+        """
+        self.db.set_cursor(_Cursor([], None))
+        self.db.SelectIterator("", list)()
+        self.assertEqual(self.db.itersize, None)
+        self.assertEqual(self.db.execute_calls, 1)
+
+    def test_adaptive_arraysize(self):
+        """ The arraysize grows while fetching is fast.
+        """
+        cursor = _StreamCursor([(i, ) for i in range(20)], None)
+        fetched = []
+        fetchmany = cursor.fetchmany
+
+        def _fetchmany(count):
+            fetched.append(count)
+            return fetchmany(count)
+
+        cursor.fetchmany = _fetchmany
+        self.db.set_cursor(cursor)
+        rows = []
+        select = self.db.SelectIterator(
+            "", lambda row_generator: rows.extend(row_generator),
+            arraysize=AdaptiveArraysize(initial=2), itersize=5)
+        select()
+        self.assertEqual(rows, [(i, ) for i in range(20)])
+        self.assertEqual(fetched, [2, 4, 8, 16, 32])
+
+    def test_prefetch(self):
+        """ Blocks are fetched in another thread, the rows stay in order.
+        """
+        cursor = _StreamCursor([(i, ) for i in range(10)], None)
+        self.db.set_cursor(cursor)
+        rows = []
+        select = self.db.SelectIterator(
+            "", lambda row_generator: rows.extend(row_generator), arraysize=3,
+            prefetch=2)
+        select()
+        self.assertEqual(rows, [(i, ) for i in range(10)])
+
+    def test_prefetch_stop(self):
+        """ Prefetching stops when the callback does not read all rows.
+        """
+        cursor = _StreamCursor([(i, ) for i in range(100)], None)
+        self.db.set_cursor(cursor)
+        rows = []
+        select = self.db.SelectIterator(
+            "", lambda row_generator: rows.append(next(row_generator)),
+            prefetch=1)
+        select()
+        self.assertEqual(rows, [(0, )])
+        self.assertTrue(len(cursor._results) > 90)
+
+    def test_prefetch_error(self):
+        """ Fetch errors are raised in the callback.
+        """
+        cursor = _StreamCursor([(0, ), (1, )], None)
+        fetchmany = cursor.fetchmany
+
+        def _fetchmany(count):
+            if not cursor._results[1:]:
+                raise ValueError()
+            return fetchmany(count)
+
+        cursor.fetchmany = _fetchmany
+        self.db.set_cursor(cursor)
+        rows = []
+        select = self.db.SelectIterator(
+            "", lambda row_generator: rows.extend(row_generator),
+            prefetch=2)
+        self.assertRaises(ValueError, select)
+        self.assertEqual(rows, [(0, )])
+
+
+class AdaptiveArraysizeTest(TestCase):
+    """ Test choosing the arraysize with AdaptiveArraysize.
+    """
+
+    def test_time(self):
+        """ Grows by at most factor 2 towards the target time, shrinks
+        immediately.
+        """
+        arraysize = AdaptiveArraysize(target_time=1, initial=10)
+        arraysize.record([(1, )] * 10, 0.01)  # 1000 rows per second
+        self.assertEqual(arraysize.arraysize, 20)
+        for _ in range(10):
+            arraysize.record([(1, )] * arraysize.arraysize, 0.001 * (
+                arraysize.arraysize))
+        self.assertEqual(arraysize.arraysize, 1000)
+        arraysize.record([(1, )] * 1000, 100)  # much slower
+        self.assertTrue(arraysize.arraysize < 100)
+
+    def test_limits(self):
+        arraysize = AdaptiveArraysize(initial=10, minimum=5, maximum=15)
+        arraysize.record([(1, )] * 10, 0)
+        self.assertEqual(arraysize.arraysize, 15)
+        arraysize.record([(1, )] * 15, 1000)
+        self.assertEqual(arraysize.arraysize, 5)
+        stats = arraysize.stats()
+        self.assertEqual(
+            (stats["smallest"], stats["largest"], stats["fetches"],
+             stats["rows"]),
+            (5, 15, 2, 25))
+
+    def test_max_bytes(self):
+        """ The estimated size of a block stays below max_bytes.
+        """
+        arraysize = AdaptiveArraysize(max_bytes=10000, initial=1000)
+        arraysize.record([("x" * 100, )] * 1000, 0)
+        self.assertTrue(arraysize.arraysize < 100)
+        self.assertIsNotNone(arraysize.stats()["bytes_per_row"])
+
+
 class ManipulationTest(TestCase):
     """ Test Manipulation class.
     """
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from dbquery import ReplicatedDB
+from dbquery import SQLiteDB
+from dbquery.replica import LEAST_LATENCY
+from dbquery.retry import CLOSED
+from dbquery.retry import CircuitBreaker
+
+
+class _FailingDB(SQLiteDB):
+    """ SQLiteDB which can be set to fail, like a replica which is down.
+    """
+
+    fail = False
+
+    def read_execute(self, sql, params, produce_return):
+        if self.fail:
+            raise self.OperationalError("down")
+        return super(_FailingDB, self).read_execute(
+            sql, params, produce_return)
+
+    def execute(self, sql, params, produce_return):
+        if self.fail:
+            raise self.OperationalError("down")
+        return super(_FailingDB, self).execute(sql, params, produce_return)
+
+
+class ReplicatedDBTest(TestCase):
+    """ Test routing queries with ReplicatedDB, with a database file for the
+    primary and every replica, which contain their name.
+    """
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.primary = self._db("primary")
+        self.replicas = [self._db("replica1"), self._db("replica2")]
+        self.db = ReplicatedDB(self.primary, self.replicas)
+        self.name = self.db.SelectOne("SELECT name FROM test")
+
+    def tearDown(self):
+        self.db.close_all()
+        rmtree(self.directory)
+
+    def _db(self, name):
+        db = _FailingDB(path.join(self.directory, name + ".db"))
+        db.Manipulation("CREATE TABLE test (name VARCHAR)")()
+        db.Manipulation("INSERT INTO test VALUES(?)")(name)
+        return db
+
+    def test_round_robin(self):
+        self.assertEqual(
+            sorted(self.name() for _ in range(4)),
+            ["replica1", "replica1", "replica2", "replica2"])
+
+    def test_least_latency(self):
+        db = ReplicatedDB(
+            self.primary, self.replicas, strategy=LEAST_LATENCY)
+        db.check_replicas()
+        fastest = min(db.status(), key=lambda s: s[2])[0]
+        fastest = fastest.SelectOne("SELECT name FROM test")()
+        self.assertEqual(db.SelectOne("SELECT name FROM test")(), fastest)
+
+    def test_primary(self):
+        """ Manipulations and all queries within a transaction use the
+        primary.
+        """
+        self.db.Manipulation("UPDATE test SET name='changed'")()
+        self.assertEqual(
+            self.primary.SelectOne("SELECT name FROM test")(), "changed")
+        self.assertNotEqual(self.name(), "changed")
+        with self.db:
+            self.assertEqual(self.name(), "changed")
+            self.assertTrue(self.db.in_transaction)
+        self.assertFalse(self.primary.in_transaction)
+
+    def test_rollback(self):
+        with self.assertRaises(ValueError):
+            with self.db:
+                self.db.Manipulation("UPDATE test SET name='changed'")()
+                raise ValueError()
+        self.assertEqual(
+            self.primary.SelectOne("SELECT name FROM test")(), "primary")
+
+    def test_failover(self):
+        """ A failing replica is not used anymore, the query is retried on
+        the other one and then on the primary.
+        """
+        self.replicas[0].fail = True
+        self.assertEqual(
+            [self.name() for _ in range(3)], ["replica2"] * 3)
+        self.assertEqual(
+            [healthy for _, healthy, _ in self.db.status()], [False, True])
+        self.replicas[1].fail = True
+        self.assertEqual(self.name(), "primary")
+
+    def test_check_replicas(self):
+        """ A replica is used again once the check succeeds.
+        """
+        self.replicas[0].fail = True
+        status = self.db.check_replicas()
+        self.assertEqual([s[1] for s in status], [False, True])
+        self.replicas[0].fail = False
+        status = self.db.check_replicas()
+        self.assertEqual([s[1] for s in status], [True, True])
+
+    def test_circuit_breaker(self):
+        """ Failing replicas do not open the circuit breaker, the query fails
+        over to the primary.
+        """
+        self.db.circuit_breaker = CircuitBreaker(failure_threshold=2)
+        self.replicas[0].fail = True
+        self.replicas[1].fail = True
+        self.assertEqual(self.name(), "primary")
+        self.assertEqual(self.db.circuit_breaker.state, CLOSED)
+        self.db.Manipulation("INSERT INTO test VALUES('new')")()
+
+    def test_invalidate(self):
+        """ Invalidating tables clears the cached results of the ReplicatedDB
+        and the primary.
+        """
+        name = self.db.SelectOne(
+            "SELECT name FROM test", cache_ttl=60, tables="test")
+        primary_name = self.primary.SelectOne(
+            "SELECT name FROM test", cache_ttl=60, tables="test")
+        cached = name()
+        self.assertEqual(primary_name(), "primary")
+        self.db.Manipulation("UPDATE test SET name='changed'", tables="test")()
+        self.assertNotEqual(name(), cached)  # the other replica
+        self.assertEqual(primary_name(), "changed")
+
+    def test_no_retry(self):
+        db = ReplicatedDB(self.primary, self.replicas, retry=1)
+        self.replicas[0].fail = True
+        self.replicas[1].fail = True
+        with self.assertRaises(SQLiteDB.OperationalError):
+            db.SelectOne("SELECT name FROM test")()
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+from time import sleep
+from unittest import TestCase
+
+from dbquery.retry import CLOSED
+from dbquery.retry import HALF_OPEN
+from dbquery.retry import OPEN
+from dbquery.retry import CircuitBreaker
+from dbquery.retry import CircuitOpenError
+from dbquery.retry import RetryBudget
+from dbquery.retry import RetryPolicy
+from dbquery.retry import retry_policy
+
+
+class RetryPolicyTest(TestCase):
+    """ Test the RetryPolicy class.
+    """
+
+    def test_attempts(self):
+        policy = RetryPolicy(attempts=3, base_delay=0)
+        self.assertEqual(policy.delay(1, 0), 0)
+        self.assertEqual(policy.delay(2, 0), 0)
+        self.assertIsNone(policy.delay(3, 0))
+
+    def test_backoff(self):
+        """ The delay is random, up to base_delay doubled per retry and at
+        most max_delay.
+        """
+        policy = RetryPolicy(
+            attempts=10, base_delay=0.1, max_delay=0.5)
+        for attempt, limit in [(1, 0.1), (2, 0.2), (3, 0.4), (9, 0.5)]:
+            delays = [policy.delay(attempt, 0) for _ in range(100)]
+            self.assertTrue(all(0 <= d <= limit for d in delays))
+            self.assertTrue(max(delays) > limit / 2)
+
+    def test_max_elapsed(self):
+        policy = RetryPolicy(base_delay=0, max_elapsed=1)
+        self.assertEqual(policy.delay(1, 0.5), 0)
+        self.assertIsNone(policy.delay(1, 1.5))
+
+    def test_budget(self):
+        """ Retries stop when the budget is used up.
+        """
+        budget = RetryBudget(ratio=0.5, min_per_second=0, max_tokens=2)
+        policy = RetryPolicy(attempts=10, base_delay=0, budget=budget)
+        self.assertEqual(policy.delay(1, 0), 0)
+        self.assertEqual(policy.delay(1, 0), 0)
+        self.assertIsNone(policy.delay(1, 0))
+        policy.succeeded()
+        policy.succeeded()
+        self.assertEqual(policy.delay(1, 0), 0)
+
+    def test_retry_policy(self):
+        """ A retry count means retrying without delay.
+        """
+        policy = retry_policy(3)
+        self.assertIs(retry_policy(3), policy)
+        self.assertEqual(policy.attempts, 3)
+        self.assertEqual(policy.delay(1, 0), 0)
+        own = RetryPolicy()
+        self.assertIs(retry_policy(own), own)
+
+
+class RetryBudgetTest(TestCase):
+    """ Test the RetryBudget class.
+    """
+
+    def test_refill(self):
+        budget = RetryBudget(min_per_second=100, max_tokens=1)
+        self.assertTrue(budget.withdraw())
+        self.assertFalse(budget.withdraw())
+        sleep(0.02)
+        self.assertTrue(budget.withdraw())
+
+    def test_max_tokens(self):
+        budget = RetryBudget(ratio=1, min_per_second=0, max_tokens=2)
+        for _ in range(5):
+            budget.deposit()
+        self.assertEqual(budget.tokens, 2)
+
+
+class CircuitBreakerTest(TestCase):
+    """ Test the CircuitBreaker states.
+    """
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.02)
+
+    def test_open(self):
+        """ Opens after failure_threshold consecutive failures.
+        """
+        self.assertIsNone(self.breaker.failed())
+        self.assertIsNone(self.breaker.succeeded())
+        self.assertIsNone(self.breaker.failed())
+        self.assertEqual(self.breaker.failed(), OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before()
+
+    def test_probe(self):
+        """ After reset_timeout one probe is allowed, closing the breaker
+        when it succeeds.
+        """
+        self.breaker.failed()
+        self.breaker.failed()
+        sleep(0.03)
+        self.assertEqual(self.breaker.before(), HALF_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before()  # only one probe
+        self.assertEqual(self.breaker.succeeded(), CLOSED)
+        self.assertIsNone(self.breaker.before())
+
+    def test_probe_failed(self):
+        self.breaker.failed()
+        self.breaker.failed()
+        sleep(0.03)
+        self.breaker.before()
+        self.assertEqual(self.breaker.failed(), OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before()
+
+    def test_probe_timeout(self):
+        """ Another probe is allowed if one did not finish in time.
+        """
+        self.breaker.failed()
+        self.breaker.failed()
+        sleep(0.03)
+        self.breaker.before()
+        sleep(0.03)
+        self.assertIsNone(self.breaker.before())
+        self.assertEqual(self.breaker.state, HALF_OPEN)
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from dbquery import ManipulationCheckError
+from dbquery import PooledSQLiteDB
+from dbquery import to_dict_formatter
+from dbquery.shard import ShardedDB
+from dbquery.shard import _merge_ordered
+from dbquery.shard import shard_index
+
+
+class ShardIndexTest(TestCase):
+
+    def test_stable(self):
+        """ Keys are distributed by CRC32, the same in every process.
+        """
+        self.assertEqual(shard_index("a", 4), 3)
+        self.assertEqual(shard_index(b"a", 4), 3)
+        self.assertEqual(shard_index(12345, 7), shard_index("12345", 7))
+
+    def test_distribution(self):
+        counts = [0] * 4
+        for key in range(1000):
+            counts[shard_index(key, 4)] += 1
+        self.assertTrue(all(200 < c < 300 for c in counts))
+
+
+class MergeTest(TestCase):
+    """ Test the merge for Python versions before 3.5.
+    """
+
+    def test_merge(self):
+        self.assertEqual(
+            list(_merge_ordered(
+                [[1, 4, 4], [], [2, 3, 5]], lambda i: i, False)),
+            [1, 2, 3, 4, 4, 5])
+
+    def test_reverse(self):
+        """ Equal keys keep the order of the iterables.
+        """
+        self.assertEqual(
+            list(_merge_ordered(
+                [[(5, "a"), (1, "a")], [(5, "b"), (2, "b")]],
+                lambda row: row[0], True)),
+            [(5, "a"), (5, "b"), (2, "b"), (1, "a")])
+
+
+class ShardedDBTest(TestCase):
+    """ Test ShardedDB with a SQLite database file per shard.
+    """
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.db = ShardedDB([
+            PooledSQLiteDB(path.join(self.directory, "{}.db".format(i)))
+            for i in range(3)])
+        self.db.Manipulation("CREATE TABLE test (i INTEGER)")()
+        for i in range(10):
+            self.db.on(i).Manipulation("INSERT INTO test VALUES(?)")(i)
+
+    def tearDown(self):
+        self.db.shutdown()
+        for shard in self.db.shards:
+            shard.close_all()
+        rmtree(self.directory)
+
+    def test_on(self):
+        """ Every key is stored on its shard only.
+        """
+        for i in range(10):
+            select = self.db.on(i).SelectOne(
+                "SELECT count(*) FROM test WHERE i=?")
+            self.assertEqual(select(i), 1)
+
+    def test_select(self):
+        select = self.db.Select("SELECT i FROM test WHERE i < ?")
+        rows, timings = select.timed(5)
+        self.assertEqual(sorted(rows), [(i, ) for i in range(5)])
+        self.assertEqual(len(timings), 3)
+
+    def test_merge(self):
+        """ Rows ordered per shard are merged in order, with a limit.
+        """
+        select = self.db.Select(
+            "SELECT i FROM test ORDER BY i DESC LIMIT ?", to_dict_formatter,
+            key=lambda row: row["i"], reverse=True, limit=4)
+        self.assertEqual(select(4), [{"i": i} for i in (9, 8, 7, 6)])
+
+    def test_manipulation(self):
+        """ Returns the total row count, checks the count per shard.
+        """
+        self.assertEqual(
+            self.db.Manipulation("UPDATE test SET i=i+1")(), 10)
+        with self.assertRaises(ManipulationCheckError):
+            self.db.Manipulation("DELETE FROM test", rowcount=3)()
+
+    def test_error(self):
+        with self.assertRaises(PooledSQLiteDB.OperationalError):
+            self.db.Select("SELECT x FROM test")()
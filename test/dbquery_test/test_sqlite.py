@@ -1,7 +1,18 @@
 # -*- coding: utf-8 -*-
+from array import array
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
+from threading import Thread
 from unittest import TestCase
 
+from dbquery import DBContextManagerError
+from dbquery import ManipulationCheckError
+from dbquery import PooledSQLiteDB
 from dbquery import SQLiteDB
+from dbquery import to_dict_formatter
+from dbquery.columnar import _INTEGER
+from dbquery.sqlite import PERFORMANCE_PRAGMAS
 
 
 class _CloseErrorConnection():
@@ -32,6 +43,60 @@ class SQLiteTest(TestCase):
         select = self.db.Select("SELECT * FROM test")
         self.assertEqual(select()[0][0], test_value)
 
+    def test_executemany(self):
+        """ Insert several rows at once and check the total row count.
+        """
+        self.db.Manipulation("CREATE TABLE test (test INTEGER)")()
+        insert = self.db.Manipulation("INSERT INTO test VALUES(?)", rowcount=3)
+        self.assertEqual(insert.executemany((i, ) for i in range(3)), 3)
+        select = self.db.Select("SELECT test FROM test ORDER BY test")
+        self.assertEqual(select(), [(0, ), (1, ), (2, )])
+
+    def test_executemany_rowcount_check(self):
+        """ A wrong total row count raises a ManipulationCheckError and rolls
+        back all executions.
+        """
+        self.db.Manipulation("CREATE TABLE test (test INTEGER)")()
+        insert = self.db.Manipulation("INSERT INTO test VALUES(?)", rowcount=1)
+        with self.assertRaises(ManipulationCheckError):
+            insert.executemany([(1, ), (2, )])
+        self.assertEqual(self.db.Select("SELECT * FROM test")(), [])
+
+    def test_executemany_error(self):
+        """ If one execution fails none of the rows are inserted.
+        """
+        self.db.Manipulation("CREATE TABLE test (test INTEGER UNIQUE)")()
+        insert = self.db.Manipulation("INSERT INTO test VALUES(:v)")
+        with self.assertRaises(Exception):
+            insert.executemany([{"v": 1}, {"v": 2}, {"v": 1}])
+        self.assertEqual(self.db.Select("SELECT * FROM test")(), [])
+
+    def test_select_columns(self):
+        """ Select a result column by column, fetching two rows at a time.
+        """
+        self.db.Manipulation("CREATE TABLE test (i INTEGER, t VARCHAR)")()
+        self.db.Manipulation("INSERT INTO test VALUES(?, ?)").executemany(
+            (i, str(i)) for i in range(5))
+        select = self.db.SelectColumns(
+            "SELECT i, t FROM test ORDER BY i", arraysize=2)
+        columns = select()
+        self.assertEqual(columns["i"], array(_INTEGER, range(5)))
+        self.assertEqual(columns["t"], ["0", "1", "2", "3", "4"])
+
+    def test_select_iterator_columnar(self):
+        """ Get the columns of each fetched block.
+        """
+        self.db.Manipulation("CREATE TABLE test (i INTEGER)")()
+        self.db.Manipulation("INSERT INTO test VALUES(?)").executemany(
+            (i, ) for i in range(5))
+        blocks = []
+        select = self.db.SelectIterator(
+            "SELECT i FROM test ORDER BY i", blocks.extend, arraysize=2,
+            columnar=True)
+        select()
+        self.assertEqual(
+            [list(b["i"]) for b in blocks], [[0, 1], [2, 3], [4]])
+
     def test_reopen(self):
         """ Try what happens if the connection is lost (do a close) and see
         that it is reopened again.
@@ -62,3 +127,305 @@ class SQLiteTest(TestCase):
         self.db._connection = (  # pylint: disable=protected-access
             _CloseErrorConnection())
         self.db.close()  # should not raise an error!
+
+
+class SQLiteTransactionTest(TestCase):
+    """ Test transactions, using a database file which is also opened by a
+    second SQLiteDB, to check what gets committed.
+    """
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        database = path.join(self.directory, "test.db")
+        self.db = SQLiteDB(database)
+        self.other_db = SQLiteDB(database)
+        self.db.Manipulation("CREATE TABLE test (test INTEGER)")()
+        self.insert = self.db.Manipulation("INSERT INTO test VALUES(?)")
+        self.select = self.other_db.Select("SELECT test FROM test")
+
+    def tearDown(self):
+        self.db.close()
+        self.other_db.close()
+        rmtree(self.directory)
+
+    def test_commit(self):
+        """ The rows are visible to other connections only after the commit.
+        """
+        with self.db:
+            self.insert(1)
+            with self.db:  # nested, no new transaction
+                self.insert(2)
+            self.assertEqual(self.select(), [])
+        self.assertEqual(self.select(), [(1, ), (2, )])
+
+    def test_rollback(self):
+        """ An exception rolls back the transaction.
+        """
+        with self.assertRaises(ValueError):
+            with self.db:
+                self.insert(1)
+                raise ValueError()
+        self.assertEqual(self.select(), [])
+
+    def test_abort(self):
+        with self.db as db:
+            self.insert(1)
+            db.abort_transaction()
+        self.assertEqual(self.select(), [])
+
+    def test_abort_without_transaction(self):
+        with self.assertRaises(DBContextManagerError):
+            self.db.abort_transaction()
+
+    def test_closed_commit(self):
+        """ Committing after the connection was closed raises an error.
+        """
+        with self.assertRaises(RuntimeError):
+            with self.db as db:
+                self.insert(1)
+                db.close()
+        self.assertEqual(self.select(), [])
+
+    def test_immediate(self):
+        """ An IMMEDIATE transaction locks the database for other writers
+        right away.
+        """
+        database = path.join(self.directory, "test.db")
+        db = SQLiteDB(database, isolation_level="IMMEDIATE")
+        other_db = SQLiteDB(database, timeout=0)
+        other_insert = other_db.Manipulation("INSERT INTO test VALUES(?)")
+        with db:
+            with self.assertRaises(other_db.OperationalError):
+                other_insert(1)  # database is locked
+        db.close()
+        other_db.close()
+
+    def test_isolation_level(self):
+        with self.assertRaises(ValueError):
+            SQLiteDB(":memory:", isolation_level="SERIALIZABLE")
+
+    def test_savepoint(self):
+        """ An exception in a savepoint only rolls back its own queries.
+        """
+        with self.db:
+            self.insert(1)
+            with self.assertRaises(ValueError):
+                with self.db.savepoint():
+                    self.insert(2)
+                    raise ValueError()
+            with self.db.savepoint():
+                self.insert(3)
+        self.assertEqual(self.select(), [(1, ), (3, )])
+
+    def test_savepoint_without_transaction(self):
+        with self.assertRaises(DBContextManagerError):
+            with self.db.savepoint():
+                pass
+
+    def test_executemany(self):
+        """ executemany joins a running transaction.
+        """
+        with self.assertRaises(ValueError):
+            with self.db:
+                self.insert.executemany([(1, ), (2, )])
+                raise ValueError()
+        self.assertEqual(self.select(), [])
+
+    def test_query_cursor(self):
+        """ A QueryCursor closes its cursor.
+        """
+        self.insert(1)
+        with self.db.QueryCursor("SELECT test FROM test")() as cursor:
+            self.assertEqual(cursor.fetchone(), (1, ))
+        with self.assertRaises(Exception):
+            cursor.fetchone()  # closed
+        with self.db.QueryCursor("SELECT test FROM test", 10)() as cursor:
+            self.assertEqual(cursor.fetchone(), (1, ))
+
+    def test_select_stream(self):
+        """ A SelectStream yields the formatted rows and closes its cursor
+        at the end.
+        """
+        self.insert.executemany((i, ) for i in range(5))
+        select = self.db.SelectStream(
+            "SELECT test FROM test WHERE test > ? ORDER BY test",
+            to_dict_formatter, arraysize=2)
+        rows = select(1)
+        self.assertEqual(list(rows), [{"test": i} for i in range(2, 5)])
+        self.assertTrue(rows.closed)
+        self.assertEqual(list(rows), [])
+
+    def test_select_stream_close(self):
+        self.insert.executemany((i, ) for i in range(5))
+        with self.db.SelectStream("SELECT test FROM test ORDER BY test")(
+                ) as rows:
+            self.assertEqual(next(rows), (0, ))
+        self.assertTrue(rows.closed)
+        with self.assertRaises(StopIteration):
+            next(rows)
+
+    def test_select_stream_itersize(self):
+        """ SQLite ignores itersize.
+        """
+        self.insert.executemany((i, ) for i in range(5))
+        select = self.db.SelectStream(
+            "SELECT test FROM test ORDER BY test", itersize=2)
+        self.assertEqual(list(select()), [(i, ) for i in range(5)])
+        with self.db:
+            self.assertEqual(len(list(select())), 5)
+
+
+class SQLitePragmaTest(TestCase):
+    """ Test applying pragmas to new connections.
+    """
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.db = SQLiteDB(
+            path.join(self.directory, "test.db"), pragmas=PERFORMANCE_PRAGMAS)
+
+    def tearDown(self):
+        self.db.close()
+        rmtree(self.directory)
+
+    def test_performance(self):
+        """ The performance profile is set, also after reconnecting.
+        """
+        journal_mode = self.db.SelectOne("PRAGMA journal_mode")
+        mmap_size = self.db.SelectOne("PRAGMA mmap_size")
+        self.assertEqual(journal_mode(), "wal")
+        self.db.close()
+        self.assertEqual(self.db.SelectOne("PRAGMA synchronous")(), 1)
+        self.assertIn(mmap_size(), (0, 268435456))  # 0: mmap not supported
+        self.assertEqual(self.db.SelectOne("PRAGMA busy_timeout")(), 5000)
+
+    def test_order(self):
+        """ page_size is set before switching to WAL.
+        """
+        db = SQLiteDB(
+            path.join(self.directory, "order.db"),
+            pragmas=[("journal_mode", "WAL"), ("page_size", 8192)])
+        self.assertEqual(db.SelectOne("PRAGMA page_size")(), 8192)
+        db.close()
+
+    def test_invalid(self):
+        """ Pragmas are put into the SQL, only names and numbers are allowed.
+        """
+        with self.assertRaises(ValueError):
+            SQLiteDB(":memory:", pragmas={"cache_size": "1; DROP TABLE x"})
+        with self.assertRaises(ValueError):
+            SQLiteDB(":memory:", pragmas={"cache size": 1})
+
+
+class PooledSQLiteTest(TestCase):
+    """ Test the PooledSQLiteDB class with a WAL database file.
+    """
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.db = PooledSQLiteDB(
+            path.join(self.directory, "test.db"), pragmas=PERFORMANCE_PRAGMAS,
+            readers=2, pool_timeout=10)
+        self.db.Manipulation("CREATE TABLE test (test INTEGER)")()
+        self.insert = self.db.Manipulation("INSERT INTO test VALUES(?)")
+        self.count = self.db.SelectOne("SELECT count(*) FROM test")
+
+    def tearDown(self):
+        self.db.close_all()
+        rmtree(self.directory)
+
+    def test_prefetch(self):
+        """ The reader connections can be used for prefetching.
+        """
+        self.insert.executemany((i, ) for i in range(10))
+        rows = []
+        select = self.db.SelectIterator(
+            "SELECT test FROM test ORDER BY test", rows.extend, arraysize=3,
+            prefetch=2)
+        select()
+        self.assertEqual(rows, [(i, ) for i in range(10)])
+
+    def test_threads(self):
+        """ Read and write from several threads at the same time.
+        """
+        counts = []
+
+        def _work(value):
+            for _ in range(10):
+                self.insert(value)
+                counts.append(self.count())
+
+        threads = [Thread(target=_work, args=(i, )) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.count(), 60)
+        self.assertEqual(len(counts), 60)
+        self.assertLessEqual(self.db.pool.size, 2)
+
+    def test_transaction(self):
+        """ Reads within a transaction see its changes, other threads do
+        not.
+        """
+        other_counts = []
+        other_count = Thread(target=lambda: other_counts.append(self.count()))
+        with self.db:
+            self.insert(1)
+            self.assertEqual(self.count(), 1)
+            other_count.start()
+            other_count.join()
+        self.assertEqual(other_counts, [0])
+        self.assertEqual(self.count(), 1)
+
+    def test_rollback(self):
+        with self.assertRaises(ValueError):
+            with self.db:
+                self.insert(1)
+                raise ValueError()
+        self.assertEqual(self.count(), 0)
+        self.insert(2)  # the writer is free again
+        self.assertEqual(self.count(), 1)
+
+    def test_query_cursor(self):
+        """ A QueryCursor keeps its reader until it gets closed.
+        """
+        self.insert(1)
+        with self.db.QueryCursor("SELECT test FROM test")() as cursor:
+            self.assertEqual(self.db.pool.idle, 0)
+            self.assertEqual(cursor.fetchone(), (1, ))
+        self.assertEqual(self.db.pool.idle, 1)
+        with self.db.QueryCursor("SELECT test FROM test", 10)() as cursor:
+            self.assertEqual(self.db.pool.idle, 0)
+            self.assertEqual(cursor.fetchone(), (1, ))
+        self.assertEqual(self.db.pool.idle, 1)
+
+    def test_select_stream(self):
+        """ A SelectStream keeps its reader until all rows are read, it gets
+        closed or garbage collected.
+        """
+        self.insert.executemany((i, ) for i in range(3))
+        select = self.db.SelectStream("SELECT test FROM test")
+        rows = select()
+        self.assertEqual(self.db.pool.idle, 0)
+        self.assertEqual(len(list(rows)), 3)
+        self.assertEqual(self.db.pool.idle, 1)
+        rows = select()
+        next(rows)
+        rows.close()
+        self.assertEqual(self.db.pool.idle, 1)
+        rows = select()
+        self.assertEqual(self.db.pool.idle, 0)
+        del rows
+        self.assertEqual(self.db.pool.idle, 1)
+        select = self.db.SelectStream("SELECT test FROM test", itersize=2)
+        rows = select()
+        self.assertEqual(self.db.pool.idle, 0)
+        self.assertEqual(len(list(rows)), 3)
+        self.assertEqual(self.db.pool.idle, 1)
+
+    def test_query_only(self):
+        """ Readers can not write.
+        """
+        with self.assertRaises(self.db.OperationalError):
+            self.db.Select("DELETE FROM test")()